@@ -0,0 +1 @@
+"""Model training and the audio features it shares with serving"""
@@ -0,0 +1,16 @@
+"""Audio features shared by model training (ml/train) and serving
+(services/audio-analysis), so both compute exactly the same inputs"""
+from .extract import extract, extract_batch, extract_files, load_clip, prepare
+from .spec import FEATURE_SPEC_VERSION, GENRE_SPEC, MOOD_SPEC, FeatureSpec
+
+__all__ = [
+    "FEATURE_SPEC_VERSION",
+    "FeatureSpec",
+    "GENRE_SPEC",
+    "MOOD_SPEC",
+    "extract",
+    "extract_batch",
+    "extract_files",
+    "load_clip",
+    "prepare",
+]
@@ -0,0 +1,188 @@
+from collections import defaultdict
+from functools import cached_property, lru_cache
+from typing import Callable, Dict, List, Sequence
+
+import librosa
+import numpy as np
+
+from .spec import FeatureSpec
+
+
+@lru_cache(maxsize=16)
+def mel_basis(sr: int, n_fft: int, n_mels: int, fmax) -> np.ndarray:
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmax=fmax)
+
+
+def power_to_db(S: np.ndarray, ref_max: bool = False, amin: float = 1e-10, top_db: float = 80.0) -> np.ndarray:
+    """librosa.power_to_db per clip of a (..., bins, frames) batch: the
+    reference (with ``ref_max``) and the top_db floor are each clip's own"""
+    log_spec = 10.0 * np.log10(np.maximum(amin, S))
+    if ref_max:
+        log_spec -= 10.0 * np.log10(np.maximum(amin, S.max(axis=(-2, -1), keepdims=True)))
+    return np.maximum(log_spec, log_spec.max(axis=(-2, -1), keepdims=True) - top_db)
+
+
+class Spectra:
+    """Analysis of a batch of equal-length clips, computed on first use.
+
+    One STFT serves every block: magnitudes for the spectral shape
+    features, power through cached mel filter banks for the mel blocks,
+    and the full-band log mel for onsets, tempo and MFCCs.
+    """
+
+    def __init__(self, clips: np.ndarray, sr: int, spec: FeatureSpec):
+        self.clips = clips
+        self.sr = sr
+        self.spec = spec
+
+    @cached_property
+    def magnitude(self) -> np.ndarray:
+        return np.abs(librosa.stft(self.clips, n_fft=self.spec.n_fft, hop_length=self.spec.hop_length))
+
+    @cached_property
+    def power(self) -> np.ndarray:
+        return self.magnitude ** 2
+
+    def _mel(self, n_mels: int, fmax) -> np.ndarray:
+        basis = mel_basis(self.sr, self.spec.n_fft, n_mels, fmax)
+        return np.einsum("...ft,mf->...mt", self.power, basis, optimize=True)
+
+    @cached_property
+    def mel_db(self) -> np.ndarray:
+        """Mel spectrogram in dB relative to each clip's peak"""
+        return power_to_db(self._mel(self.spec.n_mels, self.spec.fmax), ref_max=True)
+
+    @cached_property
+    def full_mel_db(self) -> np.ndarray:
+        """librosa's default 128 band, full range log mel, as onset_strength
+        and mfcc compute it from a signal"""
+        return power_to_db(self._mel(128, None))
+
+    @cached_property
+    def onset_env(self) -> List[np.ndarray]:
+        return [
+            librosa.onset.onset_strength(S=S, sr=self.sr, hop_length=self.spec.hop_length)
+            for S in self.full_mel_db
+        ]
+
+
+def _mel_db(spectra: Spectra, i: int) -> np.ndarray:
+    return spectra.mel_db[i].flatten()
+
+
+def _chroma(spectra: Spectra, i: int) -> np.ndarray:
+    # Tuning is estimated per clip, so the CQT isn't batched
+    return librosa.feature.chroma_cqt(y=spectra.clips[i], sr=spectra.sr, hop_length=spectra.spec.hop_length).flatten()
+
+
+def _centroid(spectra: Spectra, i: int) -> np.ndarray:
+    return librosa.feature.spectral_centroid(S=spectra.magnitude[i], sr=spectra.sr, n_fft=spectra.spec.n_fft)[0]
+
+
+def _rolloff(spectra: Spectra, i: int) -> np.ndarray:
+    return librosa.feature.spectral_rolloff(S=spectra.magnitude[i], sr=spectra.sr, n_fft=spectra.spec.n_fft)[0]
+
+
+def _tempo(spectra: Spectra, i: int) -> np.ndarray:
+    # beat_track's own envelope aggregates bands by median rather than mean
+    onset_env = librosa.onset.onset_strength(
+        S=spectra.full_mel_db[i], sr=spectra.sr, hop_length=spectra.spec.hop_length, aggregate=np.median
+    )
+    tempo, _ = librosa.beat.beat_track(
+        onset_envelope=onset_env, sr=spectra.sr, hop_length=spectra.spec.hop_length
+    )
+    return np.atleast_1d(tempo)
+
+
+def _onset(spectra: Spectra, i: int) -> np.ndarray:
+    return spectra.onset_env[i]
+
+
+def _contrast(spectra: Spectra, i: int) -> np.ndarray:
+    return librosa.feature.spectral_contrast(S=spectra.magnitude[i], sr=spectra.sr, n_fft=spectra.spec.n_fft).flatten()
+
+
+def _mfcc(spectra: Spectra, i: int) -> np.ndarray:
+    return librosa.feature.mfcc(S=spectra.full_mel_db[i], n_mfcc=spectra.spec.n_mfcc).flatten()
+
+
+BLOCKS: Dict[str, Callable[[Spectra, int], np.ndarray]] = {
+    "mel_db": _mel_db,
+    "chroma": _chroma,
+    "centroid": _centroid,
+    "rolloff": _rolloff,
+    "tempo": _tempo,
+    "onset": _onset,
+    "contrast": _contrast,
+    "mfcc": _mfcc,
+}
+
+
+def _vectors(spectra: Spectra) -> np.ndarray:
+    out = np.zeros((len(spectra.clips), spectra.spec.dim), dtype=np.float32)
+    for i in range(len(spectra.clips)):
+        offset = 0
+        for name, length in spectra.spec.blocks:
+            values = BLOCKS[name](spectra, i)[:length]
+            out[i, offset:offset + len(values)] = values
+            offset += length
+    return out
+
+
+def prepare(y: np.ndarray, sr: int, spec: FeatureSpec) -> np.ndarray:
+    """Resample to the spec's rate and keep its leading ``duration`` seconds"""
+    if sr != spec.sample_rate:
+        y = librosa.resample(y, orig_sr=sr, target_sr=spec.sample_rate)
+    return y[:int(spec.duration * spec.sample_rate)]
+
+
+def extract_batch(clips: Sequence[np.ndarray], sr: int, spec: FeatureSpec) -> np.ndarray:
+    """Feature vectors of many clips as a (clips, spec.dim) float32 array.
+
+    Clips of equal length (the norm for duration-capped training audio)
+    share one batched STFT and mel projection.
+    """
+    clips = [prepare(y, sr, spec) for y in clips]
+    out = np.empty((len(clips), spec.dim), dtype=np.float32)
+    by_length = defaultdict(list)
+    for i, y in enumerate(clips):
+        by_length[len(y)].append(i)
+    for indices in by_length.values():
+        batch = np.stack([clips[i] for i in indices])
+        out[indices] = _vectors(Spectra(batch, spec.sample_rate, spec))
+    return out
+
+
+def extract(y: np.ndarray, sr: int, spec: FeatureSpec) -> np.ndarray:
+    """Feature vector of one clip"""
+    return extract_batch([y], sr, spec)[0]
+
+
+def load_clip(path: str, spec: FeatureSpec) -> np.ndarray:
+    y, _ = librosa.load(path, sr=spec.sample_rate, duration=spec.duration)
+    return y
+
+
+def extract_files(paths: Sequence[str], spec: FeatureSpec) -> List:
+    """Feature vectors of audio files, batched; a file that fails to load
+    yields its exception instead"""
+    clips, loaded, results = [], [], [None] * len(paths)
+    for i, path in enumerate(paths):
+        try:
+            clips.append(load_clip(path, spec))
+            loaded.append(i)
+        except Exception as e:
+            results[i] = e
+    if not clips:
+        return results
+    try:
+        for i, features in zip(loaded, extract_batch(clips, spec.sample_rate, spec)):
+            results[i] = features
+    except Exception:
+        # Find the clip(s) at fault
+        for i, y in zip(loaded, clips):
+            try:
+                results[i] = extract(y, spec.sample_rate, spec)
+            except Exception as e:
+                results[i] = e
+    return results
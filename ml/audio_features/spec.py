@@ -0,0 +1,74 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, Optional, Tuple
+
+# Bump when any block's computation changes; stored features and trained
+# models are only valid for the version they were built with
+FEATURE_SPEC_VERSION = 1
+
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    """Layout of a model's input vector: blocks of fixed length, in order.
+
+    Blocks come from one analysis of the clip, see extract. Shorter blocks
+    (clips under ``duration``) are zero padded, so every vector has ``dim``
+    values.
+    """
+    name: str
+    blocks: Tuple[Tuple[str, int], ...]
+    sample_rate: int = 22050
+    duration: float = 30.0
+    n_fft: int = 2048
+    hop_length: int = 512
+    n_mels: int = 128
+    fmax: Optional[float] = 8000
+    n_mfcc: int = 13
+    version: int = FEATURE_SPEC_VERSION
+
+    @property
+    def dim(self) -> int:
+        return sum(length for _, length in self.blocks)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FeatureSpec":
+        data = dict(data)
+        data["blocks"] = tuple(tuple(block) for block in data["blocks"])
+        return cls(**data)
+
+    def key(self) -> str:
+        """Stable hash of everything the features depend on"""
+        raw = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    def with_config(self, feature_config: Dict) -> "FeatureSpec":
+        """This spec with the analysis parameters of a trainer config's
+        "features" section"""
+        fields = ("sample_rate", "duration", "n_fft", "hop_length", "n_mels", "fmax", "n_mfcc")
+        return replace(self, **{k: feature_config[k] for k in fields if k in feature_config})
+
+
+GENRE_SPEC = FeatureSpec(
+    name="genre",
+    blocks=(
+        ("mel_db", 1024),
+        ("chroma", 128),
+        ("centroid", 128),
+        ("rolloff", 128),
+        ("tempo", 1),
+        ("onset", 128),
+    ),
+)
+
+MOOD_SPEC = FeatureSpec(
+    name="mood",
+    blocks=(
+        ("mel_db", 1024),
+        ("contrast", 128),
+        ("mfcc", 128),
+    ),
+)
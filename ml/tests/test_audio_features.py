@@ -0,0 +1,133 @@
+"""Golden outputs of the shared audio features.
+
+Training (ml/train) and serving (services/audio-analysis) must compute the
+same vector for the same spec. These tests pin the vectors of a synthesized
+clip; after an intended change to a block, bump FEATURE_SPEC_VERSION and
+regenerate them with
+
+    python ml/tests/test_audio_features.py --regenerate
+"""
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+soundfile = pytest.importorskip("soundfile")
+
+ML_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ML_DIR.parent))
+
+from ml.audio_features import GENRE_SPEC, MOOD_SPEC, extract, extract_batch, extract_files  # noqa: E402
+
+GOLDEN_PATH = Path(__file__).parent / "golden" / "audio_features.npz"
+ML_MODELS_PATH = ML_DIR.parent / "services" / "audio-analysis" / "app" / "ml_models.py"
+SPECS = {"genre": GENRE_SPEC, "mood": MOOD_SPEC}
+
+
+def synth_clip(sr: int = 22050, seconds: float = 6.0) -> np.ndarray:
+    """Deterministic test signal: a chord, decaying noise bursts at 120 BPM
+    (for the onset and tempo blocks) and a little background noise"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sr * seconds)) / sr
+    y = sum(a * np.sin(2 * np.pi * f * t) for f, a in ((110, 0.3), (220, 0.2), (440, 0.1), (1320, 0.05)))
+    burst = np.exp(-np.arange(2048) / 200) * rng.standard_normal(2048)
+    for start in (np.arange(0, seconds, 0.5) * sr).astype(int):
+        end = min(start + len(burst), len(y))
+        y[start:end] += 0.5 * burst[:end - start]
+    y += 0.01 * rng.standard_normal(len(y))
+    return (0.8 * y / np.abs(y).max()).astype(np.float32)
+
+
+def golden_vectors() -> dict:
+    clip = synth_clip()
+    vectors = {}
+    for name, spec in SPECS.items():
+        vectors[name] = extract(clip, 22050, spec)
+        vectors[f"{name}_key"] = np.array(spec.key())
+    return vectors
+
+
+@pytest.fixture(scope="module")
+def golden():
+    with np.load(GOLDEN_PATH) as data:
+        return dict(data)
+
+
+@pytest.fixture(scope="module")
+def ml_models():
+    pytest.importorskip("tensorflow")
+    spec = importlib.util.spec_from_file_location("ml_models", ML_MODELS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RecordingModel:
+    """Stands in for a Keras model, keeping the features it was given"""
+
+    def predict(self, features):
+        self.features = features
+        return np.zeros((len(features), 8), dtype=np.float32)
+
+
+@pytest.mark.parametrize("name", SPECS)
+def test_spec_unchanged(golden, name):
+    assert str(golden[f"{name}_key"]) == SPECS[name].key(), (
+        "Feature spec changed; regenerate the golden vectors"
+    )
+
+
+@pytest.mark.parametrize("name", SPECS)
+def test_golden_vectors(golden, name):
+    features = extract(synth_clip(), 22050, SPECS[name])
+    assert features.shape == (SPECS[name].dim,)
+    np.testing.assert_allclose(features, golden[name], rtol=1e-4, atol=1e-3)
+
+
+@pytest.mark.parametrize("name", SPECS)
+def test_batch_matches_single(name):
+    # The feature store extracts in batches, serving usually one clip at a time
+    clip = synth_clip()
+    clips = [clip, 0.5 * clip, clip[:22050 * 4]]
+    batch = extract_batch(clips, 22050, SPECS[name])
+    for features, y in zip(batch, clips):
+        np.testing.assert_array_equal(features, extract(y, 22050, SPECS[name]))
+
+
+def test_training_matches_serving(tmp_path, golden, ml_models):
+    path = tmp_path / "clip.wav"
+    soundfile.write(path, synth_clip(), 22050, subtype="FLOAT")
+    # Training reads files through the feature store's extractor...
+    trained = {name: extract_files([str(path)], spec)[0] for name, spec in SPECS.items()}
+
+    # ...serving decodes the upload and runs the classifiers on it
+    y, sr = librosa.load(path, sr=22050, mono=True)
+    genre = ml_models.GenreClassifier.__new__(ml_models.GenreClassifier)
+    genre.spec, genre.model = GENRE_SPEC, RecordingModel()
+    genre.genres = [str(i) for i in range(8)]
+    genre.predict(y, sr)
+    mood = ml_models.MoodClassifier.__new__(ml_models.MoodClassifier)
+    mood.spec, mood.model = MOOD_SPEC, RecordingModel()
+    mood.predict(y, sr)
+
+    np.testing.assert_array_equal(genre.model.features[0], trained["genre"])
+    np.testing.assert_array_equal(mood.model.features[0], trained["mood"])
+    np.testing.assert_allclose(trained["genre"], golden["genre"], rtol=1e-4, atol=1e-3)
+
+
+def test_serving_reads_trained_spec(tmp_path, ml_models):
+    spec = GENRE_SPEC.with_config({"n_fft": 1024, "duration": 10.0})
+    metadata = tmp_path / "genre_classes.json"
+    metadata.write_text(json.dumps({"classes": [], "feature_spec": spec.to_dict()}))
+    assert ml_models.load_feature_spec(metadata, GENRE_SPEC) == spec
+    assert ml_models.load_feature_spec(tmp_path / "missing.json", GENRE_SPEC) == GENRE_SPEC
+
+
+if __name__ == "__main__" and "--regenerate" in sys.argv:
+    GOLDEN_PATH.parent.mkdir(exist_ok=True)
+    np.savez(GOLDEN_PATH, **golden_vectors())
+    print(f"Wrote {GOLDEN_PATH}")
@@ -0,0 +1,2 @@
+"""Trainers for the genre and mood models; run them as modules from the
+repository root, e.g. python -m ml.train.train_models"""
@@ -4,11 +4,28 @@ import tensorflow as tf
 import numpy as np
 from pathlib import Path
 import json
+import math
+import random
+import tempfile
 import yaml
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
 from typing import Dict, Any, Optional
 import logging
 from datetime import datetime
 
+from .folds import class_labels, fold_assignments
+from .parallel import (
+    ASHA,
+    InlineExecutor,
+    checkpoint_callback,
+    fit_job,
+    grid_trials,
+    sample_trial,
+    share_array,
+    split_params,
+    worker_pool,
+)
+
 logger = logging.getLogger(__name__)
 
 class ExperimentManager:
@@ -16,7 +33,8 @@ class ExperimentManager:
         self,
         experiment_name: str,
         config_path: str,
-        tracking_uri: Optional[str] = None
+        tracking_uri: Optional[str] = None,
+        workers: Optional[int] = None
     ):
         self.experiment_name = experiment_name
         
@@ -24,6 +42,12 @@ class ExperimentManager:
         with open(config_path) as f:
             self.config = yaml.safe_load(f)
         
+        # Folds and trials run in this many worker processes, each pinned to
+        # its own share of the CPUs
+        parallel_config = self.config.get("parallel", {})
+        self.workers = workers or parallel_config.get("workers", 1)
+        self.pin_cpus = parallel_config.get("pin_cpus", True)
+        
         # Set up MLflow
         if tracking_uri:
             mlflow.set_tracking_uri(tracking_uri)
@@ -60,13 +84,7 @@ class ExperimentManager:
         mode: str = "min"
     ) -> tf.keras.callbacks.ModelCheckpoint:
         """Create checkpoint callback"""
-        return tf.keras.callbacks.ModelCheckpoint(
-            filepath=str(Path(model_dir) / "model-{epoch:02d}-{val_loss:.2f}.h5"),
-            monitor=monitor,
-            mode=mode,
-            save_best_only=True,
-            save_weights_only=False
-        )
+        return checkpoint_callback(model_dir, monitor, mode)
 
     def create_mlflow_callback(self) -> tf.keras.callbacks.Callback:
         """Create MLflow callback for logging during training"""
@@ -77,60 +95,90 @@ class ExperimentManager:
 
         return MLflowCallback()
 
+    def log_history(self, history: Dict[str, list], initial_epoch: int = 0):
+        """Log a worker's per-epoch metrics, as MLflowCallback would have"""
+        for i, logs in enumerate(zip(*history.values())):
+            self.log_metrics(dict(zip(history, logs)), step=initial_epoch + i)
+
+    def _executor(self):
+        if self.workers > 1:
+            return worker_pool(self.workers, self.pin_cpus)
+        return InlineExecutor()
+
+    def _share(self, data: tuple, directory: str, name: str) -> tuple:
+        """Arrays as workers should receive them: by file when they run in
+        other processes, as they are otherwise"""
+        if self.workers == 1:
+            return tuple(data)
+        return tuple(share_array(array, directory, f"{name}_{i}") for i, array in enumerate(data))
+
     def train_with_crossval(
         self,
         model_fn,
         train_data: tuple,
         n_folds: int = 5,
+        shuffle: Optional[bool] = None,
+        stratify: Optional[bool] = None,
+        seed: Optional[int] = None,
         **train_kwargs
     ):
-        """Train with cross-validation"""
+        """Train with cross-validation, folds running in parallel across
+        the workers. With more than one worker, model_fn and train_kwargs
+        must be picklable (a module level function, not a lambda).
+        
+        shuffle and stratify default to the cross_validation config; folds
+        are stratified by class when y holds class labels. Each fold reads
+        its batches through index arrays, so X (best memory-mapped) is
+        never copied per fold.
+        """
         X, y = train_data
-        fold_size = len(X) // n_folds
+        cv_config = self.config.get("cross_validation", {})
+        if shuffle is None:
+            shuffle = cv_config.get("shuffle", False)
+        labels = class_labels(y)
+        if stratify and labels is None:
+            raise ValueError("Stratified folds need class labels")
+        if stratify is None:
+            stratify = cv_config.get("stratify", False) and labels is not None
+        folds = fold_assignments(len(X), n_folds, shuffle, labels if stratify else None, seed)
         
-        fold_metrics = []
+        fold_metrics = [None] * n_folds
         
-        with mlflow.start_run():
+        with mlflow.start_run(), tempfile.TemporaryDirectory() as tmp, self._executor() as pool:
             self.log_hyperparameters(train_kwargs)
+            mlflow.log_params({"n_folds": n_folds, "shuffle": shuffle, "stratify": stratify, "seed": seed})
+            data = self._share(train_data, tmp, "train")
+            shared_folds = self._share((folds,), tmp, "folds")[0]
             
+            futures = {}
             for fold in range(n_folds):
-                logger.info(f"Training fold {fold + 1}/{n_folds}")
-                
-                # Create fold indices
-                val_start = fold * fold_size
-                val_end = (fold + 1) * fold_size
-                
-                train_idx = list(range(0, val_start)) + list(range(val_end, len(X)))
-                val_idx = list(range(val_start, val_end))
-                
-                # Split data
-                X_train = X[train_idx]
-                y_train = y[train_idx]
-                X_val = X[val_idx]
-                y_val = y[val_idx]
-                
-                # Create and train model
-                model = model_fn()
-                history = model.fit(
-                    X_train, y_train,
-                    validation_data=(X_val, y_val),
-                    callbacks=[
-                        self.create_mlflow_callback(),
-                        self.create_checkpoint_callback(f"models/fold_{fold}")
-                    ],
-                    **train_kwargs
-                )
+                job = {
+                    "model_fn": model_fn,
+                    "model_kwargs": {},
+                    "fit_kwargs": train_kwargs,
+                    "data": data,
+                    "folds": shared_folds,
+                    "fold": fold,
+                    "checkpoint_dir": f"models/fold_{fold}"
+                }
+                futures[pool.submit(fit_job, job)] = fold
+            
+            for future in as_completed(futures):
+                fold = futures[future]
+                history = future.result()
+                logger.info(f"Fold {fold + 1}/{n_folds} done")
+                self.log_history(history)
                 
                 # Store fold metrics
-                fold_metrics.append({
-                    "val_loss": min(history.history["val_loss"]),
-                    "val_accuracy": max(history.history["val_accuracy"])
-                })
+                fold_metrics[fold] = {
+                    "val_loss": min(history["val_loss"]),
+                    "val_accuracy": max(history["val_accuracy"])
+                }
                 
                 # Log fold metrics
                 mlflow.log_metrics({
-                    f"fold_{fold}_val_loss": fold_metrics[-1]["val_loss"],
-                    f"fold_{fold}_val_accuracy": fold_metrics[-1]["val_accuracy"]
+                    f"fold_{fold}_val_loss": fold_metrics[fold]["val_loss"],
+                    f"fold_{fold}_val_accuracy": fold_metrics[fold]["val_accuracy"]
                 })
             
             # Log average metrics
@@ -210,49 +258,119 @@ class ExperimentManager:
         model_fn,
         train_data: tuple,
         param_grid: Dict[str, list],
+        strategy: str = "grid",
+        n_trials: Optional[int] = None,
+        early_stopping: bool = False,
+        min_epochs: int = 1,
+        max_epochs: Optional[int] = None,
+        eta: int = 3,
+        seed: Optional[int] = None,
         **train_kwargs
     ):
-        """Perform grid search for hyperparameters"""
-        from itertools import product
+        """Search hyperparameters, trials running in parallel across the
+        workers, one MLflow run each.
+        
+        strategy "grid" tries every combination of param_grid (the first
+        n_trials of them if given); "random" samples n_trials points, taking
+        a random element of each list or calling a callable with a
+        random.Random. Parameters model_fn accepts are passed to it, the rest
+        to model.fit.
+        
+        early_stopping schedules the trials with asynchronous successive
+        halving: each trains min_epochs, and only the best 1/eta of those
+        finished at a budget continue to eta times as many epochs, up to
+        max_epochs (default train_kwargs["epochs"]).
+        """
+        if strategy == "grid":
+            trials = grid_trials(param_grid)
+            total = math.prod(len(values) for values in param_grid.values())
+            n_trials = min(n_trials, total) if n_trials else total
+        elif strategy == "random":
+            if not n_trials:
+                raise ValueError("Random search needs n_trials")
+            rng = random.Random(seed)
+            trials = (sample_trial(param_grid, rng) for _ in range(n_trials))
+        else:
+            raise ValueError(f"Unknown search strategy: {strategy}")
+        
+        if early_stopping:
+            if "epochs" in param_grid:
+                raise ValueError("epochs is set by early stopping, not searched")
+            max_epochs = max_epochs or train_kwargs.get("epochs", 1)
+            scheduler = ASHA(n_trials, min_epochs, max_epochs, eta)
+        else:
+            scheduler = ASHA(n_trials, 1, 1)  # a single rung: every trial runs once
         
-        # Generate parameter combinations
-        param_names = list(param_grid.keys())
-        param_values = list(product(*param_grid.values()))
+        fit_kwargs = dict(train_kwargs)
+        validation_data = fit_kwargs.pop("validation_data", None)
         
+        trial_params = {}
+        run_ids = {}
+        # (rung, val_loss) of the best trial: a deeper rung trained longer
         best_params = None
-        best_val_loss = float('inf')
+        best_key = (-1, float('inf'))
         
-        for values in param_values:
-            params = dict(zip(param_names, values))
-            logger.info(f"Training with parameters: {params}")
+        with tempfile.TemporaryDirectory() as tmp, self._executor() as pool:
+            data = self._share(train_data, tmp, "train")
+            validation = self._share(validation_data, tmp, "val") if validation_data is not None else None
             
-            # Update training kwargs
-            current_kwargs = {**train_kwargs, **params}
-            
-            # Train and evaluate
-            with mlflow.start_run():
-                self.log_hyperparameters(params)
-                
-                model = model_fn()
-                history = model.fit(
-                    *train_data,
-                    callbacks=[self.create_mlflow_callback()],
-                    **current_kwargs
-                )
-                
-                val_loss = min(history.history["val_loss"])
+            in_flight = {}
+            while True:
+                # Keep every worker busy; promotions are decided as results come in
+                while len(in_flight) < self.workers:
+                    next_job = scheduler.next_job()
+                    if next_job is None:
+                        break
+                    trial, rung = next_job
+                    if rung == 0:
+                        trial_params[trial] = next(trials)
+                    params = trial_params[trial]
+                    logger.info(f"Training trial {trial} (rung {rung}) with parameters: {params}")
+                    
+                    model_kwargs, param_fit_kwargs = split_params(model_fn, params)
+                    job = {
+                        "model_fn": model_fn,
+                        "model_kwargs": model_kwargs,
+                        "fit_kwargs": {**fit_kwargs, **param_fit_kwargs},
+                        "data": data,
+                        "validation": validation
+                    }
+                    if early_stopping:
+                        job.update({
+                            "initial_epoch": scheduler.rung_epochs[rung - 1] if rung else 0,
+                            "epochs": scheduler.rung_epochs[rung],
+                            "resume_from": str(Path(tmp) / f"trial_{trial}.h5") if rung else None,
+                            "save_to": str(Path(tmp) / f"trial_{trial}.h5")
+                        })
+                    in_flight[pool.submit(fit_job, job)] = (trial, rung, job.get("initial_epoch", 0))
                 
-                if val_loss < best_val_loss:
-                    best_val_loss = val_loss
-                    best_params = params
+                if not in_flight:
+                    break
                 
-                # Log metrics
-                mlflow.log_metrics({
-                    "val_loss": val_loss,
-                    "best_val_loss": best_val_loss
-                })
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    trial, rung, initial_epoch = in_flight.pop(future)
+                    history = future.result()
+                    val_loss = min(history["val_loss"])
+                    scheduler.report(trial, rung, val_loss)
+                    
+                    if (rung, -val_loss) > (best_key[0], -best_key[1]):
+                        best_key = (rung, val_loss)
+                        best_params = trial_params[trial]
+                    
+                    # Log the trial, continuing its run on later rungs
+                    with mlflow.start_run(run_id=run_ids.get(trial)) as run:
+                        if trial not in run_ids:
+                            run_ids[trial] = run.info.run_id
+                            self.log_hyperparameters(trial_params[trial])
+                        mlflow.set_tag("rung", rung)
+                        self.log_history(history, initial_epoch)
+                        mlflow.log_metrics({
+                            "val_loss": val_loss,
+                            "best_val_loss": best_key[1]
+                        })
         
-        return best_params, best_val_loss
+        return best_params, best_key[1]
 
     def evaluate_model(
         self,
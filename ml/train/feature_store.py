@@ -0,0 +1,205 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..audio_features import FeatureSpec, extract_files
+
+logger = logging.getLogger(__name__)
+
+# Rewrite the shards once superseded rows outnumber live ones
+COMPACT_RATIO = 1.0
+# Rows per shard written during extraction, and per copy when compacting
+SHARD_ROWS = 4096
+# Files each worker task extracts as one batch
+FILES_PER_TASK = 8
+# Tasks queued per worker, so finished results don't pile up in memory
+QUEUED_PER_WORKER = 2
+LOG_EVERY = 100
+
+
+def fingerprint(path: Path) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _extract(paths: List[str], spec: FeatureSpec) -> List:
+    return extract_files(paths, spec)
+
+
+class FeatureStore:
+    """On-disk cache of extracted feature vectors.
+
+    Rows live in append-only float32 .npy shards, memory-mapped on read;
+    index.json maps each audio path to its shard and row together with the
+    file's mtime and size. Each feature spec gets its own directory, so only
+    new or modified files are extracted again, in batches across a process
+    pool. Neither extraction nor reading holds more than a shard's worth of
+    rows in memory, so the dataset is bounded by disk.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        spec: FeatureSpec,
+        workers: Optional[int] = None
+    ):
+        self.spec = spec
+        self.dim = spec.dim
+        self.workers = workers or os.cpu_count() or 1
+        self.directory = Path(root) / f"{spec.name}-{spec.key()}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / "index.json"
+
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                index = json.load(f)
+        else:
+            index = {"spec": spec.to_dict(), "shards": [], "entries": {}}
+        self.shards: List[str] = index["shards"]
+        # path -> [mtime_ns, size, shard, row]
+        self.entries: Dict[str, list] = index["entries"]
+        self._mmaps: Dict[str, np.ndarray] = {}
+
+    def _is_current(self, path: Path) -> bool:
+        entry = self.entries.get(str(path))
+        return entry is not None and tuple(entry[:2]) == fingerprint(path)
+
+    def _has(self, path: Path) -> bool:
+        try:
+            return self._is_current(path)
+        except OSError:
+            return False
+
+    def update(self, paths: Sequence[Path]):
+        """Extract features of files not in the store or changed since"""
+        stale = []
+        for path in dict.fromkeys(paths):
+            try:
+                if not self._is_current(path):
+                    stale.append(path)
+            except OSError as e:
+                logger.warning(f"Error processing {path}: {e}")
+        logger.info(f"{len(paths) - len(stale)} feature vectors cached, extracting {len(stale)}")
+        if not stale:
+            return
+
+        rows, done = [], []
+        tasks = (stale[i:i + FILES_PER_TASK] for i in range(0, len(stale), FILES_PER_TASK))
+        in_flight = {}
+        completed = 0
+        # Spawned rather than forked: the parent may already run TensorFlow threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            while True:
+                while len(in_flight) < self.workers * QUEUED_PER_WORKER:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    in_flight[pool.submit(_extract, [str(path) for path in task], self.spec)] = task
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = in_flight.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        results = [e] * len(task)
+                    for path, features in zip(task, results):
+                        if isinstance(features, Exception):
+                            logger.warning(f"Error processing {path}: {features}")
+                            continue
+                        rows.append(features)
+                        done.append(path)
+                    completed += len(task)
+                    if completed // LOG_EVERY != (completed - len(task)) // LOG_EVERY:
+                        logger.info(f"Extracted {completed}/{len(stale)} files")
+                    # Written as it goes, so an interrupted run resumes where it stopped
+                    if len(rows) >= SHARD_ROWS:
+                        self._append(done, np.stack(rows))
+                        rows, done = [], []
+
+        if rows:
+            self._append(done, np.stack(rows))
+
+    def _next_shard(self) -> str:
+        last = max((int(name[len("shard-"):-len(".npy")]) for name in self.shards), default=-1)
+        return f"shard-{last + 1:05d}.npy"
+
+    def _append(self, paths: List[Path], rows: np.ndarray):
+        shard = self._next_shard()
+        np.save(self.directory / shard, rows)
+        self.shards.append(shard)
+        for row, path in enumerate(paths):
+            self.entries[str(path)] = [*fingerprint(path), shard, row]
+
+        live = len(self.entries)
+        stored = sum(len(self._shard(name)) for name in self.shards)
+        if stored - live > COMPACT_RATIO * live:
+            self._compact()
+        self._save_index()
+
+    def _compact(self):
+        """Copy live rows into a single shard and drop the old ones"""
+        paths = list(self.entries)
+        locations = self._locations(paths)
+        shard = self._next_shard()
+        out = np.lib.format.open_memmap(
+            self.directory / shard, mode="w+", dtype=np.float32, shape=(len(paths), self.dim)
+        )
+        for start in range(0, len(paths), SHARD_ROWS):
+            out[start:start + SHARD_ROWS] = self.read(locations[start:start + SHARD_ROWS])
+        out.flush()
+        del out
+
+        old, self.shards = self.shards, [shard]
+        for row, path in enumerate(paths):
+            self.entries[path][2:] = [shard, row]
+        self._mmaps.clear()
+        self._save_index()
+        for name in old:
+            os.unlink(self.directory / name)
+
+    def _save_index(self):
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"spec": self.spec.to_dict(), "shards": self.shards, "entries": self.entries}, f)
+        os.replace(tmp, self.index_path)
+
+    def _shard(self, name: str) -> np.ndarray:
+        if name not in self._mmaps:
+            self._mmaps[name] = np.load(self.directory / name, mmap_mode="r")
+        return self._mmaps[name]
+
+    def _locations(self, paths: Sequence) -> np.ndarray:
+        shard_ids = {name: i for i, name in enumerate(self.shards)}
+        locations = np.empty((len(paths), 2), dtype=np.int64)
+        for i, path in enumerate(paths):
+            _, _, shard, row = self.entries[str(path)]
+            locations[i] = shard_ids[shard], row
+        return locations
+
+    def locate(self, paths: Sequence[Path]) -> Tuple[np.ndarray, np.ndarray]:
+        """Mask of ``paths`` with current features, and their (shard, row)
+        locations for ``read``, in order"""
+        found = np.array([self._has(path) for path in paths], dtype=bool)
+        locations = self._locations([path for path, ok in zip(paths, found) if ok])
+        # Open every shard here rather than from the input pipeline's threads
+        for name in self.shards:
+            self._shard(name)
+        return found, locations
+
+    def read(self, locations: np.ndarray) -> np.ndarray:
+        """Feature rows at ``locations``, copying only those rows"""
+        out = np.empty((len(locations), self.dim), dtype=np.float32)
+        for shard_id in np.unique(locations[:, 0]):
+            mask = locations[:, 0] == shard_id
+            out[mask] = self._shard(self.shards[shard_id])[locations[mask, 1]]
+        return out
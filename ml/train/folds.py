@@ -0,0 +1,63 @@
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def class_labels(y: np.ndarray) -> Optional[np.ndarray]:
+    """Class of each sample from integer, string or one-hot targets; None
+    for regression targets"""
+    y = np.asarray(y)
+    if y.ndim == 2 and y.shape[1] > 1 and np.isin(y, (0, 1)).all():
+        return y.argmax(axis=1)
+    if y.ndim == 1 and not np.issubdtype(y.dtype, np.floating):
+        return y
+    return None
+
+
+def fold_assignments(
+    n_samples: int,
+    n_folds: int,
+    shuffle: bool = False,
+    labels: Optional[np.ndarray] = None,
+    seed: Optional[int] = None
+) -> np.ndarray:
+    """Validation fold of each sample, as an int32 array.
+
+    Fold sizes differ by at most one: the n_samples % n_folds remainder
+    goes to the first folds, so every sample is validated exactly once.
+    Without labels, folds are contiguous blocks (in shuffled order with
+    ``shuffle``). With labels, each class is dealt round robin across the
+    folds, so each fold holds every class in proportion.
+    """
+    if not 2 <= n_folds <= n_samples:
+        raise ValueError(f"Cannot split {n_samples} samples into {n_folds} folds")
+    rng = np.random.default_rng(seed)
+    folds = np.empty(n_samples, dtype=np.int32)
+
+    if labels is None:
+        sizes = np.full(n_folds, n_samples // n_folds)
+        sizes[:n_samples % n_folds] += 1
+        blocks = np.repeat(np.arange(n_folds, dtype=np.int32), sizes)
+        folds[:] = rng.permutation(blocks) if shuffle else blocks
+        return folds
+
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    if counts.min() < n_folds:
+        logger.warning(
+            f"Smallest class has {counts.min()} samples, fewer than {n_folds} folds"
+        )
+    # Samples grouped by class (in random order within it when shuffling),
+    # then dealt out: consecutive samples of a class land in different folds
+    order = rng.permutation(n_samples) if shuffle else np.arange(n_samples)
+    order = order[np.argsort(inverse[order], kind="stable")]
+    folds[order] = np.arange(n_samples) % n_folds
+    return folds
+
+
+def fold_indices(folds: np.ndarray, fold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Training and validation sample indices of one fold; index the data
+    through them lazily rather than copying it"""
+    return np.flatnonzero(folds != fold), np.flatnonzero(folds == fold)
@@ -0,0 +1,96 @@
+import numpy as np
+import tensorflow as tf
+from typing import Callable, Optional, Tuple
+
+from .feature_store import FeatureStore
+
+
+def _gather_dataset(
+    count: int,
+    read_batch: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]],
+    feature_shape: Tuple[int, ...],
+    labels: np.ndarray,
+    batch_size: int,
+    shuffle: bool,
+    shuffle_buffer: Optional[int],
+    num_shards: int,
+    shard_index: int,
+    seed: Optional[int]
+) -> tf.data.Dataset:
+    ds = tf.data.Dataset.from_tensor_slices(np.arange(count))
+    if num_shards > 1:
+        ds = ds.shard(num_shards, shard_index)
+    if shuffle:
+        ds = ds.shuffle(
+            shuffle_buffer or count,
+            seed=seed,
+            reshuffle_each_iteration=True
+        )
+    ds = ds.batch(batch_size)
+
+    label_dtype = tf.as_dtype(labels.dtype)
+
+    def gather(indices):
+        features, batch_labels = tf.numpy_function(
+            read_batch, [indices], (tf.float32, label_dtype)
+        )
+        features.set_shape([None, *feature_shape])
+        batch_labels.set_shape([None, *labels.shape[1:]])
+        return features, batch_labels
+
+    return ds.map(
+        gather,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle
+    ).prefetch(tf.data.AUTOTUNE)
+
+
+def feature_dataset(
+    store: FeatureStore,
+    locations: np.ndarray,
+    labels: np.ndarray,
+    batch_size: int,
+    shuffle: bool = False,
+    shuffle_buffer: Optional[int] = None,
+    num_shards: int = 1,
+    shard_index: int = 0,
+    seed: Optional[int] = None
+) -> tf.data.Dataset:
+    """Batches of (features, labels) streamed from the feature store.
+
+    Only sample indices and labels are held in memory. Indices are sharded
+    across workers and shuffled (the whole epoch by default, as they are
+    small), then each batch's rows are gathered from the memory-mapped
+    shards in parallel and prefetched while the model trains.
+    """
+    def read_batch(indices: np.ndarray):
+        return store.read(locations[indices]), labels[indices]
+
+    return _gather_dataset(
+        len(locations), read_batch, (store.dim,), labels,
+        batch_size, shuffle, shuffle_buffer, num_shards, shard_index, seed
+    )
+
+
+def array_dataset(
+    X: np.ndarray,
+    y: np.ndarray,
+    indices: np.ndarray,
+    batch_size: int,
+    shuffle: bool = False,
+    shuffle_buffer: Optional[int] = None,
+    seed: Optional[int] = None
+) -> tf.data.Dataset:
+    """Batches of (X, y) rows at ``indices``, e.g. one cross-validation fold.
+
+    Rows are gathered a batch at a time, so X (typically memory-mapped)
+    is never copied as a whole.
+    """
+    def read_batch(batch: np.ndarray):
+        rows = indices[batch]
+        return np.asarray(X[rows], dtype=np.float32), y[rows]
+
+    return _gather_dataset(
+        len(indices), read_batch, X.shape[1:], y,
+        batch_size, shuffle, shuffle_buffer, 1, 0, seed
+    )
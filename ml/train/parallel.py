@@ -0,0 +1,233 @@
+import inspect
+import mmap
+import multiprocessing
+import os
+import random
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# TensorFlow is only imported inside the worker functions: workers must set
+# their thread limits before it loads
+
+
+def worker_cpus(workers: int) -> List[List[int]]:
+    """Disjoint CPU sets, one per worker, from the CPUs this process may use"""
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        cpus = list(range(os.cpu_count() or 1))
+    per_worker = max(1, len(cpus) // workers)
+    return [
+        cpus[(i * per_worker) % len(cpus):(i * per_worker) % len(cpus) + per_worker]
+        for i in range(workers)
+    ]
+
+
+def _init_worker(cpu_sets, pin: bool):
+    cpus = cpu_sets.get()
+    threads = str(len(cpus))
+    # One worker per CPU set: TensorFlow and BLAS size their pools to it
+    os.environ["TF_NUM_INTRAOP_THREADS"] = threads
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1" if len(cpus) < 4 else "2"
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["OPENBLAS_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    if pin and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+
+def worker_pool(workers: int, pin_cpus: bool = True) -> ProcessPoolExecutor:
+    """Process pool whose workers each own a slice of the CPUs.
+
+    Workers are spawned, not forked, so none inherits TensorFlow state.
+    Functions and arguments sent to them must be picklable: pass model
+    functions defined at module level (or functools.partial of one), not
+    lambdas or closures.
+    """
+    context = multiprocessing.get_context("spawn")
+    cpu_sets = context.Queue()
+    for cpus in worker_cpus(workers):
+        cpu_sets.put(cpus)
+    return ProcessPoolExecutor(
+        workers, mp_context=context, initializer=_init_worker, initargs=(cpu_sets, pin_cpus)
+    )
+
+
+class InlineExecutor(Executor):
+    """Runs each job as it is submitted, for a single worker: no process
+    to spawn and nothing needs to be picklable"""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def share_array(array: np.ndarray, directory: Path, name: str):
+    """A reference workers can open without the array being pickled: the
+    file behind a memmap, else a .npy copy written once"""
+    # Only a whole mapping: a slice of one reports its parent's offset
+    if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.flags.c_contiguous:
+        return ("memmap", array.filename, array.dtype.str, array.shape, array.offset)
+    path = Path(directory) / f"{name}.npy"
+    np.save(path, array)
+    return ("npy", str(path))
+
+
+def open_shared(ref) -> np.ndarray:
+    if isinstance(ref, np.ndarray):
+        return ref
+    if ref[0] == "memmap":
+        _, filename, dtype, shape, offset = ref
+        return np.memmap(filename, dtype=np.dtype(dtype), mode="r", shape=tuple(shape), offset=offset)
+    return np.load(ref[1], mmap_mode="r")
+
+
+def split_params(model_fn: Callable, params: Dict[str, Any]) -> Tuple[Dict, Dict]:
+    """Parameters model_fn accepts go to it, the rest to model.fit"""
+    accepted = inspect.signature(model_fn).parameters
+    if any(p.kind == p.VAR_KEYWORD for p in accepted.values()):
+        return dict(params), {}
+    model_kwargs = {k: v for k, v in params.items() if k in accepted}
+    fit_kwargs = {k: v for k, v in params.items() if k not in accepted}
+    return model_kwargs, fit_kwargs
+
+
+def checkpoint_callback(model_dir: str, monitor: str = "val_loss", mode: str = "min"):
+    import tensorflow as tf
+
+    return tf.keras.callbacks.ModelCheckpoint(
+        filepath=str(Path(model_dir) / "model-{epoch:02d}-{val_loss:.2f}.h5"),
+        monitor=monitor,
+        mode=mode,
+        save_best_only=True,
+        save_weights_only=False
+    )
+
+
+def _limit_threads(tf):
+    # The environment only takes effect if TensorFlow loaded after the
+    # initializer ran, which a spawned worker importing __main__ may defeat
+    if "TF_NUM_INTRAOP_THREADS" not in os.environ:
+        return
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(int(os.environ["TF_NUM_INTRAOP_THREADS"]))
+        tf.config.threading.set_inter_op_parallelism_threads(int(os.environ["TF_NUM_INTEROP_THREADS"]))
+    except RuntimeError:
+        pass  # already set by an earlier job in this worker
+
+
+def fit_job(job: Dict) -> Dict:
+    """Train one model as described by ``job``; runs in a worker process.
+
+    job keys:
+        model_fn, model_kwargs, fit_kwargs
+        data: (X ref, y ref)
+        folds, fold: with a fold assignment (see folds), train on the rows
+            outside ``fold`` and validate on those in it
+        validation: (X ref, y ref) when there are no folds
+        checkpoint_dir: keep the best epochs there
+        resume_from / save_to: model paths to continue from / save to
+        initial_epoch, epochs: the epoch range to train
+    Returns the Keras history as plain floats.
+    """
+    import tensorflow as tf
+
+    _limit_threads(tf)
+    X, y = (open_shared(ref) for ref in job["data"])
+    fit_kwargs = dict(job["fit_kwargs"])
+    if job.get("folds") is not None:
+        from .folds import fold_indices
+        from .input_pipeline import array_dataset
+
+        # Streamed through the fold's indices: X is never copied per fold
+        folds = open_shared(job["folds"])
+        batch_size = fit_kwargs.pop("batch_size", 32)
+        shuffle = fit_kwargs.pop("shuffle", True)
+        train_idx, val_idx = fold_indices(folds, job["fold"])
+        train = (array_dataset(X, y, train_idx, batch_size, shuffle=shuffle, seed=job["fold"]),)
+        fit_kwargs["validation_data"] = array_dataset(X, y, val_idx, batch_size)
+    else:
+        train = (X, y)
+        if job.get("validation") is not None:
+            fit_kwargs["validation_data"] = tuple(open_shared(ref) for ref in job["validation"])
+
+    if job.get("resume_from"):
+        model = tf.keras.models.load_model(job["resume_from"])
+    else:
+        model = job["model_fn"](**job["model_kwargs"])
+
+    callbacks = list(fit_kwargs.pop("callbacks", []))
+    if job.get("checkpoint_dir"):
+        callbacks.append(checkpoint_callback(job["checkpoint_dir"]))
+    if "epochs" in job:
+        fit_kwargs["epochs"] = job["epochs"]
+        fit_kwargs["initial_epoch"] = job.get("initial_epoch", 0)
+
+    history = model.fit(*train, callbacks=callbacks, **fit_kwargs)
+    if job.get("save_to"):
+        model.save(job["save_to"])
+    return {k: [float(v) for v in values] for k, values in history.history.items()}
+
+
+def grid_trials(space: Dict[str, list]) -> Iterator[Dict[str, Any]]:
+    names = list(space)
+    for values in product(*space.values()):
+        yield dict(zip(names, values))
+
+
+def sample_trial(space: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    """One point of the space: a random element of each list, or the value
+    of callables, which are given ``rng``"""
+    return {
+        name: values(rng) if callable(values) else rng.choice(list(values))
+        for name, values in space.items()
+    }
+
+
+class ASHA:
+    """Asynchronous successive halving.
+
+    Every trial starts with ``min_epochs``; a trial finishing rung k is
+    promoted to rung k+1 (``eta`` times the epochs, up to ``max_epochs``)
+    as soon as it ranks in the top 1/eta of the trials done at rung k.
+    Workers never wait for a rung to fill, and poor trials stop early.
+    """
+
+    def __init__(self, n_trials: int, min_epochs: int, max_epochs: int, eta: int = 3):
+        self.n_trials = n_trials
+        self.eta = eta
+        self.rung_epochs = []
+        epochs = min_epochs
+        while epochs < max_epochs:
+            self.rung_epochs.append(epochs)
+            epochs *= eta
+        self.rung_epochs.append(max_epochs)
+        self.results: List[Dict[int, float]] = [{} for _ in self.rung_epochs]
+        self.promoted: List[set] = [set() for _ in self.rung_epochs]
+        self.started = 0
+
+    def next_job(self) -> Optional[Tuple[int, int]]:
+        """(trial, rung) to run next: a promotion if one is due, else a new
+        trial; None when neither is possible right now"""
+        for rung in reversed(range(len(self.rung_epochs) - 1)):
+            done = self.results[rung]
+            ranked = sorted(done, key=done.get)[:len(done) // self.eta]
+            for trial in ranked:
+                if trial not in self.promoted[rung]:
+                    self.promoted[rung].add(trial)
+                    return trial, rung + 1
+        if self.started < self.n_trials:
+            self.started += 1
+            return self.started - 1, 0
+        return None
+
+    def report(self, trial: int, rung: int, loss: float):
+        self.results[rung][trial] = loss
@@ -1,27 +1,60 @@
 import tensorflow as tf
 import numpy as np
-import librosa
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from pathlib import Path
 import json
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from ..audio_features import GENRE_SPEC, MOOD_SPEC, extract, load_clip
+from .feature_store import FeatureStore
+from .input_pipeline import feature_dataset
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def input_datasets(
+    store: FeatureStore,
+    locations: np.ndarray,
+    y: np.ndarray,
+    train_idx: np.ndarray,
+    test_idx: np.ndarray,
+    model_config: Dict,
+    input_config: Dict
+) -> Tuple[tf.data.Dataset, tf.data.Dataset]:
+    """Shuffled training and ordered validation pipelines over the feature store"""
+    train_ds = feature_dataset(
+        store, locations[train_idx], y[train_idx],
+        batch_size=model_config["batch_size"],
+        shuffle=True,
+        shuffle_buffer=input_config.get("shuffle_buffer"),
+        num_shards=input_config.get("num_shards", 1),
+        shard_index=input_config.get("shard_index", 0),
+        seed=42
+    )
+    test_ds = feature_dataset(
+        store, locations[test_idx], y[test_idx],
+        batch_size=model_config["batch_size"]
+    )
+    return train_ds, test_ds
+
 class GenreClassifierTrainer:
     def __init__(
         self,
         data_path: str,
         model_path: str,
-        config_path: str = "config/genre_classifier.json"
+        config_path: str = "config/genre_classifier.json",
+        feature_dir: Optional[str] = None,
+        workers: Optional[int] = None
     ):
         self.data_path = Path(data_path)
         self.model_path = Path(model_path)
+        # Extracted features are cached here, see feature_store
+        self.feature_dir = Path(feature_dir) if feature_dir else self.data_path / "features"
+        self.workers = workers
         
         # Load configuration
         with open(config_path) as f:
@@ -29,49 +62,16 @@ class GenreClassifierTrainer:
         
         self.feature_config = self.config["features"]
         self.model_config = self.config["model"]
+        self.input_config = self.config.get("input", {})
+        self.spec = GENRE_SPEC.with_config(self.feature_config)
         
         # Initialize label encoder
         self.label_encoder = LabelEncoder()
 
     def extract_features(self, audio_path: str) -> np.ndarray:
         """Extract audio features for genre classification"""
-        y, sr = librosa.load(
-            audio_path,
-            sr=self.feature_config["sample_rate"],
-            duration=self.feature_config["duration"]
-        )
-        
-        # Mel spectrogram
-        mel_spec = librosa.feature.melspectrogram(
-            y=y,
-            sr=sr,
-            n_mels=self.feature_config["n_mels"],
-            fmax=self.feature_config["fmax"]
-        )
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-        
-        # Chromagram
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        
-        # Spectral features
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-        
-        # Rhythm features
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        
-        # Stack and normalize features
-        features = np.concatenate([
-            mel_spec_db.flatten()[:1024],
-            chroma.flatten()[:128],
-            spectral_centroids[:128],
-            spectral_rolloff[:128],
-            [tempo],
-            onset_env[:128]
-        ])
-        
-        return features
+        y = load_clip(str(audio_path), self.spec)
+        return extract(y, self.spec.sample_rate, self.spec)
 
     def build_model(self, input_shape: int, num_classes: int) -> tf.keras.Model:
         """Build genre classifier model"""
@@ -111,38 +111,31 @@ class GenreClassifierTrainer:
         # Load dataset (CSV with audio_path and genre columns)
         df = pd.read_csv(self.data_path / "metadata.csv")
         
-        # Extract features
-        X = []
-        y = []
-        for _, row in df.iterrows():
-            try:
-                features = self.extract_features(
-                    self.data_path / row["audio_path"]
-                )
-                X.append(features)
-                y.append(row["genre"])
-            except Exception as e:
-                logger.warning(f"Error processing {row['audio_path']}: {e}")
+        # Extract features, reusing those of unchanged files
+        store = FeatureStore(self.feature_dir, self.spec, self.workers)
+        paths = [self.data_path / p for p in df["audio_path"]]
+        store.update(paths)
+        found, locations = store.locate(paths)
+        y = self.label_encoder.fit_transform(df["genre"][found])
         
-        X = np.array(X)
-        y = self.label_encoder.fit_transform(y)
-        
-        # Split dataset
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y,
+        # Split dataset; features stay on disk and are streamed per batch
+        train_idx, test_idx = train_test_split(
+            np.arange(len(y)),
             test_size=self.model_config["test_size"],
             random_state=42
         )
+        train_ds, test_ds = input_datasets(
+            store, locations, y, train_idx, test_idx, self.model_config, self.input_config
+        )
         
         # Build and train model
-        model = self.build_model(X.shape[1], len(self.label_encoder.classes_))
+        model = self.build_model(store.dim, len(self.label_encoder.classes_))
         
         logger.info("Training model...")
         history = model.fit(
-            X_train, y_train,
-            validation_data=(X_test, y_test),
+            train_ds,
+            validation_data=test_ds,
             epochs=self.model_config["epochs"],
-            batch_size=self.model_config["batch_size"],
             callbacks=[
                 tf.keras.callbacks.EarlyStopping(
                     patience=5,
@@ -160,7 +153,9 @@ class GenreClassifierTrainer:
             json.dump(
                 {
                     "classes": self.label_encoder.classes_.tolist(),
-                    "config": self.config
+                    "config": self.config,
+                    # Serving computes its inputs from this
+                    "feature_spec": self.spec.to_dict()
                 },
                 f
             )
@@ -172,10 +167,15 @@ class MoodClassifierTrainer:
         self,
         data_path: str,
         model_path: str,
-        config_path: str = "config/mood_classifier.json"
+        config_path: str = "config/mood_classifier.json",
+        feature_dir: Optional[str] = None,
+        workers: Optional[int] = None
     ):
         self.data_path = Path(data_path)
         self.model_path = Path(model_path)
+        # Extracted features are cached here, see feature_store
+        self.feature_dir = Path(feature_dir) if feature_dir else self.data_path / "features"
+        self.workers = workers
         
         # Load configuration
         with open(config_path) as f:
@@ -183,38 +183,13 @@ class MoodClassifierTrainer:
         
         self.feature_config = self.config["features"]
         self.model_config = self.config["model"]
+        self.input_config = self.config.get("input", {})
+        self.spec = MOOD_SPEC.with_config(self.feature_config)
 
     def extract_features(self, audio_path: str) -> np.ndarray:
         """Extract audio features for mood classification"""
-        y, sr = librosa.load(
-            audio_path,
-            sr=self.feature_config["sample_rate"],
-            duration=self.feature_config["duration"]
-        )
-        
-        # Mel spectrogram with more frequency resolution
-        mel_spec = librosa.feature.melspectrogram(
-            y=y,
-            sr=sr,
-            n_mels=128,
-            fmax=8000
-        )
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-        
-        # Spectral contrast (for emotional content)
-        contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-        
-        # MFCC (for timbre)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        
-        # Stack features
-        features = np.concatenate([
-            mel_spec_db.flatten()[:1024],
-            contrast.flatten()[:128],
-            mfcc.flatten()[:128]
-        ])
-        
-        return features
+        y = load_clip(str(audio_path), self.spec)
+        return extract(y, self.spec.sample_rate, self.spec)
 
     def build_model(self, input_shape: int) -> tf.keras.Model:
         """Build mood classifier model (predicts valence/arousal)"""
@@ -249,38 +224,31 @@ class MoodClassifierTrainer:
         # Load dataset (CSV with audio_path, valence, arousal columns)
         df = pd.read_csv(self.data_path / "mood_metadata.csv")
         
-        # Extract features
-        X = []
-        y = []
-        for _, row in df.iterrows():
-            try:
-                features = self.extract_features(
-                    self.data_path / row["audio_path"]
-                )
-                X.append(features)
-                y.append([row["valence"], row["arousal"]])
-            except Exception as e:
-                logger.warning(f"Error processing {row['audio_path']}: {e}")
-        
-        X = np.array(X)
-        y = np.array(y)
+        # Extract features, reusing those of unchanged files
+        store = FeatureStore(self.feature_dir, self.spec, self.workers)
+        paths = [self.data_path / p for p in df["audio_path"]]
+        store.update(paths)
+        found, locations = store.locate(paths)
+        y = df[["valence", "arousal"]].to_numpy(dtype=np.float32)[found]
         
-        # Split dataset
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y,
+        # Split dataset; features stay on disk and are streamed per batch
+        train_idx, test_idx = train_test_split(
+            np.arange(len(y)),
             test_size=self.model_config["test_size"],
             random_state=42
         )
+        train_ds, test_ds = input_datasets(
+            store, locations, y, train_idx, test_idx, self.model_config, self.input_config
+        )
         
         # Build and train model
-        model = self.build_model(X.shape[1])
+        model = self.build_model(store.dim)
         
         logger.info("Training model...")
         history = model.fit(
-            X_train, y_train,
-            validation_data=(X_test, y_test),
+            train_ds,
+            validation_data=test_ds,
             epochs=self.model_config["epochs"],
-            batch_size=self.model_config["batch_size"],
             callbacks=[
                 tf.keras.callbacks.EarlyStopping(
                     patience=5,
@@ -294,7 +262,8 @@ class MoodClassifierTrainer:
         model.save(self.model_path / "mood_classifier")
         
         with open(self.model_path / "mood_config.json", "w") as f:
-            json.dump(self.config, f)
+            # Serving computes its inputs from feature_spec
+            json.dump({**self.config, "feature_spec": self.spec.to_dict()}, f)
         
         return model, history
 
@@ -1,7 +1,20 @@
 import tensorflow as tf
 import numpy as np
 import librosa
-from typing import Dict, List, Tuple
+import json
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+# Shared with training; the image copies the ml package next to app/
+from ml.audio_features import GENRE_SPEC, MOOD_SPEC, FeatureSpec, extract, extract_batch
+
+def load_feature_spec(metadata_path: Path, default: FeatureSpec) -> FeatureSpec:
+    """The feature spec a model was trained with, saved next to it by the trainer"""
+    try:
+        with open(metadata_path) as f:
+            return FeatureSpec.from_dict(json.load(f)["feature_spec"])
+    except (FileNotFoundError, KeyError):
+        return default
 
 class GenreClassifier:
     def __init__(self, model_path: str = 'models/genre_classifier'):
@@ -10,38 +23,11 @@ class GenreClassifier:
             'techno', 'house', 'trance', 'ambient',
             'dnb', 'minimal', 'progressive', 'dub'
         ]
+        self.spec = load_feature_spec(Path(model_path).parent / 'genre_classes.json', GENRE_SPEC)
 
     def extract_features(self, y: np.ndarray, sr: int) -> np.ndarray:
         """Extract features for genre classification"""
-        # Mel spectrograms
-        mel_spec = librosa.feature.melspectrogram(
-            y=y, sr=sr, n_mels=128,
-            fmax=8000, hop_length=512
-        )
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-        
-        # Chromagram
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        
-        # Spectral features
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-        
-        # Rhythm features
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        
-        # Stack features
-        features = np.concatenate([
-            mel_spec_db.flatten()[:1024],  # First 1024 mel features
-            chroma.flatten()[:128],        # Chromagram
-            spectral_centroids[:128],      # Spectral features
-            spectral_rolloff[:128],
-            [tempo],                       # Rhythm features
-            onset_env[:128]
-        ])
-        
-        return features.reshape(1, -1)
+        return extract(y, sr, self.spec).reshape(1, -1)
 
     def predict(self, y: np.ndarray, sr: int) -> Dict[str, float]:
         """Predict genre probabilities"""
@@ -49,33 +35,30 @@ class GenreClassifier:
         probs = self.model.predict(features)[0]
         return dict(zip(self.genres, probs.tolist()))
 
+    def predict_batch(self, clips: Sequence[np.ndarray], sr: int) -> List[Dict[str, float]]:
+        """Predict genre probabilities for many clips in one pass"""
+        probs = self.model.predict(extract_batch(clips, sr, self.spec))
+        return [dict(zip(self.genres, p.tolist())) for p in probs]
+
 class MoodClassifier:
     def __init__(self, model_path: str = 'models/mood_classifier'):
         self.model = tf.keras.models.load_model(model_path)
+        self.spec = load_feature_spec(Path(model_path).parent / 'mood_config.json', MOOD_SPEC)
         
     def predict(self, y: np.ndarray, sr: int) -> Dict[str, float]:
         """Predict valence/arousal values"""
-        # Extract features similar to genre classifier
-        mel_spec = librosa.feature.melspectrogram(y=y, sr=sr)
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-        
-        # Additional features for mood
-        spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        
-        # Stack features
-        features = np.concatenate([
-            mel_spec_db.flatten()[:1024],
-            spectral_contrast.flatten()[:128],
-            mfcc.flatten()[:128]
-        ])
-        
-        # Predict valence/arousal
-        pred = self.model.predict(features.reshape(1, -1))[0]
-        return {
-            'valence': float(pred[0]),  # Emotional positivity
-            'arousal': float(pred[1])   # Energy/intensity
-        }
+        return self.predict_batch([y], sr)[0]
+
+    def predict_batch(self, clips: Sequence[np.ndarray], sr: int) -> List[Dict[str, float]]:
+        """Predict valence/arousal values for many clips in one pass"""
+        preds = self.model.predict(extract_batch(clips, sr, self.spec))
+        return [
+            {
+                'valence': float(pred[0]),  # Emotional positivity
+                'arousal': float(pred[1])   # Energy/intensity
+            }
+            for pred in preds
+        ]
 
 class MixingPointDetector:
     def __init__(self, model_path: str = 'models/mix_point_detector'):
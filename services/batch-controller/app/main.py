@@ -17,7 +17,7 @@ SERVICES = {
     "whisper": {
         "url": os.getenv("WHISPER_URL"),
         "token": os.getenv("WHISPER_TOKEN"),
-        "concurrency": 2  # GPU-bound, lower concurrency
+        "concurrency": 8  # windows are batched server-side, keep batches full
     },
     "gpt": {
         "url": os.getenv("GPT_URL"),
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import re
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional
+
+import aiofiles
+
+READ_CHUNK_SIZE = 64 * 1024
+# Finished archives kept on local disk for downloads, least recently used evicted first
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+
+
+class ArchiveWriter:
+    """Progress of an archive being written, for readers following it"""
+
+    def __init__(self, path: str, partial_path: str):
+        self.path = path
+        self.partial_path = partial_path
+        self.size = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Wake everyone waiting and arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def advance(self, n: int):
+        self.size += n
+        self._notify()
+
+    def finish(self, error: Optional[str] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def wait(self, size: int):
+        """Return once more than ``size`` bytes are written or the writer finished"""
+        while self.size <= size and not self.done:
+            await self._changed.wait()
+
+
+class ArchiveCache:
+    """Export archives on local disk, readable while they are still being written"""
+
+    def __init__(self, directory: str, max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.active: Dict[str, ArchiveWriter] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, setlist_id: str) -> str:
+        return os.path.join(
+            self.directory,
+            "export_" + re.sub(r"[^A-Za-z0-9_.-]", "_", setlist_id) + ".zip",
+        )
+
+    def finished(self, setlist_id: str) -> Optional[str]:
+        """Path of the complete archive, marking it recently used, or None"""
+        path = self.path(setlist_id)
+        try:
+            # Recency lives in atime; mtime stays put so validators remain stable
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def begin(self, setlist_id: str) -> ArchiveWriter:
+        """Announce an archive before its first byte so downloads can wait for it"""
+        path = self.path(setlist_id)
+        writer = self.active[setlist_id] = ArchiveWriter(path, f"{path}.{uuid.uuid4().hex}.part")
+        return writer
+
+    def end(self, setlist_id: str, writer: ArchiveWriter, error: Optional[str] = None):
+        if not writer.done:
+            writer.finish(error)
+        if self.active.get(setlist_id) is writer:
+            del self.active[setlist_id]
+
+    async def store(
+        self,
+        setlist_id: str,
+        chunks: AsyncIterator[bytes],
+        writer: Optional[ArchiveWriter] = None,
+    ) -> str:
+        """Write an archive stream to disk; it becomes visible as finished once complete"""
+        writer = writer or self.begin(setlist_id)
+        error = None
+        try:
+            async with aiofiles.open(writer.partial_path, "wb") as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+                    await f.flush()
+                    writer.advance(len(chunk))
+            os.replace(writer.partial_path, writer.path)
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            self.end(setlist_id, writer, error)
+            if os.path.exists(writer.partial_path):
+                os.unlink(writer.partial_path)
+        await asyncio.to_thread(self.evict, writer.path)
+        return writer.path
+
+    async def follow(self, writer: ArchiveWriter) -> AsyncIterator[bytes]:
+        """Stream an archive from its first byte while it is being written.
+
+        The file keeps its inode when renamed on completion, so one handle
+        opened on the partial file reads through to the end.
+        """
+        await writer.wait(0)
+        if writer.error:
+            raise RuntimeError(f"Export failed: {writer.error}")
+        try:
+            f = await aiofiles.open(writer.partial_path, "rb")
+        except FileNotFoundError:
+            f = await aiofiles.open(writer.path, "rb")  # finished in the meantime
+        try:
+            sent = 0
+            while True:
+                await writer.wait(sent)
+                if writer.error:
+                    raise RuntimeError(f"Export failed: {writer.error}")
+                data = await f.read(min(writer.size - sent, READ_CHUNK_SIZE))
+                if data:
+                    sent += len(data)
+                    yield data
+                elif writer.done:
+                    return
+        finally:
+            await f.close()
+
+    async def read_range(self, path: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Stream bytes [start, end] of a finished archive"""
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = await f.read(min(remaining, READ_CHUNK_SIZE))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+
+    def evict(self, keep: Optional[str] = None):
+        """Drop least recently used finished archives beyond max_bytes, never ``keep``"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".zip") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        files = [e for e in os.scandir(self.directory) if e.name.endswith(".zip")]
+        return {
+            "archives": len(files),
+            "bytes": sum(e.stat().st_size for e in files),
+            "max_bytes": self.max_bytes,
+            "active": len(self.active),
+        }
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+EXPORT_ENTRY_CACHE_PATH = os.getenv(
+    "EXPORT_ENTRY_CACHE_PATH", os.path.join(tempfile.gettempdir(), "export-entries.sqlite3")
+)
+EXPORT_ENTRY_CACHE_MAX_BYTES = int(os.getenv("EXPORT_ENTRY_CACHE_MAX_BYTES", str(1024 ** 3)))
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(*parts) -> str:
+    """Stable hash of the inputs an entry is rendered from"""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class EntryCache:
+    """Persistent SQLite cache of compressed archive entries.
+
+    Keys hash the render inputs, so a re-export only renders and compresses
+    the entries that changed. The file is shared by several workers, so
+    each write commits on its own and never holds the database locked;
+    access times are committed in batches, and least recently used entries
+    are evicted beyond max_bytes. A write that still finds the database
+    locked is skipped (and counted) rather than failing the export.
+    """
+
+    BATCH = 256
+
+    def __init__(self, path: str = EXPORT_ENTRY_CACHE_PATH, max_bytes: int = EXPORT_ENTRY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                crc INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)"
+        )
+        self._conn.commit()
+        self._touched: List[Tuple[float, str]] = []
+        self._pending = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "skipped_writes": 0}
+
+    def get(self, key: str) -> Optional[Tuple[bytes, int, int]]:
+        """(compressed data, CRC, uncompressed size)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, crc, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            self._touched.append((time.time(), key))
+            if len(self._touched) >= self.BATCH:
+                self._flush()
+            return row
+
+    def put(self, key: str, data: bytes, crc: int, size: int):
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, data, crc, size, len(data), time.time()),
+                    )
+            except sqlite3.OperationalError as e:
+                self.counters["skipped_writes"] += 1
+                logger.warning(f"Entry cache write skipped: {e}")
+                return
+            self._pending += 1
+            if self._pending >= self.BATCH:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        touched, self._touched = self._touched, []
+        try:
+            with self._conn:
+                if touched:
+                    self._conn.executemany(
+                        "UPDATE entries SET last_access = ? WHERE key = ?", touched
+                    )
+                if self._pending:
+                    self._evict()
+            self._pending = 0
+        except sqlite3.OperationalError as e:
+            # Eviction is retried on the next flush; these access times are lost
+            self.counters["skipped_writes"] += 1
+            logger.warning(f"Entry cache flush skipped: {e}")
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(nbytes), 0) FROM entries"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, nbytes FROM entries ORDER BY last_access"
+        ).fetchall()
+        doomed = []
+        for key, nbytes in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= nbytes
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+        self.counters["evictions"] += len(doomed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries"
+            ).fetchone()
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": nbytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,348 @@
+import asyncio
+import json
+import os
+import re
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Union
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import quoteattr
+
+import aiohttp
+
+from .entry_cache import content_key
+from .zipstream import Entry, KeyedEntry, Stored
+
+if TYPE_CHECKING:
+    from .main import ExportRequest, TrackExport
+
+# Part of every entry cache key; bump when a renderer's output changes
+EXPORT_RENDER_VERSION = "v1"
+# Audio files downloaded at the same time for one export
+EXPORT_AUDIO_CONCURRENCY = int(os.getenv("EXPORT_AUDIO_CONCURRENCY", "4"))
+# Chunks each download buffers ahead of the archive writer
+EXPORT_AUDIO_BUFFER_CHUNKS = int(os.getenv("EXPORT_AUDIO_BUFFER_CHUNKS", "8"))
+AUDIO_CHUNK_SIZE = 64 * 1024
+
+# CUE sheets number tracks 01-99
+CUE_MAX_TRACKS = 99
+CUE_FRAMES_PER_SEC = 75
+
+FormatWriter = Callable[["ExportRequest", "ExportContext"], Iterable[Union[Entry, KeyedEntry]]]
+FORMAT_WRITERS: Dict[str, FormatWriter] = {}
+
+
+def format_writer(name: str):
+    """Register a generator of a format's archive entries under ``name``"""
+    def register(writer: FormatWriter) -> FormatWriter:
+        FORMAT_WRITERS[name] = writer
+        return writer
+    return register
+
+
+class AudioStream:
+    """Chunks of one download, produced on the event loop and read by the
+    archive writer thread through a small bounded queue"""
+
+    def __init__(self, fetcher: "AudioFetcher", index: int, url: str):
+        self.fetcher = fetcher
+        self.index = index
+        self.url = url
+        self.queue: asyncio.Queue = asyncio.Queue(EXPORT_AUDIO_BUFFER_CHUNKS)
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.run_coroutine_threadsafe(self.fetcher.download(self), self.fetcher.loop)
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.fetcher.closed:
+            raise RuntimeError("Export cancelled")
+        self.fetcher.prefetch(self.index)
+        while True:
+            item = asyncio.run_coroutine_threadsafe(self.queue.get(), self.fetcher.loop).result()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class AudioFetcher:
+    """Downloads track audio for the archive, a few files ahead of the writer.
+
+    When the writer reaches file i, files i..i+concurrency-1 are fetched;
+    each buffers at most EXPORT_AUDIO_BUFFER_CHUNKS chunks, so memory stays
+    constant however large the files and nothing is staged to disk.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, concurrency: int = EXPORT_AUDIO_CONCURRENCY):
+        self.loop = loop
+        self.concurrency = concurrency
+        self.closed = False
+        self._streams: List[AudioStream] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def stream(self, url: str) -> Stored:
+        stream = AudioStream(self, len(self._streams), url)
+        self._streams.append(stream)
+        return Stored(stream)
+
+    def prefetch(self, index: int):
+        for stream in self._streams[index:index + self.concurrency]:
+            stream.start()
+
+    async def download(self, stream: AudioStream):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=60))
+        try:
+            async with self._session.get(stream.url) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.content.iter_chunked(AUDIO_CHUNK_SIZE):
+                    await stream.queue.put(chunk)
+            await stream.queue.put(None)
+        except Exception as e:
+            await stream.queue.put(e)
+
+    async def close(self):
+        """Stop downloads and release a writer waiting on one"""
+        self.closed = True
+        for stream in self._streams:
+            if stream.task is not None and not stream.task.done():
+                stream.task.cancel()
+                while not stream.queue.empty():
+                    stream.queue.get_nowait()
+                stream.queue.put_nowait(RuntimeError("Export cancelled"))
+        if self._session is not None:
+            await self._session.close()
+
+
+class ExportContext:
+    """Per-export resources shared by the format writers"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._audio: Optional[AudioFetcher] = None
+
+    @property
+    def audio(self) -> AudioFetcher:
+        if self._audio is None:
+            self._audio = AudioFetcher(self.loop)
+        return self._audio
+
+    async def close(self):
+        if self._audio is not None:
+            await self._audio.close()
+
+
+def audio_filename(index: int, track: "TrackExport") -> str:
+    """Archive path of a bundled audio file, shared by the writers referencing it"""
+    ext = os.path.splitext(urlparse(track.storage_url).path)[1] or ".mp3"
+    title = os.path.splitext(str(track.metadata.get("title") or track.track_id))[0]
+    title = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", title)[:100]
+    return f"audio/{index:03d} - {title}{ext}"
+
+
+def storage_filename(track: "TrackExport") -> str:
+    """Name of a track's file as downloaded from its storage URL"""
+    return unquote(os.path.basename(urlparse(track.storage_url).path))
+
+
+def generate_m3u(tracks: List["TrackExport"]) -> Iterator[str]:
+    """Generate .m3u playlist lines"""
+    yield "#EXTM3U\n"
+    for track in tracks:
+        duration = track.metadata.get("duration_sec", 0)
+        yield f"#EXTINF:{int(duration)},{track.metadata.get('title')}\n"
+        yield f"{track.storage_url}\n"
+
+
+def generate_srt(track: "TrackExport", lang: str) -> Iterator[str]:
+    """Generate .srt subtitle cues for a track and language"""
+    for i, sub in enumerate(track.subtitles.get(lang, []), 1):
+        yield f"{i}\n{sub['start']} --> {sub['end']}\n{sub['text']}\n\n"
+
+
+def generate_json(tracks: List["TrackExport"]) -> Iterator[str]:
+    """Generate the JSON metadata document piece by piece"""
+    metadata = {
+        "exported_at": datetime.utcnow().isoformat(),
+        "tracks": [
+            {
+                "id": t.track_id,
+                "metadata": t.metadata,
+                "analysis": {
+                    "bpm": t.metadata.get("bpm"),
+                    "key": t.metadata.get("key"),
+                    "energy": t.metadata.get("energy"),
+                    "genre": t.metadata.get("genre")
+                }
+            }
+            for t in tracks
+        ]
+    }
+    return json.JSONEncoder(indent=2).iterencode(metadata)
+
+
+def rekordbox_key(key: Optional[str]) -> Optional[str]:
+    """Analyzer keys ("A minor") in Rekordbox notation ("Am"); others pass through"""
+    if not key:
+        return None
+    parts = key.split()
+    if len(parts) == 2 and parts[1].lower() in ("major", "minor"):
+        return parts[0] + ("m" if parts[1].lower() == "minor" else "")
+    return key
+
+
+def rekordbox_track(track_id: int, track: "TrackExport", location: str) -> str:
+    meta = track.metadata
+    mixing = meta.get("mixing") or {}
+    attrs = {
+        "TrackID": track_id,
+        "Name": meta.get("title") or track.track_id,
+        "Artist": meta.get("artist"),
+        "Genre": meta.get("genre"),
+        "TotalTime": int(meta["duration_sec"]) if meta.get("duration_sec") else None,
+        "AverageBpm": f"{meta['bpm']:.2f}" if meta.get("bpm") else None,
+        "Tonality": rekordbox_key(meta.get("key")),
+        "Location": location,
+    }
+    lines = ["    <TRACK " + " ".join(f"{k}={quoteattr(str(v))}" for k, v in attrs.items() if v is not None) + ">"]
+    if meta.get("bpm"):
+        lines.append(f'      <TEMPO Inizio="0.000" Bpm="{meta["bpm"]:.2f}" Metro="4/4" Battito="1"/>')
+    # Hot cues A/B at the analyzer's mix points, memory cues at its cue points
+    hot_cues = [("Mix in", mixing.get("mix_in_start")), ("Mix out", mixing.get("mix_out_end"))]
+    for num, (name, start) in enumerate(hot_cues):
+        if start is not None:
+            lines.append(f'      <POSITION_MARK Name="{name}" Type="0" Start="{start:.3f}" Num="{num}"/>')
+    for start in mixing.get("cue_points") or []:
+        lines.append(f'      <POSITION_MARK Name="" Type="0" Start="{start:.3f}" Num="-1"/>')
+    lines.append("    </TRACK>\n")
+    return "\n".join(lines)
+
+
+def rekordbox_location(root: Optional[str], path: str) -> str:
+    """TRACK Location for a file at ``path`` under the folder ``root``.
+
+    Rekordbox only resolves absolute file://localhost/ URIs, never remote
+    URLs. Without a root the URI is relative, and Rekordbox lists the tracks
+    as missing until they are relocated to the unpacked files.
+    """
+    if root:
+        path = root.replace("\\", "/").rstrip("/") + "/" + path
+    return "file://localhost/" + quote(path.lstrip("/"), safe="/:")
+
+
+def generate_rekordbox_xml(
+    tracks: List["TrackExport"], playlist: str, bundled: bool, root: Optional[str] = None
+) -> Iterator[str]:
+    """Rekordbox collection XML with tempo, key and cue points per track and
+    the set as a playlist. Tracks point at the bundled audio, or else at
+    each file's name as downloaded from storage, under ``root``"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<DJ_PLAYLISTS Version="1.0.0">\n'
+    yield '  <PRODUCT Name="Symphonia" Version="0.1" Company="Symphonia"/>\n'
+    yield f'  <COLLECTION Entries="{len(tracks)}">\n'
+    for i, track in enumerate(tracks, 1):
+        path = audio_filename(i, track) if bundled else storage_filename(track)
+        yield rekordbox_track(i, track, rekordbox_location(root, path))
+    yield '  </COLLECTION>\n  <PLAYLISTS>\n    <NODE Type="0" Name="ROOT" Count="1">\n'
+    yield f'      <NODE Name={quoteattr(playlist)} Type="1" KeyType="0" Entries="{len(tracks)}">\n'
+    for i in range(1, len(tracks) + 1):
+        yield f'        <TRACK Key="{i}"/>\n'
+    yield "      </NODE>\n    </NODE>\n  </PLAYLISTS>\n</DJ_PLAYLISTS>\n"
+
+
+def cue_time(seconds: float) -> str:
+    frames = int(round(seconds * CUE_FRAMES_PER_SEC))
+    minutes, frames = divmod(frames, 60 * CUE_FRAMES_PER_SEC)
+    secs, frames = divmod(frames, CUE_FRAMES_PER_SEC)
+    return f"{minutes:02d}:{secs:02d}:{frames:02d}"
+
+
+def cue_text(value) -> str:
+    return '"' + str(value).replace('"', "'") + '"'
+
+
+def generate_cue(tracks: List["TrackExport"], offset: int, title: str, bundled: bool) -> Iterator[str]:
+    """CUE sheet with one FILE per track; the analyzer's cue points become
+    extra INDEX marks"""
+    yield f"TITLE {cue_text(title)}\n"
+    for number, track in enumerate(tracks, 1):
+        meta = track.metadata
+        path = audio_filename(offset + number, track) if bundled else storage_filename(track)
+        file_type = "WAVE" if path.lower().endswith((".wav", ".aif", ".aiff")) else "MP3"
+        yield f"FILE {cue_text(path)} {file_type}\n  TRACK {number:02d} AUDIO\n"
+        yield f"    TITLE {cue_text(meta.get('title') or track.track_id)}\n"
+        if meta.get("artist"):
+            yield f"    PERFORMER {cue_text(meta['artist'])}\n"
+        yield "    INDEX 01 00:00:00\n"
+        cue_points = sorted(c for c in (meta.get("mixing") or {}).get("cue_points") or [] if c > 0)
+        for index, start in enumerate(cue_points[:98], 2):
+            yield f"    INDEX {index:02d} {cue_time(start)}\n"
+
+
+@format_writer("m3u")
+def m3u_entries(request: "ExportRequest", context: ExportContext) -> Iterator[KeyedEntry]:
+    tracks = request.tracks
+    yield (
+        "setlist.m3u",
+        generate_m3u(tracks),
+        lambda: content_key(
+            "m3u", EXPORT_RENDER_VERSION,
+            [(t.metadata.get("duration_sec", 0), t.metadata.get("title"), t.storage_url) for t in tracks],
+        ),
+    )
+
+
+@format_writer("srt")
+def srt_entries(request: "ExportRequest", context: ExportContext) -> Iterator[KeyedEntry]:
+    for track in request.tracks:
+        for lang, subtitles in track.subtitles.items():
+            yield (
+                f"{track.track_id}_{lang}.srt",
+                generate_srt(track, lang),
+                lambda subtitles=subtitles: content_key("srt", EXPORT_RENDER_VERSION, subtitles),
+            )
+
+
+@format_writer("json")
+def json_entries(request: "ExportRequest", context: ExportContext) -> Iterator[Entry]:
+    yield "metadata.json", generate_json(request.tracks)
+
+
+@format_writer("rekordbox")
+def rekordbox_entries(request: "ExportRequest", context: ExportContext) -> Iterator[Entry]:
+    yield "rekordbox.xml", generate_rekordbox_xml(
+        request.tracks, request.setlist_id, "audio" in request.formats, request.rekordbox_root
+    )
+
+
+@format_writer("cue")
+def cue_entries(request: "ExportRequest", context: ExportContext) -> Iterator[Entry]:
+    bundled = "audio" in request.formats
+    tracks = request.tracks
+    parts = range(0, len(tracks), CUE_MAX_TRACKS)
+    for part, offset in enumerate(parts, 1):
+        name = "setlist.cue" if len(parts) == 1 else f"setlist_{part}.cue"
+        title = request.setlist_id if len(parts) == 1 else f"{request.setlist_id} ({part}/{len(parts)})"
+        yield name, generate_cue(tracks[offset:offset + CUE_MAX_TRACKS], offset, title, bundled)
+
+
+@format_writer("audio")
+def audio_entries(request: "ExportRequest", context: ExportContext) -> Iterator[Entry]:
+    for i, track in enumerate(request.tracks, 1):
+        yield audio_filename(i, track), context.audio.stream(track.storage_url)
+
+
+def export_entries(request: "ExportRequest", context: ExportContext) -> List[Union[Entry, KeyedEntry]]:
+    """Archive entries as (name, lazy content[, cache key]) from every requested
+    format, in registry order; nothing is rendered until zipped.
+
+    Keys hash only what each renderer reads, so a re-export after editing
+    one track reuses every other track's compressed SRTs. metadata.json
+    embeds the export time and is always rendered.
+    """
+    entries: List[Union[Entry, KeyedEntry]] = []
+    for name, writer in FORMAT_WRITERS.items():
+        if name in request.formats:
+            entries.extend(writer(request, context))
+    return entries
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+# Exports rendered at the same time on this instance
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "2"))
+# Queued + running exports accepted before new ones are rejected
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", "32"))
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when the instance cannot accept more exports"""
+
+
+class ExportJob:
+    def __init__(
+        self,
+        setlist_id: str,
+        run: Callable[[], Awaitable],
+        on_position: Optional[Callable[[int], None]],
+    ):
+        self.setlist_id = setlist_id
+        self.run = run
+        self.on_position = on_position
+        self.position = 0
+
+
+class ExportQueue:
+    """Runs exports with bounded concurrency, queueing the rest in arrival order.
+
+    Waiting jobs are told their new position whenever one ahead of them
+    starts, so their status stays accurate while they wait.
+    """
+
+    def __init__(self, concurrency: int = EXPORT_CONCURRENCY, queue_size: int = EXPORT_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._waiting: Deque[ExportJob] = deque()
+        self._running = 0
+        self._tasks = set()
+        self.counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def check(self):
+        """Raise QueueFull if a new export would be rejected"""
+        in_flight = self._running + len(self._waiting)
+        if in_flight >= self.queue_size:
+            self.counters["rejected"] += 1
+            raise QueueFull(f"{in_flight} exports in flight")
+
+    def submit(
+        self,
+        setlist_id: str,
+        run: Callable[[], Awaitable],
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> int:
+        """Schedule ``run()``; returns the queue position, 0 if it starts right
+        away. Raises QueueFull."""
+        self.check()
+        self.counters["submitted"] += 1
+        job = ExportJob(setlist_id, run, on_position)
+        self._waiting.append(job)
+        job.position = len(self._waiting)
+        self._dispatch()
+        return job.position
+
+    def _dispatch(self):
+        while self._running < self.concurrency and self._waiting:
+            job = self._waiting.popleft()
+            job.position = 0
+            self._running += 1
+            task = asyncio.create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        for position, job in enumerate(self._waiting, 1):
+            if job.position != position:
+                job.position = position
+                if job.on_position:
+                    job.on_position(position)
+
+    async def _run(self, job: ExportJob):
+        try:
+            await job.run()
+            self.counters["completed"] += 1
+        except Exception:
+            self.counters["failed"] += 1
+            logger.exception(f"Export {job.setlist_id} failed")
+        finally:
+            self._running -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "running": self._running,
+            "queued": len(self._waiting),
+            "concurrency": self.concurrency,
+            "capacity": self.queue_size,
+        }
@@ -1,16 +1,49 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Optional
-import asyncio
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
 import aiohttp
-import aiofiles
+import asyncio
 import tempfile
+import json
+import logging
+import mimetypes
 import os
+import time
 import zipfile
-from datetime import datetime
+import zlib
+from urllib.parse import quote
+
+from .archive_cache import READ_CHUNK_SIZE, ArchiveCache, ArchiveWriter
+from .entry_cache import EntryCache
+from .formats import FORMAT_WRITERS, ExportContext, export_entries
+from .jobs import ExportQueue, QueueFull
+from .status_store import FINISHED, create_status_store
+from .zipstream import stream_zip, tee
+
+# Local archive cache, served by /export/{setlist_id}/download
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "symphonia-exports"))
+# Optional storage upload target (e.g. a presigned PUT URL), "{setlist_id}" is substituted
+EXPORT_UPLOAD_URL = os.getenv("EXPORT_UPLOAD_URL", "")
+# Base URL of this service as seen by clients
+EXPORT_PUBLIC_URL = os.getenv("EXPORT_PUBLIC_URL", "")
+EXPORT_DOWNLOAD_URL = os.getenv("EXPORT_DOWNLOAD_URL", EXPORT_PUBLIC_URL + "/export/{setlist_id}/download")
+# Longest a status long-poll may hold the request
+EXPORT_STATUS_MAX_WAIT_SEC = 60
+# Keep-alive interval of the status event stream
+EXPORT_STATUS_HEARTBEAT_SEC = 15
+# The export is done by the time its callback is sent; don't hold the worker long
+EXPORT_CALLBACK_TIMEOUT_SEC = float(os.getenv("EXPORT_CALLBACK_TIMEOUT_SEC", "10"))
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Symphonia Export Service", version="0.1")
 
+archives = ArchiveCache(EXPORT_DIR)
+status_store = create_status_store()
+entry_cache = EntryCache()
+export_queue = ExportQueue()
+
 class TrackExport(BaseModel):
     track_id: str
     storage_url: str
@@ -20,8 +53,11 @@ class TrackExport(BaseModel):
 class ExportRequest(BaseModel):
     setlist_id: str
     tracks: List[TrackExport]
-    formats: List[str]  # m3u, srt, json, etc.
+    formats: List[str]  # m3u, srt, json, rekordbox, cue, audio
     callback_url: str
+    # Absolute folder the archive will be unpacked into (e.g. "/Users/dj/Music/set"
+    # or "C:/Music/set"), so Rekordbox finds the tracks without relocating them
+    rekordbox_root: Optional[str] = None
 
 class ExportProgress(BaseModel):
     setlist_id: str
@@ -29,164 +65,306 @@ class ExportProgress(BaseModel):
     progress: int
     download_url: Optional[str] = None
     error: Optional[str] = None
+    queue_position: Optional[int] = None
+    version: int = 0
+    updated_at: Optional[float] = None
 
-# In-memory export progress tracking
-EXPORT_STATUS: Dict[str, ExportProgress] = {}
-
-async def generate_m3u(tracks: List[TrackExport], temp_dir: str) -> str:
-    """Generate .m3u playlist file"""
-    playlist_path = os.path.join(temp_dir, "setlist.m3u")
-    async with aiofiles.open(playlist_path, "w") as f:
-        await f.write("#EXTM3U\n")
-        for track in tracks:
-            duration = track.metadata.get("duration_sec", 0)
-            await f.write(f"#EXTINF:{int(duration)},{track.metadata.get('title')}\n")
-            await f.write(f"{track.storage_url}\n")
-    return playlist_path
-
-async def generate_srt(track: TrackExport, lang: str, temp_dir: str) -> str:
-    """Generate .srt subtitle file for a track and language"""
-    srt_path = os.path.join(temp_dir, f"{track.track_id}_{lang}.srt")
-    async with aiofiles.open(srt_path, "w") as f:
-        for i, sub in enumerate(track.subtitles.get(lang, []), 1):
-            await f.write(f"{i}\n")
-            await f.write(f"{sub['start']} --> {sub['end']}\n")
-            await f.write(f"{sub['text']}\n\n")
-    return srt_path
-
-async def generate_json(tracks: List[TrackExport], temp_dir: str) -> str:
-    """Generate JSON metadata file"""
-    json_path = os.path.join(temp_dir, "metadata.json")
-    metadata = {
-        "exported_at": datetime.utcnow().isoformat(),
-        "tracks": [
-            {
-                "id": t.track_id,
-                "metadata": t.metadata,
-                "analysis": {
-                    "bpm": t.metadata.get("bpm"),
-                    "key": t.metadata.get("key"),
-                    "energy": t.metadata.get("energy"),
-                    "genre": t.metadata.get("genre")
-                }
-            }
-            for t in tracks
-        ]
-    }
-    async with aiofiles.open(json_path, "w") as f:
-        await f.write(json.dumps(metadata, indent=2))
-    return json_path
+async def upload_zip(url: str, chunks: AsyncIterator[bytes]):
+    """Stream the archive to storage with a chunked PUT"""
+    async with aiohttp.ClientSession() as session:
+        async with session.put(url, data=chunks, headers={"Content-Type": "application/zip"}) as resp:
+            resp.raise_for_status()
+
+class StatusReporter:
+    """Writes one export's status to the store.
+
+    Updates only mark the status dirty; a single task writes it, so there
+    is never more than one write in flight and the latest state wins.
+    """
+
+    def __init__(self, progress: ExportProgress):
+        self.progress = progress
+        self._changed = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self.progress, name, value)
+        self._changed.set()
+
+    async def _write(self):
+        self.progress.version += 1
+        self.progress.updated_at = time.time()
+        await status_store.put(self.progress.dict())
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            await self._write()
+            if self._closed and not self._changed.is_set():
+                return
+
+    async def start(self):
+        """Write the initial status, then keep it up to date"""
+        await self._write()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Flush the final status"""
+        self._closed = True
+        self._changed.set()
+        await self._task
 
 async def process_export(
     request: ExportRequest,
-    temp_dir: str,
-    progress: ExportProgress
+    reporter: StatusReporter,
+    writer: Optional[ArchiveWriter] = None,
 ) -> str:
-    """Process export request and return zip file path"""
+    """Render, zip and deliver the export in one streaming pass; returns the download URL"""
+    context = ExportContext(asyncio.get_running_loop())
+    entries = export_entries(request, context)
+    written = 0
+
+    def entry_done(name: str):
+        nonlocal written
+        written += 1
+        percent = int((written / len(entries)) * 100)
+        if percent != reporter.progress.progress:
+            reporter.update(progress=percent)
+
+    # Rendering and compression run off the event loop, see zipstream
+    chunks = stream_zip(entries, on_entry=entry_done, cache=entry_cache)
+    setlist_id = quote(request.setlist_id, safe="")
+    if EXPORT_UPLOAD_URL:
+        url = EXPORT_UPLOAD_URL.format(setlist_id=setlist_id)
+        chunks = tee(chunks, lambda stream: upload_zip(url, stream))
     try:
-        export_files = []
-        total_steps = len(request.tracks) * len(request.formats)
-        completed = 0
-
-        # Generate files in parallel
-        if "m3u" in request.formats:
-            playlist_path = await generate_m3u(request.tracks, temp_dir)
-            export_files.append(playlist_path)
-            completed += 1
-            progress.progress = int((completed / total_steps) * 100)
-
-        # Generate subtitles for each track/language in parallel
-        if "srt" in request.formats:
-            subtitle_tasks = []
-            for track in request.tracks:
-                for lang in track.subtitles.keys():
-                    task = generate_srt(track, lang, temp_dir)
-                    subtitle_tasks.append(task)
-            
-            subtitle_files = await asyncio.gather(*subtitle_tasks)
-            export_files.extend(subtitle_files)
-            completed += len(subtitle_tasks)
-            progress.progress = int((completed / total_steps) * 100)
-
-        # Generate metadata JSON
-        if "json" in request.formats:
-            json_path = await generate_json(request.tracks, temp_dir)
-            export_files.append(json_path)
-            completed += 1
-            progress.progress = int((completed / total_steps) * 100)
-
-        # Create ZIP archive
-        zip_path = os.path.join(temp_dir, f"export_{request.setlist_id}.zip")
-        with zipfile.ZipFile(zip_path, "w") as zf:
-            for file in export_files:
-                zf.write(file, os.path.basename(file))
-
-        # Clean up individual files
-        for file in export_files:
-            os.unlink(file)
-
-        return zip_path
-
-    except Exception as e:
-        progress.status = "error"
-        progress.error = str(e)
-        raise
+        # Always cached locally so downloads can follow the export as it is written
+        await archives.store(request.setlist_id, chunks, writer)
+    finally:
+        await context.close()
+
+    return EXPORT_DOWNLOAD_URL.format(setlist_id=setlist_id)
 
 @app.post("/export")
-async def start_export(
-    request: ExportRequest,
-    background_tasks: BackgroundTasks
-):
-    """Start asynchronous export process"""
+async def start_export(request: ExportRequest):
+    """Queue an export; at most EXPORT_CONCURRENCY run at once per instance"""
+    unknown = sorted(set(request.formats) - set(FORMAT_WRITERS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported formats: {', '.join(unknown)}")
+    try:
+        export_queue.check()
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="Export queue is full, retry later")
+    # Versions keep rising across re-exports, so long-pollers holding an
+    # earlier export's version still see every update
+    previous = await status_store.get(request.setlist_id)
     progress = ExportProgress(
         setlist_id=request.setlist_id,
-        status="processing",
-        progress=0
+        status="queued",
+        progress=0,
+        version=previous["version"] if previous else 0
     )
-    EXPORT_STATUS[request.setlist_id] = progress
-
-    # Create temporary directory
-    temp_dir = tempfile.mkdtemp()
+    reporter = StatusReporter(progress)
+    await reporter.start()
+    writer = archives.begin(request.setlist_id)
 
     async def export_and_callback():
+        reporter.update(status="processing", queue_position=None)
         try:
-            zip_path = await process_export(request, temp_dir, progress)
-
-            # TODO: Upload ZIP to cloud storage
-            download_url = "https://storage.example.com/exports/..." # placeholder
-
-            # Update progress
-            progress.status = "complete"
-            progress.progress = 100
-            progress.download_url = download_url
+            download_url = await process_export(request, reporter, writer)
+            reporter.update(status="complete", progress=100, download_url=download_url)
+        except Exception as e:
+            reporter.update(status="error", error=str(e))
+            archives.end(request.setlist_id, writer, str(e))
+        await reporter.close()
 
-            # Notify callback
-            async with aiohttp.ClientSession() as session:
-                await session.post(request.callback_url, json=progress.dict())
+        # Notify callback; failing to reach it doesn't fail the export
+        try:
+            timeout = aiohttp.ClientTimeout(total=EXPORT_CALLBACK_TIMEOUT_SEC)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(request.callback_url, json=progress.dict()) as resp:
+                    resp.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Export {request.setlist_id} callback to {request.callback_url} failed: {e!r}")
 
-        except Exception as e:
-            progress.status = "error"
-            progress.error = str(e)
-            
-            # Notify callback of error
-            async with aiohttp.ClientSession() as session:
-                await session.post(request.callback_url, json=progress.dict())
-        finally:
-            # Clean up temp directory
-            import shutil
-            shutil.rmtree(temp_dir)
-
-    # Start export in background
-    background_tasks.add_task(export_and_callback)
+    try:
+        position = export_queue.submit(
+            request.setlist_id,
+            export_and_callback,
+            on_position=lambda position: reporter.update(queue_position=position),
+        )
+    except QueueFull:
+        reporter.update(status="error", error="Export queue is full")
+        archives.end(request.setlist_id, writer, progress.error)
+        await reporter.close()
+        raise HTTPException(status_code=429, detail="Export queue is full, retry later")
+    if position:
+        reporter.update(queue_position=position)
 
     return {
         "setlist_id": request.setlist_id,
-        "status": "processing"
+        "status": "queued" if position else "processing",
+        "queue_position": position or None,
     }
 
 @app.get("/export/{setlist_id}/status")
-async def get_export_status(setlist_id: str):
-    """Get export progress status"""
-    if setlist_id not in EXPORT_STATUS:
+async def get_export_status(
+    setlist_id: str,
+    version: Optional[int] = None,
+    wait: float = Query(default=0, ge=0, le=EXPORT_STATUS_MAX_WAIT_SEC),
+):
+    """Get export progress status.
+
+    With ``version`` (from a previous response) and ``wait`` seconds this
+    long-polls: it answers as soon as the status moves past that version.
+    """
+    if version is not None and wait > 0:
+        status = await status_store.wait(setlist_id, version, wait)
+    else:
+        status = await status_store.get(setlist_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return status
+
+@app.get("/export/{setlist_id}/events")
+async def export_events(setlist_id: str):
+    """Stream export status changes as server-sent events until it finishes"""
+    status = await status_store.get(setlist_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+
+    async def events():
+        current = status
+        yield f"data: {json.dumps(current)}\n\n"
+        while current["status"] not in FINISHED:
+            update = await status_store.wait(setlist_id, current["version"], EXPORT_STATUS_HEARTBEAT_SEC)
+            if update is None:
+                return  # expired
+            if update["version"] == current["version"]:
+                yield ": keep-alive\n\n"
+                continue
+            current = update
+            yield f"data: {json.dumps(current)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/exports/status/stats")
+async def export_status_stats():
+    return await status_store.stats()
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """First-to-last byte of a single "bytes=" range, None to send everything.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length <= 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+def iter_archive_file(path: str, name: str, gzip_encode: bool) -> Iterator[bytes]:
+    """Stream one entry out of a finished archive, optionally gzip encoded"""
+    with zipfile.ZipFile(path) as zf, zf.open(name) as f:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_encode else None
+        while chunk := f.read(READ_CHUNK_SIZE):
+            yield compressor.compress(chunk) if compressor else chunk
+        if compressor:
+            yield compressor.flush()
+
+def archive_names(path: str) -> List[str]:
+    with zipfile.ZipFile(path) as zf:
+        return zf.namelist()
+
+@app.get("/export/{setlist_id}/download")
+async def download_export(
+    setlist_id: str,
+    file: Optional[str] = None,
+    range_header: str | None = Header(default=None, alias="Range"),
+    if_range: str | None = Header(default=None),
+    accept_encoding: str | None = Header(default=None),
+):
+    """Download an export archive, streaming it while the export is still running.
+
+    Finished archives support range requests for resuming. ``file`` picks a
+    single entry (e.g. setlist.m3u), gzip encoded when the client accepts it.
+    """
+    writer = archives.active.get(setlist_id)
+    if writer is not None and file is None:
+        # No Content-Length, so the body goes out chunked as it is produced
+        return StreamingResponse(
+            archives.follow(writer),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{os.path.basename(writer.path)}"'},
+        )
+
+    path = archives.finished(setlist_id)
+    if path is None:
+        if writer is not None:
+            raise HTTPException(status_code=409, detail="Export still in progress")
         raise HTTPException(status_code=404, detail="Export not found")
-    return EXPORT_STATUS[setlist_id]
\ No newline at end of file
+
+    if file is not None:
+        if file not in await asyncio.to_thread(archive_names, path):
+            raise HTTPException(status_code=404, detail="File not found in export")
+        gzip_encode = "gzip" in (accept_encoding or "")
+        headers = {
+            "Content-Disposition": f'attachment; filename="{os.path.basename(file)}"',
+            "Vary": "Accept-Encoding",
+        }
+        if gzip_encode:
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(
+            iter_archive_file(path, file, gzip_encode),
+            media_type=mimetypes.guess_type(file)[0] or "text/plain",
+            headers=headers,
+        )
+
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{int(stat.st_mtime_ns):x}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{os.path.basename(path)}"',
+    }
+    # A stale validator means the archive changed: send it whole
+    if if_range is not None and if_range != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        archives.read_range(path, start, end),
+        status_code=status,
+        media_type="application/zip",
+        headers=headers,
+    )
+
+@app.get("/exports/cache/stats")
+def export_cache_stats():
+    return {"archives": archives.stats(), "entries": entry_cache.stats()}
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "queue": export_queue.stats()}
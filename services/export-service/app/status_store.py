@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+# "" or sqlite:///path for a local file, redis://host:port/db to share across instances
+EXPORT_STATUS_URL = os.getenv("EXPORT_STATUS_URL", "")
+EXPORT_STATUS_PATH = os.getenv(
+    "EXPORT_STATUS_PATH", os.path.join(tempfile.gettempdir(), "export-status.sqlite3")
+)
+# How long finished exports stay queryable
+EXPORT_STATUS_TTL_SEC = int(os.getenv("EXPORT_STATUS_TTL_SEC", "86400"))
+# Running exports not updated for this long are dropped (e.g. the instance died)
+EXPORT_STATUS_STALE_SEC = int(os.getenv("EXPORT_STATUS_STALE_SEC", "3600"))
+# Watchers re-read the store this often to see updates made by other instances
+EXPORT_STATUS_POLL_SEC = float(os.getenv("EXPORT_STATUS_POLL_SEC", "1.0"))
+
+FINISHED = ("complete", "error")
+
+
+class StatusStore(ABC):
+    """Export status records keyed by setlist id, with expiry and watching.
+
+    Records are JSON objects carrying a ``version`` the writer bumps on each
+    update. Watchers on this instance wake as soon as the record is written;
+    updates from other instances are picked up by polling.
+    """
+
+    def __init__(
+        self,
+        ttl_sec: int = EXPORT_STATUS_TTL_SEC,
+        stale_sec: int = EXPORT_STATUS_STALE_SEC,
+        poll_sec: float = EXPORT_STATUS_POLL_SEC,
+    ):
+        self.ttl_sec = ttl_sec
+        self.stale_sec = stale_sec
+        self.poll_sec = poll_sec
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._watchers: Dict[str, int] = {}
+
+    @abstractmethod
+    async def get(self, setlist_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def _save(self, setlist_id: str, payload: str, ttl_sec: int):
+        ...
+
+    async def put(self, status: Dict):
+        ttl_sec = self.ttl_sec if status["status"] in FINISHED else self.stale_sec
+        await self._save(status["setlist_id"], json.dumps(status), ttl_sec)
+        event = self._changed.pop(status["setlist_id"], None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, setlist_id: str, version: Optional[int], timeout: float) -> Optional[Dict]:
+        """Status once its version differs from ``version``, or the current
+        status after ``timeout``; finished exports return right away"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self._watchers[setlist_id] = self._watchers.get(setlist_id, 0) + 1
+        try:
+            while True:
+                # Arm before reading so a write in between is not missed
+                event = self._changed.setdefault(setlist_id, asyncio.Event())
+                status = await self.get(setlist_id)
+                if status is None or status["version"] != version or status["status"] in FINISHED:
+                    return status
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return status
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, self.poll_sec))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._watchers[setlist_id] -= 1
+            if not self._watchers[setlist_id]:
+                del self._watchers[setlist_id]
+                self._changed.pop(setlist_id, None)
+
+    async def stats(self) -> Dict:
+        return {"watched": len(self._watchers), "ttl_sec": self.ttl_sec}
+
+
+class SQLiteStatusStore(StatusStore):
+    """Status records in a local SQLite file, shared by workers on one host.
+
+    Queries and commits run in worker threads, off the event loop.
+    """
+
+    PRUNE_INTERVAL_SEC = 60
+
+    def __init__(self, path: str = EXPORT_STATUS_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Readers don't block the writer
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS export_status (
+                setlist_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_expires_at ON export_status(expires_at)"
+        )
+        self._conn.commit()
+        self._pruned_at = 0.0
+
+    async def get(self, setlist_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._get, setlist_id)
+
+    def _get(self, setlist_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM export_status WHERE setlist_id = ? AND expires_at > ?",
+                (setlist_id, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def _save(self, setlist_id: str, payload: str, ttl_sec: int):
+        await asyncio.to_thread(self._write, setlist_id, payload, ttl_sec)
+
+    def _write(self, setlist_id: str, payload: str, ttl_sec: int):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO export_status VALUES (?, ?, ?)",
+                (setlist_id, payload, now + ttl_sec),
+            )
+            if now - self._pruned_at > self.PRUNE_INTERVAL_SEC:
+                self._conn.execute("DELETE FROM export_status WHERE expires_at <= ?", (now,))
+                self._pruned_at = now
+            self._conn.commit()
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM export_status WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+    async def stats(self) -> Dict:
+        entries = await asyncio.to_thread(self._count)
+        return {**await super().stats(), "backend": "sqlite", "entries": entries}
+
+
+class RedisStatusStore(StatusStore):
+    """Status records in Redis, visible to every export-service instance;
+    expiry is left to Redis key TTLs"""
+
+    def __init__(self, url: str, prefix: str = "export-status:", **kwargs):
+        super().__init__(**kwargs)
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, setlist_id: str) -> Optional[Dict]:
+        payload = await self._redis.get(self.prefix + setlist_id)
+        return json.loads(payload) if payload else None
+
+    async def _save(self, setlist_id: str, payload: str, ttl_sec: int):
+        await self._redis.set(self.prefix + setlist_id, payload, ex=ttl_sec)
+
+    async def stats(self) -> Dict:
+        return {**await super().stats(), "backend": "redis"}
+
+
+def create_status_store(url: str = EXPORT_STATUS_URL) -> StatusStore:
+    if url.startswith(("redis://", "rediss://")):
+        return RedisStatusStore(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteStatusStore(url[len("sqlite:///"):])
+    if url:
+        raise ValueError(f"Unsupported EXPORT_STATUS_URL: {url}")
+    return SQLiteStatusStore()
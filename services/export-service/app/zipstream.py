@@ -0,0 +1,312 @@
+import asyncio
+import io
+import itertools
+import os
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Deque, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Bytes buffered before a chunk is handed to the destination
+ZIP_CHUNK_SIZE = int(os.getenv("ZIP_CHUNK_SIZE", str(64 * 1024)))
+# Chunks queued between the ZIP thread and the destination
+ZIP_QUEUE_CHUNKS = int(os.getenv("ZIP_QUEUE_CHUNKS", "16"))
+ZIP_COMPRESSLEVEL = int(os.getenv("ZIP_COMPRESSLEVEL", "6"))
+# Threads rendering and compressing entries ahead of the writer, shared by all exports
+ZIP_WORKERS = int(os.getenv("ZIP_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Entries bigger than this are streamed by the writer instead of held in memory
+ZIP_ENTRY_MAX_BYTES = int(os.getenv("ZIP_ENTRY_MAX_BYTES", str(8 * 1024 * 1024)))
+
+Content = Iterable[Union[str, bytes]]
+Entry = Tuple[str, Content]
+# An entry with its cache key, or a function computing it off the event loop
+KeyedEntry = Tuple[str, Content, Union[str, Callable[[], str]]]
+
+render_pool = ThreadPoolExecutor(max_workers=ZIP_WORKERS, thread_name_prefix="zip-render")
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable buffer that zipfile writes into and we drain.
+
+    Without tell/seek zipfile switches to streaming mode: sizes and CRCs go
+    into data descriptors after each entry instead of being patched into the
+    local headers, so nothing already emitted has to be revisited.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+class Stored:
+    """Content written uncompressed (e.g. audio, already compressed) and
+    streamed straight through, never rendered ahead into memory"""
+
+    def __init__(self, content: Content):
+        self.content = content
+
+    def __iter__(self):
+        return iter(self.content)
+
+
+class RawEntry:
+    """An entry already rendered and compressed, copied into archives as is"""
+
+    __slots__ = ("name", "data", "crc", "size", "compress_type")
+
+    def __init__(self, name: str, data: bytes, crc: int, size: int, compress_type: int):
+        self.name = name
+        self.data = data
+        self.crc = crc
+        self.size = size
+        self.compress_type = compress_type
+
+
+def render_entry(
+    name: str,
+    content: Content,
+    compression: int = zipfile.ZIP_DEFLATED,
+    compresslevel: int = ZIP_COMPRESSLEVEL,
+    max_bytes: int = ZIP_ENTRY_MAX_BYTES,
+    key: Union[None, str, Callable[[], str]] = None,
+    cache=None,
+) -> Union[RawEntry, Entry]:
+    """Render and compress one entry in memory.
+
+    With a ``key`` (or a function computing it, run here off the event
+    loop) and a cache, a cached entry is reused without rendering and a
+    fresh one is stored. Content over ``max_bytes`` comes back as a (name,
+    content) pair, with the pieces read so far put back in front, for the
+    writer to stream.
+    """
+    cache_key = None
+    if key is not None and cache is not None:
+        cache_key = f"{compression}:{compresslevel}:{key() if callable(key) else key}"
+        hit = cache.get(cache_key)
+        if hit is not None:
+            return RawEntry(name, *hit, compression)
+
+    pieces: List[bytes] = []
+    size = 0
+    content = iter(content)
+    for piece in content:
+        if isinstance(piece, str):
+            piece = piece.encode("utf-8")
+        pieces.append(piece)
+        size += len(piece)
+        if size > max_bytes:
+            return name, itertools.chain(pieces, content)
+    data = b"".join(pieces)
+    crc = zlib.crc32(data)
+    if compression == zipfile.ZIP_DEFLATED:
+        # zlib releases the GIL, so entries compress in parallel across threads
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress(data) + compressor.flush()
+    if cache_key:
+        cache.put(cache_key, data, crc, size)
+    return RawEntry(name, data, crc, size, compression)
+
+
+def write_raw(zf: zipfile.ZipFile, entry: RawEntry):
+    """Append a precompressed entry; CRC and sizes are known, so the local
+    header is final and no data descriptor is needed"""
+    info = zipfile.ZipInfo(entry.name, date_time=time.localtime()[:6])
+    info.compress_type = entry.compress_type
+    info.CRC = entry.crc
+    info.file_size = entry.size
+    info.compress_size = len(entry.data)
+    info.header_offset = zf.fp.tell()
+    zf.fp.write(info.FileHeader())
+    zf.fp.write(entry.data)
+    zf.filelist.append(info)
+    zf.NameToInfo[info.filename] = info
+    zf.start_dir = zf.fp.tell()
+
+
+def iter_rendered(
+    entries: Iterable[Union[Entry, KeyedEntry]],
+    compression: int,
+    compresslevel: int,
+    workers: int = ZIP_WORKERS,
+    cache=None,
+) -> Iterator[Union[RawEntry, Entry]]:
+    """Render entries on the shared pool a few ahead of the writer, in order.
+
+    Entries are (name, content) or (name, content, cache key).
+    """
+    pending: Deque = deque()
+    try:
+        for name, content, *key in entries:
+            if isinstance(content, Stored):
+                passthrough = Future()
+                passthrough.set_result((name, content))
+                pending.append(passthrough)
+            else:
+                pending.append(render_pool.submit(
+                    render_entry, name, content, compression, compresslevel,
+                    ZIP_ENTRY_MAX_BYTES, key[0] if key else None, cache,
+                ))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if cache is not None:
+            cache.flush()
+
+
+def iter_zip(
+    entries: Iterable[Union[Entry, KeyedEntry]],
+    compression: int = zipfile.ZIP_DEFLATED,
+    compresslevel: int = ZIP_COMPRESSLEVEL,
+    on_entry: Optional[Callable[[str], None]] = None,
+    workers: int = ZIP_WORKERS,
+    cache=None,
+) -> Iterator[bytes]:
+    """Build a ZIP archive from (name, content pieces) pairs, yielding it in chunks.
+
+    With more than one worker or an entry cache, entries are rendered and
+    compressed ahead of the writer and copied in as raw data; anything over
+    ZIP_ENTRY_MAX_BYTES is consumed lazily and never held in full, so
+    memory stays bounded regardless of archive size.
+    """
+    if (workers > 1 or cache is not None) and compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        entries = iter_rendered(entries, compression, compresslevel, workers, cache)
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=compression, compresslevel=compresslevel) as zf:
+        for entry in entries:
+            if isinstance(entry, RawEntry):
+                write_raw(zf, entry)
+                if on_entry:
+                    on_entry(entry.name)
+                if sink.size >= ZIP_CHUNK_SIZE:
+                    yield sink.drain()
+                continue
+
+            name, content = entry[:2]
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            stored = isinstance(content, Stored)
+            info.compress_type = zipfile.ZIP_STORED if stored else compression
+            # Sizes of streamed audio are unknown up front; allow it past 2 GiB
+            with zf.open(info, "w", force_zip64=stored) as f:
+                pending: List[bytes] = []
+                pending_size = 0
+                for piece in content:
+                    if isinstance(piece, str):
+                        piece = piece.encode("utf-8")
+                    pending.append(piece)
+                    pending_size += len(piece)
+                    # Batch small pieces so the compressor sees large writes
+                    if pending_size >= ZIP_CHUNK_SIZE:
+                        f.write(b"".join(pending))
+                        pending, pending_size = [], 0
+                        if sink.size >= ZIP_CHUNK_SIZE:
+                            yield sink.drain()
+                if pending:
+                    f.write(b"".join(pending))
+            if on_entry:
+                on_entry(name)
+            if sink.size >= ZIP_CHUNK_SIZE:
+                yield sink.drain()
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+async def stream_zip(
+    entries: Iterable[Union[Entry, KeyedEntry]],
+    on_entry: Optional[Callable[[str], None]] = None,
+    queue_size: int = ZIP_QUEUE_CHUNKS,
+    **kwargs,
+) -> AsyncIterator[bytes]:
+    """Async ZIP stream: compression runs in a worker thread and a bounded
+    queue applies backpressure from the destination"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(queue_size)
+    finished = object()
+    stopped = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        callback = (lambda name: loop.call_soon_threadsafe(on_entry, name)) if on_entry else None
+        try:
+            for chunk in iter_zip(entries, on_entry=callback, **kwargs):
+                if stopped.is_set():
+                    return
+                put(chunk)
+            item = finished
+        except Exception as e:
+            item = e
+        if not stopped.is_set():
+            put(item)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        # Unblock a producer waiting on a full queue so the thread can exit
+        while not queue.empty():
+            queue.get_nowait()
+        await producer
+
+
+async def tee(
+    chunks: AsyncIterator[bytes],
+    consumer: Callable[[AsyncIterator[bytes]], Awaitable[None]],
+    queue_size: int = ZIP_QUEUE_CHUNKS,
+) -> AsyncIterator[bytes]:
+    """Pass a stream through while also feeding it to ``consumer`` (e.g. an
+    upload); the slower of the two sets the pace and consumer errors propagate"""
+    queue: asyncio.Queue = asyncio.Queue(queue_size)
+    finished = object()
+
+    async def side_stream():
+        while True:
+            item = await queue.get()
+            if item is finished:
+                return
+            yield item
+
+    side = asyncio.create_task(consumer(side_stream()))
+    try:
+        async for chunk in chunks:
+            put = asyncio.create_task(queue.put(chunk))
+            await asyncio.wait({put, side}, return_when=asyncio.FIRST_COMPLETED)
+            if not put.done():
+                put.cancel()
+                side.result()  # consumer finished early: raise its error
+                raise RuntimeError("Stream consumer stopped before the end of the stream")
+            yield chunk
+        await queue.put(finished)
+        await side
+    finally:
+        if not side.done():
+            side.cancel()
@@ -0,0 +1,484 @@
+"""Benchmark and soak runner for export-service.
+
+Run it from the service directory:
+
+    python -m tools.export_bench --tracks 10,100 --languages 1,4 --segments 200
+    python -m tools.export_bench --tracks 50 --duration 1800 --output soak.json
+    python -m tools.export_bench --tracks 10,100 --compare baseline.json
+
+Every combination of --tracks, --languages and --segments is a scenario.
+Each scenario runs in a fresh interpreter with its own export directory,
+entry cache and status store, so results do not leak into one another.
+The service runs in that interpreter under uvicorn. It posts its callbacks
+to a local sink, which also serves synthetic audio for the "audio" format
+and accepts uploads with --upload. Latency is measured from submitting an
+export to receiving its callback. 429 responses are retried and counted.
+
+For each scenario the runner records:
+- throughput in exports/s and archive MB/s
+- p50/p99 latency
+- peak RSS and RSS growth
+- peak disk use of the work directory
+- event-loop blocking: the total and longest stalls of a 10 ms ticker
+  beyond BLOCK_THRESHOLD_MS
+
+With --duration, exports are submitted until the time is up and the RSS
+trend is reported, to catch leaks. --compare matches scenarios against an
+earlier --output file and exits non-zero when any metric regresses by more
+than --threshold percent.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Event-loop stalls shorter than this are scheduling noise
+BLOCK_THRESHOLD_MS = 5
+TICK_SEC = 0.01
+DISK_SAMPLE_SEC = 0.25
+RSS_SAMPLE_SEC = 1.0
+
+# Metrics compared against a baseline, and whether bigger is better
+COMPARED = {
+    "exports_per_sec": True,
+    "mb_per_sec": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+    "peak_rss_mb": False,
+    "peak_disk_mb": False,
+    "loop_blocked_ms": False,
+    "loop_max_block_ms": False,
+}
+
+WORDS = (
+    "night city light dream fire heart rain gold wave shadow echo river "
+    "signal glass storm silver ocean pulse drift horizon velvet static"
+).split()
+KEYS = ["C major", "A minor", "G major", "E minor", "D major", "B minor", "F major", "D minor"]
+LANGUAGES = ["en", "fr", "es", "de", "it", "pt", "ja", "ko"]
+
+
+def srt_time(seconds: float) -> str:
+    ms = int(seconds * 1000)
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def synth_request(
+    setlist_id: str, tracks: int, languages: int, segments: int,
+    formats: List[str], audio_url: str, seed: int, callback_url: str,
+) -> Dict:
+    """An ExportRequest payload shaped like the analyzer's output"""
+    rnd = random.Random(seed)
+    text = lambda n: " ".join(rnd.choices(WORDS, k=n))
+    payload_tracks = []
+    for i in range(tracks):
+        duration = rnd.uniform(180, 420)
+        payload_tracks.append({
+            "track_id": f"track-{seed}-{i}",
+            "storage_url": f"{audio_url}/{seed}-{i}.mp3",
+            "metadata": {
+                "title": text(3).title(),
+                "artist": text(2).title(),
+                "duration_sec": duration,
+                "bpm": rnd.uniform(90, 140),
+                "key": rnd.choice(KEYS),
+                "energy": rnd.random(),
+                "genre": rnd.choice(["house", "techno", "pop", "ambient"]),
+                "mixing": {
+                    "cue_points": sorted(rnd.uniform(0, duration) for _ in range(8)),
+                    "mix_in_start": 0.0,
+                    "mix_out_end": duration - 30,
+                },
+            },
+            "subtitles": {
+                lang: [
+                    {
+                        "start": srt_time(j * duration / segments),
+                        "end": srt_time((j + 1) * duration / segments),
+                        "text": text(rnd.randint(4, 12)),
+                    }
+                    for j in range(segments)
+                ]
+                for lang in LANGUAGES[:languages]
+            },
+        })
+    return {
+        "setlist_id": setlist_id,
+        "tracks": payload_tracks,
+        "formats": formats,
+        "callback_url": callback_url,
+    }
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def disk_bytes(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed while walking
+    return total
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Monitor:
+    """Samples event-loop stalls, RSS and work directory size while exports run"""
+
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.blocked = 0.0
+        self.max_block = 0.0
+        self.peak_rss = rss_bytes() or 0
+        self.peak_disk = 0
+        self.rss_samples: List[List[float]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._started = 0.0
+
+    async def _ticker(self):
+        loop = asyncio.get_running_loop()
+        last_rss = 0.0
+        while True:
+            before = loop.time()
+            await asyncio.sleep(TICK_SEC)
+            now = loop.time()
+            lag = now - before - TICK_SEC
+            if lag * 1000 >= BLOCK_THRESHOLD_MS:
+                self.blocked += lag
+                self.max_block = max(self.max_block, lag)
+            rss = rss_bytes() or 0
+            self.peak_rss = max(self.peak_rss, rss)
+            if now - last_rss >= RSS_SAMPLE_SEC:
+                self.rss_samples.append([round(now - self._started, 1), rss])
+                last_rss = now
+
+    async def _disk(self):
+        while True:
+            self.peak_disk = max(self.peak_disk, await asyncio.to_thread(disk_bytes, self.workdir))
+            await asyncio.sleep(DISK_SAMPLE_SEC)
+
+    def start(self):
+        self._started = asyncio.get_running_loop().time()
+        self._tasks = [asyncio.create_task(self._ticker()), asyncio.create_task(self._disk())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def start_sink(audio_bytes: int, callbacks: Dict[str, asyncio.Future], uploaded: List[int]):
+    """Callback, audio and upload endpoints for the service under test"""
+    from aiohttp import web
+
+    audio = random.Random(0).randbytes(audio_bytes)
+
+    async def callback(request: web.Request):
+        data = await request.json()
+        future = callbacks.get(data["setlist_id"])
+        if future is not None and not future.done():
+            future.set_result((asyncio.get_running_loop().time(), data))
+        return web.Response()
+
+    async def get_audio(request: web.Request):
+        return web.Response(body=audio, content_type="audio/mpeg")
+
+    async def upload(request: web.Request):
+        async for chunk in request.content.iter_chunked(64 * 1024):
+            uploaded[0] += len(chunk)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post("/callback", callback)
+    app.router.add_get("/audio/{name}", get_audio)
+    app.router.add_put("/upload/{setlist_id}", upload)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def run_scenario(scenario: Dict) -> Dict:
+    """Run one scenario against the service in this process"""
+    import aiohttp
+    import uvicorn
+
+    callbacks: Dict[str, asyncio.Future] = {}
+    uploaded = [0]
+    sink, sink_url = await start_sink(scenario["audio_kb"] * 1024, callbacks, uploaded)
+    if scenario["upload"]:
+        os.environ["EXPORT_UPLOAD_URL"] = sink_url + "/upload/{setlist_id}"
+
+    # Settings are read at import, so the service is imported once the sink is up
+    from app import main as service
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(service.app, log_level="warning", access_log=False))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+    base_url = "http://127.0.0.1:%d" % sock.getsockname()[1]
+
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+    archive_bytes = 0
+    counters = {"completed": 0, "failed": 0, "rejected": 0}
+    deadline = loop.time() + scenario["duration"] if scenario["duration"] else None
+    sequence = itertools.count()
+    errors: List[str] = []
+
+    def next_payload() -> Optional[Tuple[str, bytes]]:
+        n = next(sequence)
+        if deadline is None and n >= scenario["exports"]:
+            return None
+        if deadline is not None and loop.time() >= deadline:
+            return None
+        seed = 0 if scenario["same_content"] else n
+        setlist_id = f"bench-{n}"
+        payload = synth_request(
+            setlist_id, scenario["tracks"], scenario["languages"], scenario["segments"],
+            scenario["formats"], sink_url + "/audio", seed, sink_url + "/callback",
+        )
+        return setlist_id, json.dumps(payload).encode()
+
+    async def client(session: aiohttp.ClientSession):
+        nonlocal archive_bytes
+        while True:
+            # Payloads are built before the clock starts so client work isn't billed to the service
+            payload = await asyncio.to_thread(next_payload)
+            if payload is None:
+                return
+            setlist_id, body = payload
+            done = loop.create_future()
+            callbacks[setlist_id] = done
+            submitted = loop.time()
+            while True:
+                async with session.post(base_url + "/export", data=body, headers={"Content-Type": "application/json"}) as resp:
+                    if resp.status != 429:
+                        resp.raise_for_status()
+                        break
+                counters["rejected"] += 1
+                await asyncio.sleep(0.5)
+            received, status = await asyncio.wait_for(done, scenario["timeout"])
+            del callbacks[setlist_id]
+            if status["status"] == "complete":
+                counters["completed"] += 1
+                latencies.append(received - submitted)
+                try:
+                    archive_bytes += os.path.getsize(service.archives.path(setlist_id))
+                except OSError:
+                    pass  # already evicted
+            else:
+                counters["failed"] += 1
+                errors.append(status.get("error") or "unknown error")
+
+    monitor = Monitor(scenario["workdir"])
+    baseline_rss = rss_bytes() or 0
+    monitor.start()
+    started = loop.time()
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        await asyncio.gather(*(client(session) for _ in range(scenario["concurrency"])))
+    wall = loop.time() - started
+    await monitor.stop()
+
+    server.should_exit = True
+    await serving
+    await sink.cleanup()
+
+    mb = 1024 * 1024
+    samples = monitor.rss_samples
+    # RSS slope over the second half of a soak: warm-up allocations excluded
+    tail = samples[len(samples) // 2:]
+    slope = None
+    if len(tail) >= 2 and tail[-1][0] > tail[0][0]:
+        slope = (tail[-1][1] - tail[0][1]) / mb / (tail[-1][0] - tail[0][0]) * 3600
+    exports = counters["completed"]
+    return {
+        "scenario": {k: scenario[k] for k in SCENARIO_KEYS},
+        **counters,
+        "errors": sorted(set(errors))[:5],
+        "wall_sec": round(wall, 3),
+        "exports_per_sec": round(exports / wall, 3) if wall else None,
+        "mb_per_sec": round(archive_bytes / mb / wall, 3) if wall else None,
+        "archive_mb": round(archive_bytes / mb / exports, 3) if exports else None,
+        "uploaded_mb": round(uploaded[0] / mb, 3),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "latency_max_ms": round(max(latencies) * 1000, 1) if latencies else None,
+        "peak_rss_mb": round(monitor.peak_rss / mb, 1),
+        "rss_growth_mb": round((monitor.peak_rss - baseline_rss) / mb, 1),
+        "rss_slope_mb_per_hour": round(slope, 2) if slope is not None else None,
+        "peak_disk_mb": round(monitor.peak_disk / mb, 2),
+        "loop_blocked_ms": round(monitor.blocked * 1000, 1),
+        "loop_max_block_ms": round(monitor.max_block * 1000, 1),
+        "entry_cache": service.entry_cache.stats(),
+        "rss_samples": samples if scenario["duration"] else [],
+    }
+
+
+SCENARIO_KEYS = (
+    "tracks", "languages", "segments", "formats", "exports", "concurrency",
+    "duration", "same_content", "upload", "audio_kb",
+)
+
+
+def scenario_id(scenario: Dict) -> str:
+    return (
+        f"tracks={scenario['tracks']} languages={scenario['languages']} segments={scenario['segments']} "
+        f"formats={','.join(scenario['formats'])} concurrency={scenario['concurrency']}"
+    )
+
+
+def run_child(scenario: Dict, python: str) -> Dict:
+    """Run a scenario in a fresh interpreter with its own work directory"""
+    service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory(prefix="export-bench-") as workdir:
+        scenario = {**scenario, "workdir": workdir}
+        env = {
+            **os.environ,
+            "EXPORT_DIR": os.path.join(workdir, "exports"),
+            "EXPORT_ENTRY_CACHE_PATH": os.path.join(workdir, "entries.sqlite3"),
+            "EXPORT_STATUS_URL": "sqlite:///" + os.path.join(workdir, "status.sqlite3"),
+            "EXPORT_UPLOAD_URL": "",
+        }
+        proc = subprocess.run(
+            [python, "-m", "tools.export_bench", "--child", json.dumps(scenario)],
+            cwd=service_dir, env=env, stdout=subprocess.PIPE, check=True,
+        )
+    return json.loads(proc.stdout.decode().strip().splitlines()[-1])
+
+
+def print_result(result: Dict):
+    print(scenario_id(result["scenario"]))
+    print(
+        f"  {result['completed']} ok, {result['failed']} failed, {result['rejected']} rejected "
+        f"in {result['wall_sec']}s: {result['exports_per_sec']} exports/s, {result['mb_per_sec']} MB/s "
+        f"({result['archive_mb']} MB/archive)"
+    )
+    print(
+        f"  latency p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms, "
+        f"max {result['latency_max_ms']} ms"
+    )
+    print(
+        f"  peak RSS {result['peak_rss_mb']} MB (+{result['rss_growth_mb']} MB), "
+        f"peak disk {result['peak_disk_mb']} MB, loop blocked {result['loop_blocked_ms']} ms "
+        f"(longest {result['loop_max_block_ms']} ms)"
+    )
+    if result["scenario"]["upload"]:
+        print(f"  uploaded {result['uploaded_mb']} MB")
+    if result["rss_slope_mb_per_hour"] is not None:
+        print(f"  RSS trend {result['rss_slope_mb_per_hour']} MB/hour")
+    for error in result["errors"]:
+        print(f"  error: {error}")
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> bool:
+    """Print changes against a baseline run; False if anything regressed"""
+    with open(baseline_path) as f:
+        baseline = {scenario_id(r["scenario"]): r for r in json.load(f)["results"]}
+    ok = True
+    print(f"\nAgainst {baseline_path} (regression threshold {threshold}%):")
+    for result in results:
+        key = scenario_id(result["scenario"])
+        before = baseline.get(key)
+        if before is None:
+            print(f"{key}\n  not in baseline")
+            continue
+        print(key)
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            regressed = (-change if higher_is_better else change) > threshold
+            ok = ok and not regressed
+            print(f"  {metric:<20} {old:>10} -> {new:<10} {change:+.1f}%{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int_list, default=[10], help="comma separated track counts")
+    parser.add_argument("--languages", type=int_list, default=[2], help="subtitle languages per track")
+    parser.add_argument("--segments", type=int_list, default=[200], help="subtitle segments per language")
+    parser.add_argument("--formats", default="m3u,srt,json")
+    parser.add_argument("--exports", type=int, default=20, help="exports per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="exports submitted at once")
+    parser.add_argument("--duration", type=float, default=0, help="soak: submit for this many seconds instead")
+    parser.add_argument("--same-content", action="store_true", help="resubmit identical setlists (warm entry cache)")
+    parser.add_argument("--upload", action="store_true", help="also stream archives to a local upload sink")
+    parser.add_argument("--audio-kb", type=int, default=4096, help="size of each synthetic audio file")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for one export")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --output")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = asyncio.run(run_scenario(json.loads(args.child)))
+        print(json.dumps(result))
+        return
+
+    results = []
+    for tracks, languages, segments in itertools.product(args.tracks, args.languages, args.segments):
+        scenario = {
+            "tracks": tracks,
+            "languages": languages,
+            "segments": segments,
+            "formats": args.formats.split(","),
+            "exports": args.exports,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "same_content": args.same_content,
+            "upload": args.upload,
+            "audio_kb": args.audio_kb,
+            "timeout": args.timeout,
+        }
+        result = run_child(scenario, sys.executable)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        ).stdout.strip()
+        with open(args.output, "w") as f:
+            json.dump({"revision": revision, "created_at": time.time(), "results": results}, f, indent=2)
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Coroutine, Dict, Optional, Set, Tuple
+
+ARC_CACHE_TTL_SEC = float(os.getenv("ARC_CACHE_TTL_SEC", "3600"))
+ARC_CACHE_MAX_ENTRIES = int(os.getenv("ARC_CACHE_MAX_ENTRIES", "1024"))
+
+
+def canonical_key(payload) -> str:
+    """Stable hash of a JSON-serializable payload"""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ArcCache:
+    """In-memory arc responses with TTL and LRU eviction, plus single-flight.
+
+    Identical requests that arrive while one is being computed wait for
+    that computation instead of starting their own. Everything runs on the
+    event loop, so no lock is needed.
+    """
+
+    def __init__(self, ttl: float = ARC_CACHE_TTL_SEC, max_entries: int = ARC_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Computations outliving the request that started them
+        self._detached: Set[asyncio.Task] = set()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Dict):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def lookup(self, key: str) -> Tuple[Optional[Dict], Optional[asyncio.Future]]:
+        """Cached value, else the future of an identical request in flight"""
+        value = self.get(key)
+        if value is not None:
+            self.counters["hits"] += 1
+            return value, None
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            return None, future
+        self.counters["misses"] += 1
+        return None, None
+
+    def begin(self, key: str) -> asyncio.Future:
+        """Register the caller as the one computing ``key``"""
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't warn about an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+    def finish(self, key: str, future: asyncio.Future, value: Optional[Dict] = None,
+               error: Optional[BaseException] = None):
+        """Store the result (or error) and release everyone waiting on it"""
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            self.put(key, value)
+            future.set_result(value)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Dict]],
+        refresh: bool = False,
+    ) -> Tuple[Dict, bool]:
+        """Return (value, served_from_cache); ``refresh`` skips the lookup"""
+        if not refresh:
+            value, pending = self.lookup(key)
+            if value is not None:
+                return value, True
+            if pending is not None:
+                return await asyncio.shield(pending), True
+
+        future = self.begin(key)
+
+        async def run() -> Dict:
+            try:
+                value = await compute()
+            except Exception as e:
+                self.finish(key, future, error=e)
+                raise
+            self.finish(key, future, value)
+            return value
+
+        # A cancelled caller leaves the computation running for the
+        # requests coalesced onto it
+        return await asyncio.shield(self.detach(run())), False
+
+    def detach(self, coro: Coroutine) -> asyncio.Task:
+        """Run ``coro`` to completion even if its caller goes away"""
+        task = asyncio.create_task(coro)
+        self._detached.add(task)
+        task.add_done_callback(self._detached.discard)
+        # Its caller may be gone; don't warn about an unretrieved exception
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "hit_rate": (self.counters["hits"] + self.counters["coalesced"]) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "max_entries": self.max_entries,
+            "ttl_sec": self.ttl,
+        }
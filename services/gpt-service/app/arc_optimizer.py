@@ -0,0 +1,229 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from .template_registry import CompiledTemplate, stage_vectors
+from .templates import ArcTemplate
+from .transitions import transition_costs
+
+# Weights of the stage-fit terms; transition weights live in transitions.py
+ENERGY_WEIGHT = 1.0
+BPM_WEIGHT = 1.0
+MOOD_WEIGHT = 0.5
+
+# BPM distance outside a stage range, as a fraction of the range centre,
+# that costs as much as a full energy mismatch
+BPM_TOLERANCE = 0.05
+MAX_SWAP_ROUNDS = 200
+
+
+class ArcPlan:
+    """Result of ordering a track pool against a template"""
+
+    def __init__(self, order: List[int], stages: List[int], cost: float):
+        self.order = order      # indices into the input tracks, in play order
+        self.stages = stages    # stage index for each position in ``order``
+        self.cost = cost
+
+
+def stage_targets(template: ArcTemplate):
+    """Per-stage target arrays, precompiled for registry templates"""
+    if isinstance(template, CompiledTemplate):
+        return template.energy, template.bpm_low, template.bpm_high, template.mood
+    return stage_vectors(template)
+
+
+def stage_fit_costs(
+    template: ArcTemplate,
+    bpm: np.ndarray,
+    energy: np.ndarray,
+    mood: np.ndarray,
+) -> np.ndarray:
+    """Cost of playing each track (rows) in each template stage (columns)"""
+    target_energy, bpm_low, bpm_high, target_mood = stage_targets(template)
+
+    fit = ENERGY_WEIGHT * np.abs(energy[:, None] - target_energy[None, :])
+
+    below = np.maximum(bpm_low[None, :] - bpm[:, None], 0)
+    above = np.maximum(bpm[:, None] - bpm_high[None, :], 0)
+    centre = np.maximum((bpm_low + bpm_high) / 2, 1.0)
+    out_of_range = (below + above) / (BPM_TOLERANCE * centre[None, :])
+    has_range = bpm_high[None, :] > 0
+    fit += BPM_WEIGHT * np.where(has_range, np.minimum(out_of_range, 3.0), 0.0)
+
+    # Tracks or stages without mood information contribute nothing here
+    mood_dist = np.linalg.norm(mood[:, None, :] - target_mood[None, :, :], axis=2)
+    fit += MOOD_WEIGHT * np.nan_to_num(mood_dist, nan=0.0)
+    return fit
+
+
+def stage_sizes(n_tracks: int, n_stages: int) -> np.ndarray:
+    """Split the pool as evenly as possible over the stages"""
+    sizes = np.full(n_stages, n_tracks // n_stages)
+    sizes[:n_tracks % n_stages] += 1
+    return sizes
+
+
+def _path_cost(seq: np.ndarray, slot_stage: np.ndarray, fit: np.ndarray, trans: np.ndarray) -> float:
+    total = fit[seq, slot_stage].sum()
+    if len(seq) > 1:
+        total += trans[seq[:-1], seq[1:]].sum()
+    return float(total)
+
+
+def _two_opt(seq: np.ndarray, start: int, end: int, trans: np.ndarray) -> bool:
+    """Reverse sub-paths inside [start, end) while that shortens the path.
+
+    Stage membership is unchanged by the reversal, so only the two edges at
+    its ends matter.
+    """
+    improved = False
+    n = len(seq)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(start, end - 1):
+            j = np.arange(i + 1, end)
+            prev = seq[i - 1] if i > 0 else -1
+            nxt = np.where(j + 1 < n, seq[np.minimum(j + 1, n - 1)], -1)
+
+            before = np.where(prev >= 0, trans[prev, seq[i]], 0.0) + \
+                np.where(nxt >= 0, trans[seq[j], nxt], 0.0)
+            after = np.where(prev >= 0, trans[prev, seq[j]], 0.0) + \
+                np.where(nxt >= 0, trans[seq[i], nxt], 0.0)
+            delta = after - before
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                seq[i:j[best] + 1] = seq[i:j[best] + 1][::-1].copy()
+                changed = improved = True
+    return improved
+
+
+def _best_swap(seq: np.ndarray, slot_stage: np.ndarray, fit: np.ndarray, trans: np.ndarray) -> bool:
+    """Apply the single best improving swap of two non-adjacent positions"""
+    n = len(seq)
+    if n < 3:
+        return False
+
+    # cost_at[p, t]: fit plus incident transitions if track t sat at position p
+    pad = np.zeros(trans.shape[0] + 1)
+    trans_pad = np.vstack([np.column_stack([trans, pad[:-1]]), pad])  # index -1 = no neighbour
+    prev = np.concatenate([[-1], seq[:-1]])
+    nxt = np.concatenate([seq[1:], [-1]])
+    cost_at = fit[:, slot_stage].T + trans_pad[prev, :-1] + trans_pad[:-1, nxt].T
+
+    current = cost_at[np.arange(n), seq]
+    delta = cost_at[:, seq] + cost_at[:, seq].T - current[:, None] - current[None, :]
+
+    # Adjacent swaps share an edge the formula double counts; 2-opt covers them
+    idx = np.arange(n)
+    delta[np.abs(idx[:, None] - idx[None, :]) <= 1] = np.inf
+    p, q = np.unravel_index(int(np.argmin(delta)), delta.shape)
+    if delta[p, q] >= -1e-9:
+        return False
+    seq[p], seq[q] = seq[q], seq[p]
+    return True
+
+
+def optimize_arc(
+    template: ArcTemplate,
+    bpm: Sequence[float],
+    energy: Sequence[float],
+    keys: Sequence[Optional[str]],
+    mood: Optional[np.ndarray] = None,
+    trans: Optional[np.ndarray] = None,
+) -> ArcPlan:
+    """Assign tracks to template stages and order them for smooth mixing.
+
+    1. Tracks are assigned to stage slots by minimum-cost assignment over
+       energy, BPM range and mood fit.
+    2. Each stage is ordered by nearest-neighbour chaining on the transition
+       cost and refined with 2-opt.
+    3. Swaps across the whole set trade stage fit against transitions until
+       no swap improves the total.
+
+    ``trans`` may be a precomputed transition matrix for the tracks in input
+    order (see transitions.TransitionCache). Fully deterministic: the same
+    input always yields the same order.
+    """
+    bpm = np.asarray(bpm, dtype=float)
+    energy = np.asarray(energy, dtype=float)
+    n = len(bpm)
+    if mood is None:
+        mood = np.full((n, 2), np.nan)
+    if n == 0:
+        return ArcPlan([], [], 0.0)
+
+    fit = stage_fit_costs(template, bpm, energy, mood)
+    if trans is None:
+        trans = transition_costs(bpm, energy, keys)
+
+    # Expand stages into one slot per track and solve the assignment
+    sizes = stage_sizes(n, len(template.stages))
+    slot_stage = np.repeat(np.arange(len(sizes)), sizes)
+    rows, cols = linear_sum_assignment(fit[:, slot_stage])
+    track_stage = np.empty(n, dtype=int)
+    track_stage[rows] = slot_stage[cols]
+
+    # Chain each stage greedily, starting next to where the last one ended
+    seq = []
+    for stage in range(len(sizes)):
+        members = list(np.flatnonzero(track_stage == stage))
+        while members:
+            if seq:
+                costs = trans[seq[-1], members]
+            else:
+                costs = fit[members, stage]
+            seq.append(members.pop(int(np.argmin(costs))))
+    seq = np.array(seq)
+
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+    for _ in range(MAX_SWAP_ROUNDS):
+        for stage in range(len(sizes)):
+            _two_opt(seq, bounds[stage], bounds[stage + 1], trans)
+        if not _best_swap(seq, slot_stage, fit, trans):
+            break
+
+    return ArcPlan(
+        order=seq.tolist(),
+        stages=slot_stage.tolist(),
+        cost=_path_cost(seq, slot_stage, fit, trans),
+    )
+
+
+def describe_transitions(
+    titles: Sequence[str],
+    bpm: Sequence[float],
+    keys: Sequence[Optional[str]],
+    energy: Sequence[float],
+    order: Sequence[int],
+) -> List[str]:
+    """Plain transition notes for consecutive tracks of an ordered set"""
+    notes = []
+    for a, b in zip(order, order[1:]):
+        shift = energy[b] - energy[a]
+        notes.append(
+            f"{titles[a]} -> {titles[b]}: {bpm[a]:.0f} -> {bpm[b]:.0f} BPM, "
+            f"{keys[a] or '?'} -> {keys[b] or '?'}, energy {shift:+.2f}"
+        )
+    return notes
+
+
+def chunk_plan(plan: ArcPlan, max_tracks: int) -> List[Tuple[int, List[int]]]:
+    """Split each stage's run of a plan into contiguous chunks of at most
+    ``max_tracks`` tracks, as (stage, track indices) pairs in play order"""
+    chunks = []
+    start = 0
+    while start < len(plan.order):
+        stage = plan.stages[start]
+        end = start
+        while end < len(plan.order) and plan.stages[end] == stage:
+            end += 1
+        run = plan.order[start:end]
+        # Balance the chunks rather than leaving a short remainder
+        parts = -(-len(run) // max_tracks)
+        for part in np.array_split(np.arange(len(run)), parts):
+            chunks.append((stage, [run[i] for i in part]))
+        start = end
+    return chunks
@@ -0,0 +1,66 @@
+import re
+from typing import Optional, Tuple
+
+import numpy as np
+
+PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+ACCIDENTALS = {"": 0, "#": 1, "♯": 1, "b": -1, "♭": -1}
+MINOR_MODES = {"m", "min", "minor"}
+MAJOR_MODES = {"", "M", "maj", "major"}
+
+_CAMELOT = re.compile(r"^(1[0-2]|[1-9])\s*([AB])$", re.IGNORECASE)
+_KEY = re.compile(r"^([A-Ga-g])([#♯b♭]?)\s*([A-Za-z]*)$")
+
+# Mixing cost by Camelot steps (wheel distance plus one for a mode change):
+# same key, adjacent/relative, diagonal or two steps, then everything else
+STEP_COSTS = np.array([0.0, 0.2, 0.5, 0.8, 1.0, 1.0, 1.0, 1.0], dtype=np.float32)
+UNKNOWN_KEY_COST = 0.5
+
+
+def to_camelot(key: Optional[str]) -> Optional[Tuple[int, str]]:
+    """Parse "C major", "A minor", "F#m", "Bb" or "8A" into (number, letter)"""
+    if not key:
+        return None
+    key = key.strip()
+
+    match = _CAMELOT.match(key)
+    if match:
+        return int(match.group(1)), match.group(2).upper()
+
+    match = _KEY.match(key)
+    if not match:
+        return None
+    note, accidental, mode = match.groups()
+    if mode in MINOR_MODES or mode.lower() in ("min", "minor"):
+        minor = True
+    elif mode in MAJOR_MODES or mode.lower() in ("maj", "major"):
+        minor = False
+    else:
+        return None
+
+    pc = (PITCH_CLASSES[note.upper()] + ACCIDENTALS[accidental]) % 12
+    if minor:
+        pc = (pc + 3) % 12  # relative major shares the Camelot number
+    return (7 * pc + 7) % 12 + 1, "A" if minor else "B"
+
+
+def camelot_arrays(keys) -> Tuple[np.ndarray, np.ndarray]:
+    """Camelot numbers (0 when unknown) and minor flags for a list of keys"""
+    parsed = [to_camelot(k) for k in keys]
+    numbers = np.array([p[0] if p else 0 for p in parsed], dtype=np.int16)
+    minor = np.array([p is not None and p[1] == "A" for p in parsed])
+    return numbers, minor
+
+
+def key_cost_matrix(
+    numbers_a: np.ndarray,
+    minor_a: np.ndarray,
+    numbers_b: np.ndarray,
+    minor_b: np.ndarray,
+) -> np.ndarray:
+    """Pairwise harmonic mixing cost in [0, 1] between two sets of keys"""
+    diff = np.abs(numbers_a[:, None] - numbers_b[None, :])
+    steps = np.minimum(diff, 12 - diff) + (minor_a[:, None] != minor_b[None, :])
+    cost = STEP_COSTS[np.minimum(steps, len(STEP_COSTS) - 1)]
+    unknown = (numbers_a[:, None] == 0) | (numbers_b[None, :] == 0)
+    return np.where(unknown, UNKNOWN_KEY_COST, cost)
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import random
+from typing import AsyncIterator, Dict, List, Optional
+
+import openai
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+# Point at a local stub (see tools/openai_stub.py) to run without the real API
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+MODEL = os.getenv("OPENAI_MODEL", "gpt-5")
+
+# Completions in flight per process, shared by all requests
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+# Retries are handled below so they respect the shared concurrency limit
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY or "unset",
+    base_url=OPENAI_BASE_URL,
+    max_retries=0,
+    timeout=LLM_TIMEOUT,
+)
+_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Honour Retry-After when the API sends it, else exponential backoff with jitter"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX)
+            except ValueError:
+                pass
+    delay = min(LLM_BACKOFF_BASE * 2 ** attempt, LLM_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def chat(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    model: Optional[str] = None,
+) -> str:
+    """Run a chat completion and return the message content"""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _slots:
+                response = await client.chat.completions.create(
+                    model=model or MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                )
+            return response.choices[0].message.content
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            # Back off outside the semaphore so other requests keep flowing
+            await asyncio.sleep(delay)
+
+
+async def chat_stream(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    model: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Run a streaming chat completion and yield content deltas as they arrive.
+
+    Retries only happen before the first delta; once text has been handed
+    to the caller a failure is raised instead of silently starting over.
+    """
+    started = False
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _slots:
+                stream = await client.chat.completions.create(
+                    model=model or MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                )
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        started = True
+                        yield delta
+            return
+        except RETRYABLE_ERRORS as e:
+            if started or attempt == LLM_MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"LLM stream failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def chat_lines(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    model: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Stream a chat completion as complete lines"""
+    buffer = ""
+    async for delta in chat_stream(messages, temperature, model):
+        buffer += delta
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
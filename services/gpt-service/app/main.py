@@ -1,14 +1,38 @@
 from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict
-import openai
+from typing import AsyncIterator, List, Dict, Literal, Optional, Tuple
+import asyncio
+import json
+import logging
 import os
+import re
+import numpy as np
+
+from .arc_cache import ArcCache, canonical_key
+from .arc_optimizer import chunk_plan, describe_transitions, optimize_arc
+from .llm import OPENAI_API_KEY, OPENAI_BASE_URL, chat, chat_lines
+from .translation_memory import TranslationMemory, normalize_line
+from .transitions import TransitionCache, step_costs, suggest_next, transition_costs
 
 AUTH_TOKEN = os.getenv("AUTH_TOKEN", "")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+# Larger pools are never sent in one prompt; llm mode switches to chunked
+ARC_PROMPT_MAX_TRACKS = int(os.getenv("ARC_PROMPT_MAX_TRACKS", "40"))
+# Tracks per request in chunked mode
+ARC_CHUNK_TRACKS = int(os.getenv("ARC_CHUNK_TRACKS", "25"))
+
+NDJSON = "application/x-ndjson"
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Symphonia GPT-5 Service", version="0.1")
-openai.api_key = OPENAI_API_KEY
+
+# Cached line translations, shared across tracks and requests
+translation_memory = TranslationMemory()
+# Pairwise transition costs per track library
+transition_cache = TransitionCache()
+# Finished arcs by canonical request hash
+arc_cache = ArcCache()
 
 class Lyrics(BaseModel):
     start: float
@@ -25,25 +49,81 @@ class TranslateResponse(BaseModel):
     track_id: str
     translations: Dict[str, List[Lyrics]]
 
+class TrackMood(BaseModel):
+    valence: float
+    arousal: float
+
 class TrackMetadata(BaseModel):
     id: str
     title: str
     bpm: float
     key: str
     energy: float
-    lyrics: List[Lyrics]
+    lyrics: List[Lyrics] = []
+    mood: Optional[TrackMood] = None
 
-from .templates import get_template, list_templates, ArcTemplate
+from .template_registry import CompiledTemplate, registry as templates
 
 class GenerateArcRequest(BaseModel):
     tracks: List[TrackMetadata]
     template_name: str
     custom_stages: List[str] = []  # optional custom stage names
+    # local: ordered by the optimizer, the LLM only narrates; llm: the LLM orders;
+    # chunked: tracks are bucketed into stages locally and the LLM orders each
+    # stage in bounded chunks, concurrently
+    mode: Literal["local", "llm", "chunked"] = "local"
+    narrate: bool = True
+    # Reuse the cached transition matrix of this library; tracks are its contents
+    library_id: Optional[str] = None
+    library_version: Optional[str] = None
+    reroll: bool = False  # skip the response cache for a fresh take
 
 class GenerateArcResponse(BaseModel):
     ordered_track_ids: List[str]
     arc_description: str
     transition_notes: List[str]
+    stage_assignments: List[str] = []  # stage of each ordered track (local/chunked modes)
+    transition_costs: List[float] = []  # cost of each transition in the order
+    cached: bool = False
+
+class TrackPoolRequest(BaseModel):
+    tracks: List[TrackMetadata]
+    library_id: Optional[str] = None
+    library_version: Optional[str] = None
+
+class ScoreOrderRequest(TrackPoolRequest):
+    order: List[str]  # track ids in play order
+
+class ScoreOrderResponse(BaseModel):
+    total_cost: float
+    transition_costs: List[float]
+
+class SuggestNextRequest(TrackPoolRequest):
+    current_id: str
+    exclude: List[str] = []  # e.g. tracks already played
+    limit: int = 5
+
+class Suggestion(BaseModel):
+    id: str
+    cost: float
+
+class SuggestNextResponse(BaseModel):
+    suggestions: List[Suggestion]
+
+class TemplateMatchRequest(BaseModel):
+    energy_curve: List[float]  # target energy over the set, any number of points
+    limit: int = 3
+
+class TemplateMatch(BaseModel):
+    key: str
+    name: str
+    description: str
+    stages: int
+    source: str
+    distance: float
+
+class TemplateMatchResponse(BaseModel):
+    matches: List[TemplateMatch]
 
 TRANSLATION_PROMPT = """
 You are a professional music translator. Translate the following lyrics while:
@@ -57,15 +137,17 @@ Target Language: {target_lang}
 Original Lyrics:
 {lyrics}
 
-Translate each line keeping the same timing markers.
+Translate each line keeping its line number and timing marker.
 """
+# Bump whenever TRANSLATION_PROMPT changes so cached lines are not reused
+TRANSLATION_PROMPT_VERSION = "v2"
 
 ARC_PROMPT = """
-You are a professional DJ crafting a {template.name} set. Follow this template:
+You are a professional DJ crafting a {name} set. Follow this template:
 
-Description: {template.description}
+Description: {description}
 
-Stages ({len(template.stages)}):
+Stages ({stage_count}):
 {stage_descriptions}
 
 Energy Curve: {energy_curve}
@@ -89,57 +171,605 @@ Consider:
 - Lyrical themes matching stage moods
 - Groove types and danceable moments
 
-Provide:
-1. Track order with stage assignments
-2. Transition notes (energy shifts, key changes)
-3. Stage-by-stage narrative description
+Respond with:
+1. A first line with a stage-by-stage narrative description
+2. A line "Order: " followed by the comma-separated track numbers
+3. One line per transition starting with "Transition: " (energy shifts, key changes)
 """
 
+NARRATIVE_PROMPT = """
+You are a professional DJ presenting a {name} set ({description}).
+The track order below is final, do not change it:
+
+{tracks}
+
+Respond with:
+1. A first line with a stage-by-stage narrative description of the set
+2. One line per transition starting with "Transition: " (energy shifts, key changes)
+"""
+
+# Bump whenever ARC_PROMPT, NARRATIVE_PROMPT or STAGE_PROMPT changes so cached arcs are not reused
+ARC_PROMPT_VERSION = "v1"
+
+STAGE_PROMPT = """
+You are a professional DJ crafting one section of a {name} set ({description}).
+
+Stage {position} of {stage_count}: {stage} - {stage_description}
+Target Energy: {energy:.2f}
+BPM Range: {bpm_range}
+Mood Target: {mood}
+
+Previous track: {previous}
+Next track: {following}
+
+Tracks for this section:
+{tracks}
+
+Arrange these tracks so the section flows from the previous track into the next one:
+1. Match the stage's energy level, BPM range and mood
+2. Create smooth key transitions
+3. Tell a story through lyrics
+
+Respond with:
+1. A first line describing this section
+2. A line "Order: " followed by the comma-separated track numbers
+3. One line per transition starting with "Transition: " (energy shifts, key changes)
+"""
+
+def llm_configured() -> bool:
+    return bool(OPENAI_API_KEY or OPENAI_BASE_URL)
+
+def format_track(i: int, t: TrackMetadata) -> str:
+    mood = f"Mood: Valence={t.mood.valence:.1f}, Arousal={t.mood.arousal:.1f}\n" if t.mood else ""
+    return (
+        f"Track {i+1}:\n"
+        f"Title: {t.title}\n"
+        f"BPM: {t.bpm}\n"
+        f"Key: {t.key}\n"
+        f"Energy: {t.energy}\n"
+        f"{mood}"
+        f"Lyrics Sample: {t.lyrics[0].text if t.lyrics else 'No lyrics'}\n"
+    )
+
+def build_arc_prompt(template: CompiledTemplate, tracks: List[TrackMetadata]) -> str:
+    """Format the full ordering prompt for a template and track pool"""
+    return ARC_PROMPT.format(
+        name=template.name,
+        description=template.description,
+        stage_count=len(template.stages),
+        stage_descriptions=template.stage_text,
+        energy_curve=template.energy_curve,
+        bpm_ranges=template.bpm_text,
+        mood_targets=template.mood_text,
+        tracks="\n".join(format_track(i, t) for i, t in enumerate(tracks)),
+    )
+
+def parse_arc_line(line: str, tracks: List[TrackMetadata]):
+    """Classify one completion line as ("order", ids), ("transition", note) or (None, text)"""
+    if line.startswith("Order:"):
+        # Extract track indices and map to IDs
+        indices = [int(i)-1 for i in line.split(":")[1].strip().split(",")]
+        return "order", [tracks[i].id for i in indices]
+    if line.startswith("Transition:"):
+        return "transition", line.split(":", 1)[1].strip()
+    return None, line
+
+def parse_arc_response(content: str, tracks: List[TrackMetadata]):
+    """Split a completion into (description, ordered ids, transition notes)"""
+    lines = content.strip().split("\n")
+    arc_description = lines[0]
+    ordered_ids = []
+    transition_notes = []
+
+    for line in lines[1:]:
+        kind, value = parse_arc_line(line, tracks)
+        if kind == "order":
+            ordered_ids = value
+        elif kind == "transition":
+            transition_notes.append(value)
+
+    return arc_description, ordered_ids, transition_notes
+
+def pool_costs(
+    tracks: List[TrackMetadata],
+    library_id: Optional[str] = None,
+    library_version: Optional[str] = None,
+) -> np.ndarray:
+    """Transition matrix for tracks in request order, cached when a library is named"""
+    args = ([t.bpm for t in tracks], [t.energy for t in tracks], [t.key for t in tracks])
+    if library_id is None:
+        return transition_costs(*args)
+    return transition_cache.costs(library_id, library_version, [t.id for t in tracks], *args)
+
+def order_indices(tracks: List[TrackMetadata], ids: List[str]) -> List[int]:
+    index = {t.id: i for i, t in enumerate(tracks)}
+    unknown = [track_id for track_id in ids if track_id not in index]
+    if unknown:
+        raise KeyError(f"Unknown track ids: {', '.join(unknown)}")
+    return [index[track_id] for track_id in ids]
+
+async def plan_arc(req: GenerateArcRequest, template: CompiledTemplate):
+    """Run the local optimizer; returns the plan and the transition matrix"""
+    tracks = req.tracks
+    mood = np.array([
+        [t.mood.valence, t.mood.arousal] if t.mood else [np.nan, np.nan]
+        for t in tracks
+    ]).reshape(len(tracks), 2)
+    trans = await asyncio.to_thread(pool_costs, tracks, req.library_id, req.library_version)
+    plan = await asyncio.to_thread(
+        optimize_arc,
+        template,
+        [t.bpm for t in tracks],
+        [t.energy for t in tracks],
+        [t.key for t in tracks],
+        mood,
+        trans,
+    )
+    return plan, trans
+
+def stage_labels(req: GenerateArcRequest, template: CompiledTemplate) -> List[str]:
+    return req.custom_stages if len(req.custom_stages) == len(template.stages) else template.stages
+
+def describe_order(tracks: List[TrackMetadata], order: List[int]) -> List[str]:
+    return describe_transitions(
+        [t.title for t in tracks],
+        [t.bpm for t in tracks],
+        [t.key for t in tracks],
+        [t.energy for t in tracks],
+        order,
+    )
+
+async def arrange_locally(req: GenerateArcRequest, template: CompiledTemplate) -> AsyncIterator[Dict]:
+    """Order tracks with the local optimizer; the LLM only narrates the result"""
+    tracks = req.tracks
+    plan, trans = await plan_arc(req, template)
+
+    stage_names = stage_labels(req, template)
+    ordered = [tracks[i] for i in plan.order]
+    stage_assignments = [stage_names[stage] for stage in plan.stages]
+    yield {"event": "order", "ordered_track_ids": [t.id for t in ordered], "stage_assignments": stage_assignments}
+
+    arc_description = f"{template.name}: {template.description}"
+    transition_notes = describe_order(tracks, plan.order)
+
+    if req.narrate and llm_configured():
+        description = None
+        notes = []
+        messages = [
+            {"role": "system", "content": NARRATIVE_PROMPT.format(
+                name=template.name,
+                description=template.description,
+                tracks="\n".join(
+                    f"{stage_names[stage]}: " + format_track(i, t)
+                    for i, (t, stage) in enumerate(zip(ordered, plan.stages))
+                ),
+            )}
+        ]
+        async for line in chat_lines(messages, temperature=0.8):
+            line = line.strip()
+            if not line:
+                continue
+            if description is None:
+                description = line
+                yield {"event": "description", "text": line}
+            elif line.startswith("Transition:"):
+                notes.append(line.split(":", 1)[1].strip())
+                yield {"event": "transition", "index": len(notes) - 1, "text": notes[-1]}
+        arc_description = description or arc_description
+        transition_notes = notes or transition_notes
+
+    yield {"event": "result", **GenerateArcResponse(
+        ordered_track_ids=[t.id for t in ordered],
+        arc_description=arc_description,
+        transition_notes=transition_notes,
+        stage_assignments=stage_assignments,
+        transition_costs=step_costs(trans, plan.order).tolist(),
+    ).model_dump()}
+
+async def order_chunk(
+    template: CompiledTemplate,
+    stage: int,
+    stage_names: List[str],
+    tracks: List[TrackMetadata],
+    chunk: List[int],
+    previous: Optional[TrackMetadata],
+    following: Optional[TrackMetadata],
+):
+    """Have the LLM order one chunk of a stage; returns (description, order, notes).
+
+    Falls back to the local order when the call fails or the answer is not a
+    permutation of the chunk, so one bad completion cannot sink the whole set.
+    """
+    members = [tracks[i] for i in chunk]
+    prompt = STAGE_PROMPT.format(
+        name=template.name,
+        description=template.description,
+        position=stage + 1,
+        stage_count=len(template.stages),
+        stage=stage_names[stage],
+        **template.stage_prompts[stage],
+        previous=f"{previous.title} ({previous.bpm} BPM, {previous.key})" if previous else "none, this opens the set",
+        following=f"{following.title} ({following.bpm} BPM, {following.key})" if following else "none, this closes the set",
+        tracks="\n".join(format_track(i, t) for i, t in enumerate(members)),
+    )
+    try:
+        content = await chat([{"role": "system", "content": prompt}], temperature=0.8)
+        description, ids, notes = parse_arc_response(content, members)
+    except Exception as e:
+        # Failed call or unparseable answer
+        logger.warning(f"No usable order for stage {stage_names[stage]}: {e}")
+        return "", chunk, describe_order(tracks, chunk)
+
+    if sorted(ids) != sorted(t.id for t in members):
+        logger.warning(f"Incomplete order for stage {stage_names[stage]}, keeping the local one")
+        return description, chunk, describe_order(tracks, chunk)
+    position = {t.id: i for i, t in zip(chunk, members)}
+    order = [position[track_id] for track_id in ids]
+    return description, order, notes or describe_order(tracks, order)
+
+async def arrange_in_chunks(req: GenerateArcRequest, template: CompiledTemplate) -> AsyncIterator[Dict]:
+    """Bucket tracks into stages locally, then let the LLM order each stage.
+
+    Every request holds at most ARC_CHUNK_TRACKS tracks and all of them run
+    concurrently, so prompt size stays bounded and latency follows the
+    number of chunks in flight rather than the size of the pool. Chunks are
+    reported as they complete.
+    """
+    tracks = req.tracks
+    plan, trans = await plan_arc(req, template)
+    stage_names = stage_labels(req, template)
+    chunks = chunk_plan(plan, ARC_CHUNK_TRACKS)
+
+    async def run(k: int, stage: int, chunk: List[int]):
+        # Neighbours come from the local plan so chunks can be requested independently
+        return k, await order_chunk(
+            template, stage, stage_names, tracks, chunk,
+            tracks[chunks[k - 1][1][-1]] if k > 0 else None,
+            tracks[chunks[k + 1][1][0]] if k + 1 < len(chunks) else None,
+        )
+
+    tasks = [asyncio.create_task(run(k, stage, chunk)) for k, (stage, chunk) in enumerate(chunks)]
+    results = [None] * len(chunks)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            k, (description, chunk_order, notes) = await next_done
+            results[k] = description, chunk_order, notes
+            yield {
+                "event": "chunk",
+                "index": k,
+                "chunks": len(chunks),
+                "stage": stage_names[chunks[k][0]],
+                "track_ids": [tracks[i].id for i in chunk_order],
+                "description": description,
+                "transition_notes": notes,
+            }
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    order: List[int] = []
+    stages: List[str] = []
+    descriptions: List[str] = []
+    transition_notes: List[str] = []
+    for (stage, chunk), (description, chunk_order, notes) in zip(chunks, results):
+        if order:
+            # Seam between two independently ordered chunks
+            transition_notes.extend(describe_order(tracks, [order[-1], chunk_order[0]]))
+        order.extend(chunk_order)
+        stages.extend([stage_names[stage]] * len(chunk_order))
+        transition_notes.extend(notes)
+        if description and (not descriptions or not descriptions[-1].startswith(f"{stage_names[stage]}:")):
+            descriptions.append(f"{stage_names[stage]}: {description}")
+
+    yield {"event": "result", **GenerateArcResponse(
+        ordered_track_ids=[tracks[i].id for i in order],
+        arc_description=" ".join(descriptions) or f"{template.name}: {template.description}",
+        transition_notes=transition_notes,
+        stage_assignments=stages,
+        transition_costs=step_costs(trans, order).tolist(),
+    ).model_dump()}
+
+async def arrange_with_llm(req: GenerateArcRequest, template: CompiledTemplate) -> AsyncIterator[Dict]:
+    """Let the LLM order the whole pool in one prompt, reporting lines as they stream in"""
+    arc_description = ""
+    ordered_ids: List[str] = []
+    transition_notes: List[str] = []
+
+    # Call GPT-5
+    messages = [{"role": "system", "content": build_arc_prompt(template, req.tracks)}]
+    async for line in chat_lines(messages, temperature=0.8):
+        line = line.strip()
+        if not line:
+            continue
+        if not arc_description:
+            arc_description = line
+            yield {"event": "description", "text": line}
+            continue
+        kind, value = parse_arc_line(line, req.tracks)
+        if kind == "order":
+            ordered_ids = value
+            yield {"event": "order", "ordered_track_ids": ordered_ids}
+        elif kind == "transition":
+            transition_notes.append(value)
+            yield {"event": "transition", "index": len(transition_notes) - 1, "text": value}
+
+    # Score the proposed order locally, no extra API call needed
+    trans = await asyncio.to_thread(pool_costs, req.tracks, req.library_id, req.library_version)
+    costs = step_costs(trans, order_indices(req.tracks, ordered_ids))
+
+    yield {"event": "result", **GenerateArcResponse(
+        ordered_track_ids=ordered_ids,
+        arc_description=arc_description,
+        transition_notes=transition_notes,
+        transition_costs=costs.tolist(),
+    ).model_dump()}
+
+def arrange(req: GenerateArcRequest, template: CompiledTemplate) -> AsyncIterator[Dict]:
+    """Arc generation events for the requested mode, ending with a "result" event"""
+    if req.mode == "local":
+        return arrange_locally(req, template)
+    if req.mode == "chunked" or len(req.tracks) > ARC_PROMPT_MAX_TRACKS:
+        return arrange_in_chunks(req, template)
+    return arrange_with_llm(req, template)
+
+async def final_result(events: AsyncIterator[Dict]) -> Dict:
+    result = None
+    async for event in events:
+        if event["event"] == "result":
+            result = {k: v for k, v in event.items() if k != "event"}
+    return result
+
+def arc_cache_key(req: GenerateArcRequest) -> str:
+    """Canonical hash of everything that shapes an arc, independent of track order"""
+    tracks = sorted(
+        (
+            t.id, t.title, t.bpm, t.key, t.energy,
+            (t.mood.valence, t.mood.arousal) if t.mood else None,
+            t.lyrics[0].text if t.lyrics else None,  # the only lyrics the prompts see
+        )
+        for t in req.tracks
+    )
+    return canonical_key({
+        "tracks": tracks,
+        "template_name": req.template_name,
+        "custom_stages": req.custom_stages,
+        "mode": req.mode,
+        "narrate": req.narrate and llm_configured(),
+        "prompt_version": ARC_PROMPT_VERSION,
+    })
+
+async def cached_arc_events(req: GenerateArcRequest, template: CompiledTemplate) -> AsyncIterator[Dict]:
+    """Arc events through the response cache: a hit (or an identical request
+    already in flight) yields only the result event"""
+    key = arc_cache_key(req)
+    if not req.reroll:
+        value, pending = arc_cache.lookup(key)
+        if pending is not None:
+            value = await asyncio.shield(pending)
+        if value is not None:
+            yield {"event": "result", **value, "cached": True}
+            return
+
+    future = arc_cache.begin(key)
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def generate():
+        try:
+            async for event in arrange(req, template):
+                if event["event"] == "result":
+                    arc_cache.finish(key, future, {k: v for k, v in event.items() if k != "event"})
+                events.put_nowait(event)
+        except Exception as e:
+            arc_cache.finish(key, future, error=e)
+            events.put_nowait(e)
+        finally:
+            arc_cache.finish(key, future, error=RuntimeError("Arc generation ended without a result"))
+            events.put_nowait(None)
+
+    # Detached from this stream: if its client disconnects, the arc is still
+    # finished and cached for the requests coalesced onto it
+    arc_cache.detach(generate())
+
+    while (event := await events.get()) is not None:
+        if isinstance(event, Exception):
+            raise event
+        yield event
+
+def event_response(events: AsyncIterator[Dict], accept: Optional[str]) -> StreamingResponse:
+    """Send events as server-sent events, or as NDJSON when the client accepts it"""
+    ndjson = NDJSON in (accept or "")
+
+    def encode(event: Dict) -> str:
+        return json.dumps(event) + "\n" if ndjson else f"data: {json.dumps(event)}\n\n"
+
+    async def body():
+        try:
+            async for event in events:
+                yield encode(event)
+        except Exception as e:
+            # Headers are already sent, so errors travel in-band
+            logger.exception("Event stream failed")
+            yield encode({"event": "error", "detail": str(e)})
+
+    return StreamingResponse(body(), media_type=NDJSON if ndjson else "text/event-stream")
+
+def parse_timed_line(line: str) -> Optional[Lyrics]:
+    """Parse one "[start - end] text" line, None for anything else"""
+    if not line.startswith("["):
+        return None
+    timing, text = line.split("]", 1)
+    start, end = timing[1:].split(" - ")
+    return Lyrics(
+        start=float(start),
+        end=float(end),
+        text=text.strip()
+    )
+
+def parse_timed_lines(content: str) -> List[Lyrics]:
+    """Parse "[start - end] text" lines from a completion"""
+    lyrics = []
+    for line in content.strip().split("\n"):
+        parsed = parse_timed_line(line)
+        if parsed:
+            lyrics.append(parsed)
+    return lyrics
+
+def format_timing(start: float, end: float) -> str:
+    return f"[{start:.2f} - {end:.2f}]"
+
+def parse_numbered_line(line: str) -> Optional[Tuple[int, str]]:
+    """Parse one "[n] [start - end] text" line of a translation, None for
+    anything else; the timing marker is optional"""
+    match = re.match(r"\[(\d+)\]\s*(?:\[[^\]]*\])?\s*(.*)", line)
+    if match is None:
+        return None
+    return int(match.group(1)), match.group(2).strip()
+
+async def translate_lines(
+    lyrics: List[Lyrics],
+    source_lang: str,
+    target_lang: str,
+) -> AsyncIterator[Tuple[int, Lyrics]]:
+    """Yield (line index, translated line) pairs as they become available.
+
+    Lines found in the translation memory come first, along with lines
+    that have nothing to translate ("...", "♪"), which are kept as they
+    are. Only the missing ones are sent to the model, each distinct line
+    once under its own number, and are yielded for every matching line as
+    soon as their line of the completion arrives.
+    """
+    normalized = [normalize_line(l.text) for l in lyrics]
+    known = await asyncio.to_thread(
+        translation_memory.get_many,
+        [n for n in normalized if n], source_lang, target_lang, TRANSLATION_PROMPT_VERSION
+    )
+    positions: Dict[str, List[int]] = {}
+    for i, norm in enumerate(normalized):
+        positions.setdefault(norm, []).append(i)
+
+    for i, (l, norm) in enumerate(zip(lyrics, normalized)):
+        if not norm:
+            yield i, Lyrics(start=l.start, end=l.end, text=l.text)
+        elif norm in known:
+            yield i, Lyrics(start=l.start, end=l.end, text=known[norm])
+
+    # Index of the first occurrence of each uncached line; its position in
+    # this list numbers it in the prompt, as timings need not be unique
+    pending: List[int] = []
+    queued = set()
+    for i, norm in enumerate(normalized):
+        if norm and norm not in known and norm not in queued:
+            pending.append(i)
+            queued.add(norm)
+    if not pending:
+        return
+
+    lyrics_text = "\n".join(
+        f"[{n}] {format_timing(lyrics[i].start, lyrics[i].end)} {lyrics[i].text}"
+        for n, i in enumerate(pending, 1)
+    )
+    messages = [
+        {"role": "system", "content": TRANSLATION_PROMPT.format(
+            source_lang=source_lang,
+            target_lang=target_lang,
+            lyrics=lyrics_text
+        )}
+    ]
+    learned: Dict[str, str] = {}
+    try:
+        async for line in chat_lines(messages, temperature=0.7):
+            parsed = parse_numbered_line(line.strip())
+            if parsed is None or not 1 <= parsed[0] <= len(pending):
+                continue
+            number, text = parsed
+            norm = normalized[pending[number - 1]]
+            if norm in learned:
+                continue
+            learned[norm] = text
+            for i in positions[norm]:
+                yield i, Lyrics(start=lyrics[i].start, end=lyrics[i].end, text=text)
+    finally:
+        # Keep whatever was translated, even if the client went away mid-stream
+        await asyncio.to_thread(
+            translation_memory.put_many,
+            learned, source_lang, target_lang, TRANSLATION_PROMPT_VERSION
+        )
+
+async def translate_one(lyrics: List[Lyrics], source_lang: str, target_lang: str) -> List[Lyrics]:
+    """Translate lyrics into one target language via the translation memory"""
+    translated = {i: line async for i, line in translate_lines(lyrics, source_lang, target_lang)}
+    return [translated[i] for i in sorted(translated)]
+
+async def merge_events(sources: List[AsyncIterator[Dict]]) -> AsyncIterator[Dict]:
+    """Interleave several event streams in arrival order"""
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+
+    async def pump(source: AsyncIterator[Dict]):
+        try:
+            async for event in source:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(finished)
+
+    tasks = [asyncio.create_task(pump(source)) for source in sources]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is finished:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def translation_events(req: TranslateRequest) -> AsyncIterator[Dict]:
+    """Translated lines for all target languages as they complete, then the full result"""
+    translations: Dict[str, Dict[int, Lyrics]] = {lang: {} for lang in req.target_langs}
+
+    async def language(target_lang: str) -> AsyncIterator[Dict]:
+        async for i, line in translate_lines(req.lyrics, req.source_lang, target_lang):
+            translations[target_lang][i] = line
+            yield {"event": "line", "lang": target_lang, "index": i, **line.model_dump()}
+        yield {"event": "language_done", "lang": target_lang}
+
+    async for event in merge_events([language(lang) for lang in req.target_langs]):
+        yield event
+
+    yield {"event": "result", **TranslateResponse(
+        track_id=req.track_id,
+        translations={
+            lang: [lines[i] for i in sorted(lines)]
+            for lang, lines in translations.items()
+        },
+    ).model_dump()}
+
+def check_translate_request(authorization: Optional[str]):
+    if not llm_configured():
+        raise HTTPException(status_code=500, detail="OpenAI API key not configured")
+    if AUTH_TOKEN and authorization != f"Bearer {AUTH_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
 @app.post("/translate", response_model=TranslateResponse)
 async def translate(
     req: TranslateRequest,
     authorization: str | None = Header(default=None)
 ):
-    if not OPENAI_API_KEY:
-        raise HTTPException(status_code=500, detail="OpenAI API key not configured")
-    if AUTH_TOKEN and authorization != f"Bearer {AUTH_TOKEN}":
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    check_translate_request(authorization)
 
     try:
-        translations = {}
-        for target_lang in req.target_langs:
-            # Format lyrics for prompt
-            lyrics_text = "\n".join(
-                f"[{l.start:.2f} - {l.end:.2f}] {l.text}"
-                for l in req.lyrics
-            )
-
-            # Call GPT-5
-            response = openai.chat.completions.create(
-                model="gpt-5",
-                messages=[
-                    {"role": "system", "content": TRANSLATION_PROMPT.format(
-                        source_lang=req.source_lang,
-                        target_lang=target_lang,
-                        lyrics=lyrics_text
-                    )}
-                ],
-                temperature=0.7,
-            )
-
-            # Parse response into timed lyrics
-            translated_lyrics = []
-            for line in response.choices[0].message.content.strip().split("\n"):
-                if line.startswith("["):
-                    timing, text = line.split("]", 1)
-                    start, end = timing[1:].split(" - ")
-                    translated_lyrics.append(Lyrics(
-                        start=float(start),
-                        end=float(end),
-                        text=text.strip()
-                    ))
-
-            translations[target_lang] = translated_lyrics
+        # Call GPT-5 for all languages concurrently
+        results = await asyncio.gather(*(
+            translate_one(req.lyrics, req.source_lang, target_lang)
+            for target_lang in req.target_langs
+        ))
+        translations = dict(zip(req.target_langs, results))
 
         return TranslateResponse(
             track_id=req.track_id,
@@ -149,84 +779,110 @@ async def translate(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/generate-arc", response_model=GenerateArcResponse)
-async def generate_arc(
-    req: GenerateArcRequest,
-    authorization: str | None = Header(default=None)
+@app.post("/translate/stream")
+async def translate_stream(
+    req: TranslateRequest,
+    authorization: str | None = Header(default=None),
+    accept: str | None = Header(default=None),
 ):
-    if not OPENAI_API_KEY:
+    """Stream translated lines as server-sent events (or NDJSON)"""
+    check_translate_request(authorization)
+    return event_response(translation_events(req), accept)
+
+@app.get("/translation-memory/stats")
+def translation_memory_stats():
+    return translation_memory.stats()
+
+def check_arc_request(req: GenerateArcRequest, authorization: Optional[str]) -> CompiledTemplate:
+    if req.mode != "local" and not llm_configured():
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
     if AUTH_TOKEN and authorization != f"Bearer {AUTH_TOKEN}":
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     try:
-        # Get template
-        template = get_template(req.template_name)
-        
-        # Format stage descriptions
-        stage_desc = "\n".join(
-            f"{i+1}. {stage}: {template.stage_descriptions[stage]}"
-            for i, stage in enumerate(template.stages)
-        )
-        
-        # Format BPM ranges
-        bpm_ranges = "\n".join(
-            f"{stage}: {low}-{high} BPM"
-            for stage, (low, high) in template.bpm_range.items()
-        )
-        
-        # Format mood targets
-        mood_targets = "\n".join(
-            f"{stage}: Valence={mood['valence']:.1f}, Arousal={mood['arousal']:.1f}"
-            for stage, mood in template.mood_targets.items()
-        )
-        
-        # Format tracks with detailed features
-        tracks_text = "\n".join(
-            f"Track {i+1}:\n"
-            f"Title: {t.title}\n"
-            f"BPM: {t.bpm}\n"
-            f"Key: {t.key}\n"
-            f"Energy: {t.energy}\n"
-            f"Mood: Valence={t.mood.valence:.1f}, Arousal={t.mood.arousal:.1f}\n"
-            f"Groove: {t.groove.groove_type} (Swing={t.groove.swing_ratio:.2f})\n"
-            f"Danceability: {t.danceable:.2f}\n"
-            f"Dynamic Range: {t.dynamic_range:.2f}\n"
-            f"Lyrics Sample: {t.lyrics[0].text if t.lyrics else 'No lyrics'}\n"
-            for i, t in enumerate(req.tracks)
-        )
+        return templates.get(req.template_name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown template: {req.template_name}")
 
-        # Call GPT-5
-        response = openai.chat.completions.create(
-            model="gpt-5",
-            messages=[
-                {"role": "system", "content": ARC_PROMPT.format(
-                    arc_template=req.arc_template,
-                    tracks=tracks_text
-                )}
-            ],
-            temperature=0.8,
+@app.post("/generate-arc", response_model=GenerateArcResponse)
+async def generate_arc(
+    req: GenerateArcRequest,
+    authorization: str | None = Header(default=None)
+):
+    template = check_arc_request(req, authorization)
+
+    try:
+        result, cached = await arc_cache.get_or_compute(
+            arc_cache_key(req),
+            lambda: final_result(arrange(req, template)),
+            refresh=req.reroll,
         )
+        return GenerateArcResponse(**{**result, "cached": cached})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Parse response
-        lines = response.choices[0].message.content.strip().split("\n")
-        arc_description = lines[0]
-        ordered_ids = []
-        transition_notes = []
-
-        for line in lines[1:]:
-            if line.startswith("Order:"):
-                # Extract track indices and map to IDs
-                indices = [int(i)-1 for i in line.split(":")[1].strip().split(",")]
-                ordered_ids = [req.tracks[i].id for i in indices]
-            elif line.startswith("Transition:"):
-                transition_notes.append(line.split(":")[1].strip())
+@app.post("/generate-arc/stream")
+async def generate_arc_stream(
+    req: GenerateArcRequest,
+    authorization: str | None = Header(default=None),
+    accept: str | None = Header(default=None),
+):
+    """Stream the order, stage chunks, description and transition notes as they appear"""
+    template = check_arc_request(req, authorization)
+    return event_response(cached_arc_events(req, template), accept)
+
+@app.get("/templates")
+def get_templates():
+    return templates.list()
+
+@app.post("/templates/match", response_model=TemplateMatchResponse)
+def match_templates(req: TemplateMatchRequest):
+    """Templates whose energy curve is nearest to the requested one"""
+    return TemplateMatchResponse(matches=[
+        TemplateMatch(**template.summary(), distance=distance)
+        for template, distance in templates.nearest(req.energy_curve, req.limit)
+    ])
+
+@app.get("/arc-cache/stats")
+def arc_cache_stats():
+    return arc_cache.stats()
+
+@app.post("/transitions/score", response_model=ScoreOrderResponse)
+async def score_order(
+    req: ScoreOrderRequest,
+    authorization: str | None = Header(default=None)
+):
+    if AUTH_TOKEN and authorization != f"Bearer {AUTH_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        order = order_indices(req.tracks, req.order)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
 
-        return GenerateArcResponse(
-            ordered_track_ids=ordered_ids,
-            arc_description=arc_description,
-            transition_notes=transition_notes
-        )
+    trans = await asyncio.to_thread(pool_costs, req.tracks, req.library_id, req.library_version)
+    costs = step_costs(trans, order)
+    return ScoreOrderResponse(total_cost=float(costs.sum()), transition_costs=costs.tolist())
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+@app.post("/transitions/suggest", response_model=SuggestNextResponse)
+async def suggest_next_tracks(
+    req: SuggestNextRequest,
+    authorization: str | None = Header(default=None)
+):
+    if AUTH_TOKEN and authorization != f"Bearer {AUTH_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        current, = order_indices(req.tracks, [req.current_id])
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+    known = {t.id for t in req.tracks}
+    exclude = order_indices(req.tracks, [i for i in req.exclude if i in known])
+
+    trans = await asyncio.to_thread(pool_costs, req.tracks, req.library_id, req.library_version)
+    return SuggestNextResponse(suggestions=[
+        Suggestion(id=req.tracks[i].id, cost=cost)
+        for i, cost in suggest_next(trans, current, exclude, req.limit)
+    ])
+
+@app.get("/transitions/stats")
+def transition_stats():
+    return transition_cache.stats()
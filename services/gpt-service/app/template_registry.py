@@ -0,0 +1,188 @@
+import glob
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .specialized_templates import SPECIALIZED_TEMPLATES
+from .templates import TEMPLATES, ArcTemplate
+
+logger = logging.getLogger(__name__)
+
+# Directory of user-defined templates, one JSON file each (or a name -> template map)
+ARC_TEMPLATE_DIR = os.getenv("ARC_TEMPLATE_DIR", "")
+# Resolution energy curves are resampled to for nearest-match lookups
+CURVE_POINTS = 32
+
+
+def stage_vectors(template: ArcTemplate):
+    """Per-stage target arrays (energy, BPM low, BPM high, valence/arousal).
+
+    Mood targets are interpolated between the stages that define them and
+    are NaN when the template defines none.
+    """
+    n = len(template.stages)
+    energy = np.asarray(template.energy_curve[:n], dtype=float)
+    if len(energy) < n:
+        energy = np.pad(energy, (0, n - len(energy)), mode="edge")
+    bpm = np.array([template.bpm_range.get(s, (0, 0)) for s in template.stages], dtype=float)
+
+    mood = np.full((n, 2), np.nan)
+    for i, stage in enumerate(template.stages):
+        target = template.mood_targets.get(stage)
+        if target:
+            mood[i] = target["valence"], target["arousal"]
+    known = np.flatnonzero(~np.isnan(mood[:, 0]))
+    if len(known):
+        for col in range(2):
+            mood[:, col] = np.interp(np.arange(n), known, mood[known, col])
+    return energy, bpm[:, 0], bpm[:, 1], mood
+
+
+def resample_curve(curve: Sequence[float], points: int = CURVE_POINTS) -> np.ndarray:
+    """Stretch an energy curve of any length onto ``points`` evenly spaced samples"""
+    curve = np.asarray(curve, dtype=float)
+    if len(curve) == 1:
+        return np.full(points, curve[0])
+    return np.interp(np.linspace(0, 1, points), np.linspace(0, 1, len(curve)), curve)
+
+
+class CompiledTemplate(ArcTemplate):
+    """An ArcTemplate with its stage vectors and prompt fragments computed once"""
+
+    def __init__(self, key: str, template: ArcTemplate, source: str):
+        super().__init__(
+            name=template.name,
+            description=template.description,
+            stages=list(template.stages),
+            stage_descriptions=dict(template.stage_descriptions),
+            energy_curve=list(template.energy_curve),
+            bpm_range=dict(template.bpm_range),
+            mood_targets=dict(template.mood_targets),
+        )
+        self.key = key
+        self.source = source
+        self.energy, self.bpm_low, self.bpm_high, self.mood = stage_vectors(template)
+        self.curve = resample_curve(self.energy)
+
+        # Prompt fragments
+        self.stage_text = "\n".join(
+            f"{i+1}. {stage}: {self.stage_descriptions.get(stage, '')}"
+            for i, stage in enumerate(self.stages)
+        )
+        self.bpm_text = "\n".join(
+            f"{stage}: {low}-{high} BPM"
+            for stage, (low, high) in self.bpm_range.items()
+        )
+        self.mood_text = "\n".join(
+            f"{stage}: Valence={mood['valence']:.1f}, Arousal={mood['arousal']:.1f}"
+            for stage, mood in self.mood_targets.items()
+        )
+        self.stage_prompts = [
+            {
+                "stage_description": self.stage_descriptions.get(stage, ""),
+                "energy": float(self.energy[i]),
+                "bpm_range": f"{self.bpm_low[i]:.0f}-{self.bpm_high[i]:.0f} BPM" if self.bpm_high[i] else "any",
+                "mood": "any" if np.isnan(self.mood[i, 0]) else
+                    f"Valence={self.mood[i, 0]:.1f}, Arousal={self.mood[i, 1]:.1f}",
+            }
+            for i, stage in enumerate(self.stages)
+        ]
+
+    def summary(self) -> Dict:
+        return {
+            "key": self.key,
+            "name": self.name,
+            "description": self.description,
+            "stages": len(self.stages),
+            "source": self.source,
+        }
+
+
+def load_template_file(path: str) -> Dict[str, ArcTemplate]:
+    """Read templates from a JSON file: either one template (keyed by the file
+    name) or an object mapping keys to templates"""
+    with open(path) as f:
+        data = json.load(f)
+    if "stages" in data:
+        data = {os.path.splitext(os.path.basename(path))[0]: data}
+
+    templates = {}
+    for key, spec in data.items():
+        templates[key] = ArcTemplate(
+            name=spec.get("name", key),
+            description=spec.get("description", ""),
+            stages=spec["stages"],
+            stage_descriptions=spec.get("stage_descriptions", {}),
+            energy_curve=spec["energy_curve"],
+            bpm_range={stage: tuple(r) for stage, r in spec.get("bpm_range", {}).items()},
+            mood_targets=spec.get("mood_targets", {}),
+        )
+    return templates
+
+
+class TemplateRegistry:
+    """All arc templates by key, compiled once.
+
+    Sources are loaded in order (built-ins, specialized, then user files), a
+    later source overriding an earlier template with the same key. Lookups
+    accept the key or the display name.
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, CompiledTemplate] = {}
+        self._aliases: Dict[str, str] = {}
+        self._curves = np.empty((0, CURVE_POINTS))
+        self._keys: List[str] = []
+
+    def register(self, key: str, template: ArcTemplate, source: str):
+        if key in self._templates:
+            logger.warning(f"Template {key} from {source} overrides {self._templates[key].source}")
+        self._templates[key] = CompiledTemplate(key, template, source)
+        self._aliases[template.name.casefold()] = key
+        self._keys = list(self._templates)
+        self._curves = np.array([self._templates[k].curve for k in self._keys])
+
+    def load_dir(self, directory: str):
+        for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            try:
+                for key, template in load_template_file(path).items():
+                    self.register(key, template, path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Skipping template file {path}: {e}")
+
+    def get(self, name: str) -> CompiledTemplate:
+        """Template by key or display name, raises KeyError if not found"""
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[self._aliases[name.casefold()]]
+        return template
+
+    def nearest(self, energy_curve: Sequence[float], limit: int = 3) -> List[Tuple[CompiledTemplate, float]]:
+        """Templates whose energy curve is closest to ``energy_curve`` (RMS distance
+        after resampling both to the same length)"""
+        if not self._keys or not len(energy_curve):
+            return []
+        target = resample_curve(energy_curve)
+        distance = np.sqrt(np.mean((self._curves - target[None, :]) ** 2, axis=1))
+        best = np.argsort(distance, kind="stable")[:limit]
+        return [(self._templates[self._keys[i]], float(distance[i])) for i in best]
+
+    def list(self) -> List[Dict]:
+        return [t.summary() for t in self._templates.values()]
+
+
+def build_registry(template_dir: Optional[str] = ARC_TEMPLATE_DIR) -> TemplateRegistry:
+    registry = TemplateRegistry()
+    for key, template in TEMPLATES.items():
+        registry.register(key, template, "builtin")
+    for key, template in SPECIALIZED_TEMPLATES.items():
+        registry.register(key, template, "specialized")
+    if template_dir:
+        registry.load_dir(template_dir)
+    return registry
+
+
+registry = build_registry()
@@ -171,8 +171,7 @@ TEMPLATES = {
             "deep_flow": {"valence": 0.7, "arousal": 0.1},
             "integration": {"valence": 0.8, "arousal": 0.2}
         }
-    )
-},
+    ),
 
     "festival_set": ArcTemplate(
         name="Festival Peak Hour",
@@ -326,17 +325,13 @@ TEMPLATES = {
         }
     )
 }
+
 def get_template(name: str) -> ArcTemplate:
     """Get a template by name, raises KeyError if not found"""
-    return TEMPLATES[name]
+    from .template_registry import registry
+    return registry.get(name)
 
 def list_templates() -> List[Dict]:
     """List all available templates with basic info"""
-    return [
-        {
-            "name": t.name,
-            "description": t.description,
-            "stages": len(t.stages)
-        }
-        for t in TEMPLATES.values()
-    ]
\ No newline at end of file
+    from .template_registry import registry
+    return registry.list()
@@ -0,0 +1,248 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .harmony import camelot_arrays, key_cost_matrix
+
+KEY_WEIGHT = 0.6
+TEMPO_STEP_WEIGHT = 0.8
+ENERGY_STEP_WEIGHT = 0.5
+
+# Tempo change a DJ can absorb with pitch control (log2 of 8%)
+PITCH_RANGE = float(np.log2(1.08))
+
+# Matrices are stored in single precision, 4 bytes per pair
+COST_DTYPE = np.float32
+# Track libraries whose matrices are kept in memory
+TRANSITION_CACHE_LIBRARIES = int(os.getenv("TRANSITION_CACHE_LIBRARIES", "32"))
+
+
+def pair_costs(
+    bpm_a: np.ndarray,
+    energy_a: np.ndarray,
+    numbers_a: np.ndarray,
+    minor_a: np.ndarray,
+    bpm_b: np.ndarray,
+    energy_b: np.ndarray,
+    numbers_b: np.ndarray,
+    minor_b: np.ndarray,
+) -> np.ndarray:
+    """Cost of mixing each track of set a (rows) into each track of set b (columns)"""
+    bpm_a, bpm_b = bpm_a.astype(COST_DTYPE), bpm_b.astype(COST_DTYPE)
+    energy_a, energy_b = energy_a.astype(COST_DTYPE), energy_b.astype(COST_DTYPE)
+    # Half/double time mixes are fine, so fold tempo ratios to the nearest octave
+    # (log per track, then a difference: exactly antisymmetric and no n^2 log)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.log2(bpm_a)[:, None] - np.log2(bpm_b)[None, :]
+        folded = np.abs(ratio - np.round(ratio))
+    cost = np.minimum(folded / COST_DTYPE(PITCH_RANGE), COST_DTYPE(2.0))
+    cost = np.nan_to_num(cost, nan=1.0, copy=False)
+    cost *= COST_DTYPE(TEMPO_STEP_WEIGHT)
+
+    harmonic = key_cost_matrix(numbers_a, minor_a, numbers_b, minor_b)
+    cost += COST_DTYPE(KEY_WEIGHT) * harmonic.astype(COST_DTYPE, copy=False)
+    cost += COST_DTYPE(ENERGY_STEP_WEIGHT) * np.abs(energy_a[:, None] - energy_b[None, :])
+    return cost
+
+
+def transition_costs(bpm: np.ndarray, energy: np.ndarray, keys: Sequence[Optional[str]]) -> np.ndarray:
+    """Symmetric pairwise cost of mixing track i into track j"""
+    bpm = np.asarray(bpm, dtype=float)
+    energy = np.asarray(energy, dtype=float)
+    numbers, minor = camelot_arrays(keys)
+    return pair_costs(bpm, energy, numbers, minor, bpm, energy, numbers, minor)
+
+
+class TransitionMatrix:
+    """Pairwise transition costs of a track pool, updated in place.
+
+    Adding k tracks to a pool of n only scores the k x (n + k) new pairs;
+    removing tracks just drops their rows and columns. Arrays are replaced
+    rather than mutated, so a snapshot taken by a reader stays consistent.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.features: Dict[str, Tuple] = {}
+        self.bpm = np.empty(0)
+        self.energy = np.empty(0)
+        self.numbers = np.empty(0, dtype=np.int16)
+        self.minor = np.empty(0, dtype=bool)
+        self.costs = np.empty((0, 0), dtype=COST_DTYPE)
+        self.version: Optional[str] = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids: Sequence[str], bpm: Sequence[float], energy: Sequence[float], keys: Sequence[Optional[str]]):
+        """Append tracks that are not in the pool yet"""
+        if not ids:
+            return
+        bpm = np.asarray(bpm, dtype=float)
+        energy = np.asarray(energy, dtype=float)
+        numbers, minor = camelot_arrays(keys)
+
+        inner = pair_costs(bpm, energy, numbers, minor, bpm, energy, numbers, minor)
+        # The cost is symmetric, so the new columns are the transposed new rows
+        cross = pair_costs(
+            self.bpm, self.energy, self.numbers, self.minor,
+            bpm, energy, numbers, minor,
+        )
+        self.costs = np.block([[self.costs, cross], [cross.T, inner]])
+
+        self.bpm = np.concatenate([self.bpm, bpm])
+        self.energy = np.concatenate([self.energy, energy])
+        self.numbers = np.concatenate([self.numbers, numbers])
+        self.minor = np.concatenate([self.minor, minor])
+        for track_id, b, e, k in zip(ids, bpm, energy, keys):
+            self.features[track_id] = (float(b), float(e), k)
+        self.ids = self.ids + list(ids)
+        self.index = {track_id: i for i, track_id in enumerate(self.ids)}
+
+    def remove(self, ids: Sequence[str]):
+        """Drop tracks from the pool; unknown ids are ignored"""
+        drop = {self.index[track_id] for track_id in ids if track_id in self.index}
+        if not drop:
+            return
+        keep = np.array([i not in drop for i in range(len(self.ids))], dtype=bool)
+        self.costs = self.costs[np.ix_(keep, keep)]
+        self.bpm = self.bpm[keep]
+        self.energy = self.energy[keep]
+        self.numbers = self.numbers[keep]
+        self.minor = self.minor[keep]
+        for i in drop:
+            del self.features[self.ids[i]]
+        self.ids = [track_id for i, track_id in enumerate(self.ids) if keep[i]]
+        self.index = {track_id: i for i, track_id in enumerate(self.ids)}
+
+    def sync(
+        self,
+        ids: Sequence[str],
+        bpm: Sequence[float],
+        energy: Sequence[float],
+        keys: Sequence[Optional[str]],
+    ) -> Tuple[int, int]:
+        """Make the pool match the given tracks; returns (added, removed).
+
+        Tracks whose BPM, energy or key changed are re-scored.
+        """
+        wanted = {
+            track_id: (float(b), float(e), k)
+            for track_id, b, e, k in zip(ids, bpm, energy, keys)
+        }
+        stale = [
+            track_id for track_id, features in self.features.items()
+            if wanted.get(track_id) != features
+        ]
+        self.remove(stale)
+        new = [track_id for track_id in wanted if track_id not in self.index]
+        self.add(
+            new,
+            [wanted[track_id][0] for track_id in new],
+            [wanted[track_id][1] for track_id in new],
+            [wanted[track_id][2] for track_id in new],
+        )
+        return len(new), len(stale)
+
+    def take(self, ids: Sequence[str]) -> np.ndarray:
+        """Cost matrix restricted to ``ids``, rows and columns in that order"""
+        idx = np.array([self.index[track_id] for track_id in ids], dtype=int)
+        if len(idx) == len(self.ids) and np.array_equal(idx, np.arange(len(idx))):
+            return self.costs
+        return self.costs[np.ix_(idx, idx)]
+
+
+class TransitionCache:
+    """Transition matrices per track library, least recently used evicted first.
+
+    A request naming a library sends its current tracks and, optionally, a
+    version string. A matching version is served as is; otherwise the matrix
+    is synced incrementally instead of being rebuilt.
+    """
+
+    def __init__(self, max_libraries: int = TRANSITION_CACHE_LIBRARIES):
+        self.max_libraries = max_libraries
+        self._matrices: "OrderedDict[str, TransitionMatrix]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "syncs": 0, "builds": 0, "evictions": 0,
+                         "tracks_added": 0, "tracks_removed": 0}
+
+    def costs(
+        self,
+        library_id: str,
+        version: Optional[str],
+        ids: Sequence[str],
+        bpm: Sequence[float],
+        energy: Sequence[float],
+        keys: Sequence[Optional[str]],
+    ) -> np.ndarray:
+        """Cost matrix for the library's tracks, in the order of ``ids``"""
+        with self._lock:
+            matrix = self._matrices.get(library_id)
+            if matrix is None:
+                matrix = self._matrices[library_id] = TransitionMatrix()
+                self.counters["builds"] += 1
+                while len(self._matrices) > self.max_libraries:
+                    self._matrices.popitem(last=False)
+                    self.counters["evictions"] += 1
+            self._matrices.move_to_end(library_id)
+
+            current = (
+                version is not None and version == matrix.version
+                and len(matrix) == len(ids) and all(i in matrix.index for i in ids)
+            )
+            if current:
+                self.counters["hits"] += 1
+            else:
+                added, removed = matrix.sync(ids, bpm, energy, keys)
+                matrix.version = version
+                self.counters["syncs"] += 1
+                self.counters["tracks_added"] += added
+                self.counters["tracks_removed"] += removed
+            return matrix.take(ids)
+
+    def drop(self, library_id: str) -> bool:
+        with self._lock:
+            return self._matrices.pop(library_id, None) is not None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tracks = sum(len(m) for m in self._matrices.values())
+            nbytes = sum(m.costs.nbytes for m in self._matrices.values())
+        return {
+            **self.counters,
+            "libraries": len(self._matrices),
+            "max_libraries": self.max_libraries,
+            "tracks": tracks,
+            "bytes": nbytes,
+        }
+
+
+def step_costs(costs: np.ndarray, order: Sequence[int]) -> np.ndarray:
+    """Cost of each consecutive transition in a play order"""
+    order = np.asarray(order, dtype=int)
+    if len(order) < 2:
+        return np.empty(0)
+    return costs[order[:-1], order[1:]]
+
+
+def suggest_next(
+    costs: np.ndarray,
+    current: int,
+    exclude: Sequence[int] = (),
+    limit: int = 5,
+) -> List[Tuple[int, float]]:
+    """Cheapest tracks to mix into ``current``, as (index, cost) pairs"""
+    row = costs[current].astype(float)
+    row[current] = np.inf
+    row[np.asarray(list(exclude), dtype=int)] = np.inf
+    limit = min(limit, int(np.isfinite(row).sum()))
+    if limit <= 0:
+        return []
+    best = np.argpartition(row, limit - 1)[:limit]
+    best = best[np.argsort(row[best], kind="stable")]
+    return [(int(i), float(row[i])) for i in best]
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable
+
+TM_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "/tmp/translation-memory.sqlite3")
+TM_MAX_ENTRIES = int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", "500000"))
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t.,;:!?\"'()[]-…"
+
+
+def normalize_line(text: str) -> str:
+    """Canonical form of a lyric line used as translation memory key"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+def _key(line: str, source_lang: str, target_lang: str, prompt_version: str) -> str:
+    raw = "\x1f".join([source_lang, target_lang, prompt_version, line])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class TranslationMemory:
+    """Persistent line-level translation memory with LRU eviction.
+
+    Entries are keyed by (normalized source line, source language, target
+    language, prompt version), so changing the prompt invalidates them.
+    """
+
+    def __init__(self, path: str = TM_PATH, max_entries: int = TM_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                translation TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_used ON translations(last_used)"
+        )
+        self._conn.commit()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_many(
+        self,
+        lines: Iterable[str],
+        source_lang: str,
+        target_lang: str,
+        prompt_version: str,
+    ) -> Dict[str, str]:
+        """Look up normalized lines; returns {line: translation} for hits only"""
+        keys = {_key(line, source_lang, target_lang, prompt_version): line for line in set(lines)}
+        if not keys:
+            return {}
+
+        found: Dict[str, str] = {}
+        with self._lock:
+            key_list = list(keys)
+            # Stay below SQLite's bound-parameter limit
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, translation FROM translations "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, translation in rows:
+                    found[keys[key]] = translation
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE translations SET last_used = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows],
+                    )
+            self._conn.commit()
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(
+        self,
+        translations: Dict[str, str],
+        source_lang: str,
+        target_lang: str,
+        prompt_version: str,
+    ):
+        """Store {normalized line: translation} pairs"""
+        if not translations:
+            return
+        now = time.time()
+        rows = [
+            (_key(line, source_lang, target_lang, prompt_version), text, now)
+            for line, text in translations.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?)", rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM translations WHERE key IN "
+            "(SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.counters["evictions"] += excess
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
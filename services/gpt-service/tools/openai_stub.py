@@ -0,0 +1,99 @@
+"""Offline stand-in for the OpenAI chat completions API.
+
+Run it next to gpt-service and point the service at it:
+
+    uvicorn tools.openai_stub:app --port 9000
+    OPENAI_BASE_URL=http://localhost:9000/v1 uvicorn app.main:app
+
+Translation prompts are answered by tagging each timed line with the target
+language; arc prompts get the tracks back in their original order.
+STUB_LATENCY_MS adds a fixed delay per completion and STUB_RATE_LIMIT_EVERY
+answers every Nth request with a 429 to exercise client backoff. Streaming
+requests get the same answer word by word, STUB_TOKEN_MS apart.
+"""
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import itertools
+import json
+import os
+import re
+import time
+
+STUB_LATENCY_MS = int(os.getenv("STUB_LATENCY_MS", "200"))
+STUB_RATE_LIMIT_EVERY = int(os.getenv("STUB_RATE_LIMIT_EVERY", "0"))
+STUB_TOKEN_MS = int(os.getenv("STUB_TOKEN_MS", "20"))
+
+app = FastAPI(title="OpenAI stub", version="0.1")
+counter = itertools.count(1)
+
+TIMED_LINE = re.compile(r"^\[(\d+(?:\.\d+)?) - (\d+(?:\.\d+)?)\] (.*)$")
+
+def answer(prompt: str) -> str:
+    """Produce a deterministic completion in the format the service parses"""
+    target = re.search(r"Target Language: (\S+)", prompt)
+    if target:
+        lines = []
+        for line in prompt.splitlines():
+            match = TIMED_LINE.match(line.strip())
+            if match:
+                start, end, text = match.groups()
+                lines.append(f"[{start} - {end}] [{target.group(1)}] {text}")
+        return "\n".join(lines)
+
+    tracks = re.findall(r"Track (\d+):", prompt)
+    return "\n".join([
+        "Stub arc in original order",
+        f"Order: {','.join(tracks)}",
+        *(f"Transition: track {a} into track {b}" for a, b in zip(tracks, tracks[1:])),
+    ])
+
+async def stream_answer(n: int, model: str, content: str):
+    """Emit a completion as chat.completion.chunk server-sent events"""
+    def chunk(delta: dict, finish_reason=None) -> str:
+        return "data: " + json.dumps({
+            "id": f"chatcmpl-stub-{n}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }) + "\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    for token in re.findall(r"\S+\s*|\s+", content):
+        await asyncio.sleep(STUB_TOKEN_MS / 1000)
+        yield chunk({"content": token})
+    yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    n = next(counter)
+    if STUB_RATE_LIMIT_EVERY and n % STUB_RATE_LIMIT_EVERY == 0:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": "1"},
+            content={"error": {"message": "Rate limited by stub", "type": "rate_limit_error"}},
+        )
+
+    await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+    content = answer(prompt)
+    if body.get("stream"):
+        return StreamingResponse(stream_answer(n, body.get("model", "stub"), content), media_type="text/event-stream")
+    return {
+        "id": f"chatcmpl-stub-{n}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(content.split()),
+            "total_tokens": len(prompt.split()) + len(content.split()),
+        },
+    }
@@ -0,0 +1,137 @@
+import asyncio
+import subprocess
+import tempfile
+import threading
+from typing import AsyncIterator, List, Optional
+
+import numpy as np
+import requests
+from whisper.audio import N_SAMPLES, SAMPLE_RATE
+
+DOWNLOAD_CHUNK = 256 * 1024
+
+
+class FetchError(Exception):
+    """Raised when the source audio cannot be downloaded"""
+
+
+class AudioStream:
+    """Decodes a remote file to 16 kHz mono PCM while it is still downloading.
+
+    A feeder thread copies the HTTP body into ffmpeg's stdin and callers read
+    30 second windows from its stdout, so at most one window plus the pipe
+    buffers is held in memory. Containers that need seeking (MP4 with the
+    moov atom at the end) cannot be decoded from a pipe and fail in ffmpeg.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.proc: Optional[subprocess.Popen] = None
+        self._feeder: Optional[threading.Thread] = None
+        self._error: Optional[Exception] = None
+
+    def open(self):
+        """Start the download and decoder (blocking)"""
+        response = requests.get(self.url, stream=True, timeout=120)
+        if response.status_code != 200:
+            response.close()
+            raise FetchError("Unable to fetch file_url")
+
+        self.proc = subprocess.Popen(
+            [
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+                "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le",
+                "-ar", str(SAMPLE_RATE), "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self._feeder = threading.Thread(target=self._feed, args=(response,), daemon=True)
+        self._feeder.start()
+
+    def _feed(self, response: requests.Response):
+        try:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                self.proc.stdin.write(chunk)
+        except BrokenPipeError:
+            pass  # ffmpeg exited; its return code carries the error
+        except requests.RequestException as e:
+            self._error = FetchError(f"Download interrupted: {e}")
+        finally:
+            response.close()
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read_window(self) -> Optional[np.ndarray]:
+        """Return the next 30 second window, or None at end of stream (blocking)"""
+        data = self.proc.stdout.read(N_SAMPLES * 2)
+        if data:
+            return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+        self._feeder.join()
+        stderr = self.proc.stderr.read().decode(errors="ignore")
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"Failed to decode audio: {stderr[-200:]}")
+        if self._error is not None:
+            raise self._error
+        return None
+
+    def close(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class WindowSpool:
+    """Decoded windows parked in a temporary file until they are needed.
+
+    Holds a likely repeat back from inference until its full fingerprint
+    has been looked up, without keeping its PCM in memory.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._offsets: List[int] = []
+        self._lengths: List[int] = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def append(self, window: np.ndarray):
+        """Store one window (blocking)"""
+        data = np.asarray(window, dtype=np.float32).tobytes()
+        self._file.seek(self._size)
+        self._file.write(data)
+        self._offsets.append(self._size)
+        self._lengths.append(len(window))
+        self._size += len(data)
+
+    def read(self, index: int) -> np.ndarray:
+        """Load window ``index`` back (blocking)"""
+        self._file.seek(self._offsets[index])
+        return np.frombuffer(self._file.read(self._lengths[index] * 4), np.float32)
+
+    def close(self):
+        self._file.close()
+
+
+async def stream_windows(url: str) -> AsyncIterator[np.ndarray]:
+    """Yield decoded 30 second windows of a remote file as they become available"""
+    loop = asyncio.get_running_loop()
+    stream = AudioStream(url)
+    # Reads mostly wait on the network, so they use the default executor
+    # rather than the bounded pool reserved for inference
+    await loop.run_in_executor(None, stream.open)
+    try:
+        while True:
+            window = await loop.run_in_executor(None, stream.read_window)
+            if window is None:
+                return
+            yield window
+    finally:
+        await loop.run_in_executor(None, stream.close)
@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import N_SAMPLES, SAMPLE_RATE
+from whisper.tokenizer import get_tokenizer
+
+# Seconds per timestamp token in Whisper's output vocabulary
+TIME_PRECISION = 0.02
+
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "8"))
+BATCH_MAX_WAIT_MS = int(os.getenv("BATCH_MAX_WAIT_MS", "250"))
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "64"))
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJob:
+    """A single track whose windows are decoded as part of shared batches"""
+
+    def __init__(self, language: Optional[str]):
+        self.language = language
+        self.segments: Dict[int, List[dict]] = {}
+        self.no_speech: Dict[int, float] = {}
+        self.expected: Optional[int] = None
+        self.detected_language: Optional[str] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._waiters: Dict[int, asyncio.Future] = {}
+
+    def finish(self, total_windows: int):
+        """Mark that no more windows will be submitted for this job"""
+        self.expected = total_windows
+        self._maybe_complete()
+
+    def cancel(self):
+        """Drop the job; windows still queued for it are skipped"""
+        if not self.future.done():
+            self.future.cancel()
+
+    def add_result(self, index: int, segments: List[dict], language: Optional[str], no_speech_prob: float):
+        self.segments[index] = segments
+        self.no_speech[index] = no_speech_prob
+        if self.detected_language is None:
+            self.detected_language = language
+        waiter = self._waiters.pop(index, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        self._maybe_complete()
+
+    async def window_done(self, index: int):
+        """Wait until window ``index`` has its result, or the job has ended"""
+        if index in self.segments or self.future.done():
+            return
+        waiter = self._waiters.setdefault(index, asyncio.get_running_loop().create_future())
+        await asyncio.wait([waiter, self.future], return_when=asyncio.FIRST_COMPLETED)
+
+    def fail(self, error: Exception):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+    def _maybe_complete(self):
+        if self.future.done() or self.expected is None:
+            return
+        if len(self.segments) < self.expected:
+            return
+
+        # Stitch window results back together in order
+        segments = [
+            seg
+            for index in range(self.expected)
+            for seg in self.segments[index]
+        ]
+        self.future.set_result({
+            "language": self.detected_language or self.language or "",
+            "segments": segments,
+            "text": "".join(seg["text"] for seg in segments),
+            "no_speech_probs": [self.no_speech[index] for index in range(self.expected)],
+        })
+
+    async def result(self) -> dict:
+        return await self.future
+
+
+class WhisperBatcher:
+    """Groups 30 second windows from many tracks into batched decode passes.
+
+    Windows are queued per language; a batch is dispatched as soon as it is
+    full or the oldest queued window has waited ``max_wait_ms``. Batched
+    decoding trades Whisper's sequential conditioning on previous text for
+    throughput, so each window is decoded independently.
+    """
+
+    def __init__(
+        self,
+        model,
+        batch_size: int = BATCH_SIZE,
+        max_wait_ms: int = BATCH_MAX_WAIT_MS,
+        queue_size: int = BATCH_QUEUE_SIZE,
+        executor=None,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue_size = queue_size
+        self.executor = executor
+        self.fp16 = torch.cuda.is_available()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {"batches": 0, "windows": 0}
+
+    def _ensure_worker(self):
+        # One queue for the batcher's lifetime: producers blocked on a full
+        # queue carry on with whichever worker runs next
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+            self._worker.add_done_callback(self._worker_done)
+
+    def _worker_done(self, worker: asyncio.Task):
+        if worker.cancelled() or worker.exception() is None:
+            return
+        logger.error("Batch worker crashed, restarting", exc_info=worker.exception())
+        if self._worker is worker:
+            self._worker = None
+            self._ensure_worker()
+
+    async def put(self, job: BatchJob, index: int, window: np.ndarray):
+        """Queue one window; waits while the batch queue is full"""
+        self._ensure_worker()
+        await self._queue.put((job, index, window))
+
+    def close(self):
+        """Stop the worker so the model can be released"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self):
+        pending: Dict[Optional[str], List[Tuple[BatchJob, int, np.ndarray]]] = {}
+        deadlines: Dict[Optional[str], float] = {}
+        dispatching: List[Tuple[BatchJob, int, np.ndarray]] = []
+        try:
+            await self._serve(pending, deadlines, dispatching)
+        except BaseException as e:
+            # Fail every window this worker accepted or that is still queued,
+            # rather than leave their jobs waiting forever
+            error = e if isinstance(e, Exception) else RuntimeError("Batcher closed")
+            for job, _, _ in dispatching + [item for group in pending.values() for item in group]:
+                job.fail(error)
+            while not self._queue.empty():
+                job, _, _ = self._queue.get_nowait()
+                job.fail(error)
+            raise
+
+    async def _serve(self, pending: Dict, deadlines: Dict, dispatching: List):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Wait for the next window, but never past the earliest deadline
+            timeout = None
+            if deadlines:
+                timeout = max(0.0, min(deadlines.values()) - loop.time())
+            try:
+                job, index, window = await asyncio.wait_for(self._queue.get(), timeout)
+                if not job.future.done():
+                    group = pending.setdefault(job.language, [])
+                    group.append((job, index, window))
+                    deadlines.setdefault(job.language, loop.time() + self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+
+            now = loop.time()
+            for language in list(pending):
+                group = pending[language]
+                if len(group) < self.batch_size and deadlines[language] > now:
+                    continue
+                batch, pending[language] = group[:self.batch_size], group[self.batch_size:]
+                if pending[language]:
+                    deadlines[language] = now + self.max_wait
+                else:
+                    del pending[language]
+                    del deadlines[language]
+                dispatching[:] = batch
+                await self._dispatch(language, batch)
+                dispatching.clear()
+
+    async def _dispatch(self, language: Optional[str], batch):
+        batch = [item for item in batch if not item[0].future.done()]
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+        indices = [index for _, index, _ in batch]
+        windows = [window for _, _, window in batch]
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self._decode_batch, language, indices, windows
+            )
+        except Exception as e:
+            for job, _, _ in batch:
+                job.fail(e)
+            return
+
+        self.stats["batches"] += 1
+        self.stats["windows"] += len(batch)
+        for (job, index, _), (segments, detected, no_speech_prob) in zip(batch, results):
+            if not job.future.done():
+                job.add_result(index, segments, detected, no_speech_prob)
+
+    def _decode_batch(self, language: Optional[str], indices: List[int], windows: List[np.ndarray]):
+        """Run one batched encoder/decoder pass (blocking, runs off-loop)"""
+        n_mels = self.model.dims.n_mels
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(torch.from_numpy(window)), n_mels=n_mels
+            )
+            for window in windows
+        ]).to(self.model.device)
+
+        options = whisper.DecodingOptions(
+            language=language,
+            task="transcribe",
+            fp16=self.fp16,
+            without_timestamps=False,
+        )
+        results = whisper.decode(self.model, mels, options)
+
+        output = []
+        for index, window, result in zip(indices, windows, results):
+            tokenizer = get_tokenizer(
+                self.model.is_multilingual,
+                num_languages=self.model.num_languages,
+                language=result.language,
+                task="transcribe",
+            )
+            duration = len(window) / SAMPLE_RATE
+            output.append((
+                self._segments(tokenizer, result.tokens, index, duration),
+                result.language,
+                result.no_speech_prob,
+            ))
+        return output
+
+    @staticmethod
+    def _segments(tokenizer, tokens: List[int], index: int, duration: float) -> List[dict]:
+        """Turn timestamped tokens of one window into absolute-time segments"""
+        offset = index * N_SAMPLES / SAMPLE_RATE
+        segments = []
+        start = None
+        text_tokens: List[int] = []
+
+        def emit(seg_start: float, seg_end: float):
+            text = tokenizer.decode(text_tokens)
+            if text.strip():
+                segments.append({
+                    "start": round(offset + seg_start, 2),
+                    "end": round(offset + min(seg_end, duration), 2),
+                    "text": text,
+                })
+
+        for token in tokens:
+            if token >= tokenizer.timestamp_begin:
+                t = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+                if start is None or not text_tokens:
+                    start = t
+                else:
+                    emit(start, t)
+                    start = None
+                    text_tokens = []
+            else:
+                text_tokens.append(token)
+
+        if text_tokens:
+            emit(start or 0.0, duration)
+        return segments
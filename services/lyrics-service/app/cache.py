@@ -0,0 +1,310 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+CACHE_PATH = os.getenv("TRANSCRIPTION_CACHE_PATH", "/tmp/lyrics-cache.sqlite3")
+CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Fingerprint parameters (16 kHz input)
+FP_FRAME = 4096
+FP_HOP = 2048
+FP_BANDS = 17          # 17 band edges -> 16 energy differences per frame
+FP_FMIN = 300.0
+FP_FMAX = 2000.0
+FP_SILENCE = 1e-3
+FP_CHUNK = 256         # frames per FFT chunk
+# Re-encoded copies match when their bit error rate stays below this
+FP_MAX_BER = float(os.getenv("FINGERPRINT_MAX_BER", "0.2"))
+FP_MAX_SHIFT = 2       # frames of misalignment tolerated when matching
+FP_DURATION_TOLERANCE = 2.0
+# Frames (about 20 s) whose exact match flags a likely repeat early on
+FP_PREFIX_FRAMES = 156
+
+
+class Fingerprint:
+    """Per-frame sub-fingerprint bits of a track plus its trimmed duration"""
+
+    def __init__(self, bits: np.ndarray, duration: float):
+        self.bits = bits
+        self.duration = duration
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha1(np.packbits(self.bits).tobytes()).hexdigest()
+
+    @property
+    def prefix_digest(self) -> Optional[str]:
+        """Digest of the leading FP_PREFIX_FRAMES frames, None for shorter tracks"""
+        return prefix_digest(self.bits)
+
+    def to_bytes(self) -> bytes:
+        return np.packbits(self.bits).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, n_frames: int, duration: float) -> "Fingerprint":
+        bits = np.unpackbits(np.frombuffer(data, np.uint8))[:n_frames * (FP_BANDS - 1)]
+        return cls(bits.reshape(n_frames, FP_BANDS - 1).astype(bool), duration)
+
+    def bit_error_rate(self, other: "Fingerprint") -> float:
+        """Lowest fraction of differing bits over small alignment shifts"""
+        best = 1.0
+        for shift in range(-FP_MAX_SHIFT, FP_MAX_SHIFT + 1):
+            a = self.bits[max(shift, 0):]
+            b = other.bits[max(-shift, 0):]
+            n = min(len(a), len(b))
+            if n:
+                best = min(best, float(np.mean(a[:n] != b[:n])))
+        return best
+
+
+def prefix_digest(bits: np.ndarray) -> Optional[str]:
+    if len(bits) < FP_PREFIX_FRAMES:
+        return None
+    return hashlib.sha1(np.packbits(bits[:FP_PREFIX_FRAMES]).tobytes()).hexdigest()
+
+
+def _bits(energy: np.ndarray) -> np.ndarray:
+    """One bit per band pair and frame: did the band energy difference rise"""
+    band_diff = energy[:, :-1] - energy[:, 1:]
+    bits = np.zeros_like(band_diff, dtype=bool)
+    bits[1:] = (band_diff[1:] - band_diff[:-1]) > 0
+    return bits
+
+
+def _band_matrix(sr: int) -> np.ndarray:
+    """Sum rFFT power bins into log-spaced bands with one matrix product"""
+    freqs = np.fft.rfftfreq(FP_FRAME, 1 / sr)
+    bins = np.digitize(freqs, np.geomspace(FP_FMIN, FP_FMAX, FP_BANDS + 1)) - 1
+    valid = np.flatnonzero((bins >= 0) & (bins < FP_BANDS))
+    matrix = np.zeros((len(freqs), FP_BANDS), dtype=np.float32)
+    matrix[valid, bins[valid]] = 1.0
+    return matrix
+
+
+class FingerprintBuilder:
+    """Builds an encoding-robust fingerprint incrementally from consecutive
+    chunks of decoded audio.
+
+    Haitsma-Kalker style: one bit per band pair and frame, set when the
+    band energy difference increases over time. Re-encodes flip a small
+    fraction of bits, so lookups compare bit error rates, not hashes. Only the band energies per frame and a sub-frame tail of samples are
+    kept, so memory does not grow with the length of the input audio.
+    """
+
+    def __init__(self, sr: int = 16000):
+        self.sr = sr
+        self._bands = _band_matrix(sr)
+        self._window = np.hanning(FP_FRAME).astype(np.float32)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._energy: List[np.ndarray] = []
+        self._started = False
+        self._consumed = 0
+        self._last_loud = -1
+
+    def update(self, audio: np.ndarray):
+        audio = np.asarray(audio, dtype=np.float32)
+        loud = np.flatnonzero(np.abs(audio) > FP_SILENCE)
+
+        # Skip leading silence so encoder padding doesn't shift frames
+        if not self._started:
+            if len(loud) == 0:
+                return
+            audio, loud = audio[loud[0]:], loud - loud[0]
+            self._started = True
+        if len(loud):
+            self._last_loud = self._consumed + loud[-1]
+        self._consumed += len(audio)
+
+        buf = np.concatenate([self._tail, audio])
+        if len(buf) < FP_FRAME:
+            self._tail = buf
+            return
+
+        # Frames are strided views, transformed in chunks to bound memory
+        n_frames = 1 + (len(buf) - FP_FRAME) // FP_HOP
+        frames = np.lib.stride_tricks.as_strided(
+            buf,
+            shape=(n_frames, FP_FRAME),
+            strides=(buf.strides[0] * FP_HOP, buf.strides[0]),
+            writeable=False,
+        )
+        for start in range(0, n_frames, FP_CHUNK):
+            chunk = frames[start:start + FP_CHUNK] * self._window
+            spectrum = np.abs(np.fft.rfft(chunk, axis=1)) ** 2
+            self._energy.append((spectrum @ self._bands).astype(np.float32))
+        self._tail = buf[n_frames * FP_HOP:].copy()
+
+    def finalize(self) -> Fingerprint:
+        if not self._started:
+            return Fingerprint(np.zeros((0, FP_BANDS - 1), dtype=bool), 0.0)
+
+        # Drop frames that lie entirely in trailing silence
+        length = self._last_loud + 1
+        if not self._energy:
+            self.update(np.zeros(FP_FRAME - len(self._tail), dtype=np.float32))
+        n_frames = 1 + max(0, length - FP_FRAME) // FP_HOP
+        energy = np.concatenate(self._energy)[:n_frames]
+        return Fingerprint(_bits(energy), length / self.sr)
+
+    def prefix_digest(self) -> Optional[str]:
+        """Fingerprint.prefix_digest of the audio so far, once it is long enough"""
+        if sum(len(e) for e in self._energy) < FP_PREFIX_FRAMES:
+            return None
+        return prefix_digest(_bits(np.concatenate(self._energy)[:FP_PREFIX_FRAMES]))
+
+
+class TranscriptionCache:
+    """Persistent SQLite cache of transcription results with LRU eviction.
+
+    Entries are keyed by (fingerprint, model size, language). Identical audio
+    hits on the fingerprint digest; re-encoded copies are found by comparing
+    fingerprints of similar duration by bit error rate.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transcriptions (
+                digest TEXT NOT NULL,
+                model_size TEXT NOT NULL,
+                language TEXT NOT NULL,
+                bits BLOB NOT NULL,
+                n_frames INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                prefix TEXT,
+                PRIMARY KEY (digest, model_size, language)
+            )
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(transcriptions)")]
+        if "prefix" not in columns:  # cache written before prefix lookups
+            self._conn.execute("ALTER TABLE transcriptions ADD COLUMN prefix TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_prefix ON transcriptions(model_size, language, prefix)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_duration ON transcriptions(model_size, language, duration)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON transcriptions(last_access)"
+        )
+        self._conn.commit()
+        self.counters = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0}
+
+    def _find(self, fp: Fingerprint, model_size: str, language: str):
+        row = self._conn.execute(
+            "SELECT rowid, payload FROM transcriptions "
+            "WHERE digest = ? AND model_size = ? AND language = ?",
+            (fp.digest, model_size, language),
+        ).fetchone()
+        if row is not None:
+            self.counters["hits"] += 1
+            return row
+
+        # No exact match: compare against copies of roughly the same length
+        candidates = self._conn.execute(
+            "SELECT rowid, payload, bits, n_frames, duration FROM transcriptions "
+            "WHERE model_size = ? AND language = ? AND duration BETWEEN ? AND ?",
+            (
+                model_size, language,
+                fp.duration - FP_DURATION_TOLERANCE,
+                fp.duration + FP_DURATION_TOLERANCE,
+            ),
+        ).fetchall()
+        best, best_ber = None, FP_MAX_BER
+        for rowid, payload, bits, n_frames, duration in candidates:
+            ber = fp.bit_error_rate(Fingerprint.from_bytes(bits, n_frames, duration))
+            if ber < best_ber:
+                best, best_ber = (rowid, payload), ber
+        if best is not None:
+            self.counters["near_hits"] += 1
+        return best
+
+    def has_prefix(self, prefix: str, model_size: str, language: str) -> bool:
+        """Whether a cached track starts exactly like this one; only a hint,
+        edits of a track share its intro"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM transcriptions WHERE model_size = ? AND language = ? AND prefix = ? LIMIT 1",
+                (model_size, language, prefix),
+            ).fetchone()
+        return row is not None
+
+    def get(self, fp: Fingerprint, model_size: str, language: str) -> Optional[Dict]:
+        if fp.duration == 0:
+            return None
+        with self._lock:
+            row = self._find(fp, model_size, language)
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE transcriptions SET last_access = ? WHERE rowid = ?",
+                (time.time(), row[0]),
+            )
+            self._conn.commit()
+            return json.loads(row[1])
+
+    def put(self, fp: Fingerprint, model_size: str, language: str, result: Dict):
+        if fp.duration == 0:
+            return
+        payload = json.dumps(result)
+        bits = fp.to_bytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    fp.digest, model_size, language, bits, len(fp.bits),
+                    fp.duration, payload, len(payload) + len(bits), time.time(),
+                    fp.prefix_digest,
+                ),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM transcriptions"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until we are back under budget
+        rows = self._conn.execute(
+            "SELECT rowid, size FROM transcriptions ORDER BY last_access"
+        ).fetchall()
+        doomed = []
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((rowid,))
+            total -= size
+        self._conn.executemany("DELETE FROM transcriptions WHERE rowid = ?", doomed)
+        self.counters["evictions"] += len(doomed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcriptions"
+            ).fetchone()
+        hits = self.counters["hits"] + self.counters["near_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
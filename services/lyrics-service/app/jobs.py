@@ -0,0 +1,133 @@
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+# Blocking work (downloads, ffmpeg decode, Whisper passes) runs on this pool
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Jobs allowed to download/decode/transcribe at the same time
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+# Queued + running jobs accepted before new submissions are rejected
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+# How long finished jobs stay pollable
+JOB_TTL_SEC = int(os.getenv("JOB_TTL_SEC", "3600"))
+
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="lyrics-job")
+
+
+class QueueFull(Exception):
+    """Raised when the service cannot accept more jobs"""
+
+
+class Job:
+    def __init__(self, track_id: str):
+        self.id = uuid.uuid4().hex
+        self.track_id = track_id
+        self.status = "queued"  # queued, downloading, transcribing, complete, error
+        self.result = None
+        self.error: Optional[str] = None
+        self.exception: Optional[Exception] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("complete", "error")
+
+    def update(self, status: str, result=None, exception: Optional[Exception] = None):
+        self.status = status
+        self.result = result
+        self.exception = exception
+        self.error = str(exception) if exception else None
+        self.updated_at = time.time()
+        # Wake everyone watching and arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "track_id": self.track_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobManager:
+    """Tracks transcription jobs and bounds how many run at once"""
+
+    def __init__(
+        self,
+        concurrency: int = JOB_CONCURRENCY,
+        queue_size: int = JOB_QUEUE_SIZE,
+        ttl_sec: int = JOB_TTL_SEC,
+    ):
+        self.queue_size = queue_size
+        self.ttl_sec = ttl_sec
+        self.jobs: Dict[str, Job] = {}
+        self._active = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._concurrency = concurrency
+        self._tasks = set()
+
+    def submit(self, track_id: str, runner: Callable[[Job], Awaitable]) -> Job:
+        """Register a job and schedule ``runner(job)``; raises QueueFull"""
+        self._prune()
+        if self._active >= self.queue_size:
+            raise QueueFull(f"{self._active} jobs in flight")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._concurrency)
+
+        job = Job(track_id)
+        self.jobs[job.id] = job
+        self._active += 1
+        task = asyncio.create_task(self._run(job, runner))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, runner: Callable[[Job], Awaitable]):
+        try:
+            async with self._slots:
+                result = await runner(job)
+            job.update("complete", result=result)
+        except Exception as e:
+            job.update("error", exception=e)
+        finally:
+            self._active -= 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: Job) -> Job:
+        """Wait until the job has finished"""
+        while not job.finished:
+            await job._changed.wait()
+        return job
+
+    async def watch(self, job: Job, heartbeat_sec: float = 15.0) -> AsyncIterator[Dict]:
+        """Yield the job status on every change until it finishes"""
+        yield job.to_dict()
+        while not job.finished:
+            try:
+                await asyncio.wait_for(job._changed.wait(), heartbeat_sec)
+            except asyncio.TimeoutError:
+                pass
+            yield job.to_dict()
+
+    def stats(self) -> Dict:
+        return {"active": self._active, "capacity": self.queue_size, "tracked": len(self.jobs)}
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl_sec
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -1,17 +1,33 @@
 from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, AnyHttpUrl
-import whisper, torch
-import requests, io, os
-from typing import List
+import torch
+import os, asyncio, json
+from contextlib import AsyncExitStack, closing
+from typing import List, Literal, Optional
 import numpy as np
 
+from .audio import FetchError, WindowSpool, stream_windows
+from .batcher import BatchJob, WhisperBatcher
+from .cache import FingerprintBuilder, TranscriptionCache
+from .jobs import Job, JobManager, QueueFull, executor
+from .models import DETECT_MODEL, ModelRegistry, select_model
+
 AUTH_TOKEN = os.getenv("AUTH_TOKEN", "")
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 app = FastAPI(title="Symphonia Lyrics Service", version="0.1")
 
-# Load Whisper model at startup (cached)
-model = whisper.load_model("medium", device=DEVICE)
+# Windows with a no-speech probability above this are skipped as instrumental
+NO_SPEECH_THRESHOLD = float(os.getenv("NO_SPEECH_THRESHOLD", "0.6"))
+# Windows a single request may have queued or in inference at once
+MAX_INFLIGHT_WINDOWS = int(os.getenv("MAX_INFLIGHT_WINDOWS", "4"))
+
+# Whisper models are loaded on first use and evicted under a memory budget;
+# each one batches windows from concurrent requests
+models = ModelRegistry(DEVICE, executor=executor)
+jobs = JobManager()
+cache = TranscriptionCache()
 
 class TimedText(BaseModel):
     start: float
@@ -22,55 +38,209 @@ class TranscribeRequest(BaseModel):
     file_url: AnyHttpUrl
     track_id: str
     language: str = "en"  # source language hint
+    model_size: Optional[Literal["tiny", "base", "small", "medium"]] = None
+    quality: Optional[Literal["fast", "balanced", "best"]] = None  # used when model_size is unset
+    detect_lyrics: bool = True  # screen windows with the small model first
 
 class TranscribeResponse(BaseModel):
     track_id: str
     language: str
     segments: List[TimedText]
     full_text: str
+    model_size: str
+    cached: bool = False
 
-@app.get("/health")
-def health():
-    return {"status": "ok", "device": DEVICE}
+class JobStatus(BaseModel):
+    job_id: str
+    track_id: str
+    status: str
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
 
-@app.post("/transcribe", response_model=TranscribeResponse)
-async def transcribe(req: TranscribeRequest, authorization: str | None = Header(default=None)):
+def check_auth(authorization: str | None):
     if AUTH_TOKEN and authorization != f"Bearer {AUTH_TOKEN}":
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    try:
-        # Download audio
-        r = requests.get(str(req.file_url), timeout=120)
-        if r.status_code != 200:
-            raise HTTPException(status_code=400, detail="Unable to fetch file_url")
-
-        # Load audio
-        audio_data = io.BytesIO(r.content)
-        
-        # Transcribe with Whisper
-        result = model.transcribe(
-            audio_data,
-            language=req.language,
-            task="transcribe",
-            fp16=torch.cuda.is_available()
-        )
+async def no_speech_prob(detector: WhisperBatcher, window: np.ndarray, language: str) -> float:
+    """Run one window through the detection model"""
+    probe = BatchJob(language)
+    await detector.put(probe, 0, window)
+    probe.finish(1)
+    return (await probe.result())["no_speech_probs"][0]
+
+async def run_transcription(job: Job, req: TranscribeRequest) -> TranscribeResponse:
+    """Stream, decode and transcribe one track without blocking the event loop.
 
-        # Format response
-        segments = [
-            TimedText(
-                start=seg["start"],
-                end=seg["end"],
-                text=seg["text"].strip()
+    Windows are handed to Whisper as soon as ffmpeg has decoded them, so
+    inference overlaps the download and only a few windows are in flight.
+    Tracks that start exactly like a cached one are spooled to disk
+    instead, as they are likely repeats: the full fingerprint then decides
+    between the cached result and transcribing the spooled windows.
+    """
+    loop = asyncio.get_running_loop()
+    size = select_model(req.model_size, req.quality)
+    detect = req.detect_lyrics and size != DETECT_MODEL
+    # Screened and unscreened transcriptions differ, so cache them separately
+    cache_model = f"{size}+{DETECT_MODEL}" if detect else size
+
+    async with AsyncExitStack() as stack:
+        batcher = await stack.enter_async_context(models.use(size))
+        detector = await stack.enter_async_context(models.use(DETECT_MODEL)) if detect else None
+
+        track = BatchJob(req.language)
+        fp = FingerprintBuilder()
+        slots = asyncio.Semaphore(MAX_INFLIGHT_WINDOWS)
+        tasks = []
+        spool: Optional[WindowSpool] = None
+
+        async def feed(index: int, window: np.ndarray):
+            # Only windows the small model hears vocals in reach the big one
+            try:
+                if detector and await no_speech_prob(detector, window, req.language) > NO_SPEECH_THRESHOLD:
+                    track.add_result(index, [], None, 1.0)
+                else:
+                    await batcher.put(track, index, window)
+                    await track.window_done(index)
+            except Exception as e:
+                track.fail(e)
+            finally:
+                slots.release()
+
+        async def dispatch(index: int, window: np.ndarray):
+            await slots.acquire()
+            tasks.append(asyncio.create_task(feed(index, window)))
+
+        job.update("downloading")
+        try:
+            count = 0
+            async for window in stream_windows(str(req.file_url)):
+                if count == 0:
+                    job.update("transcribing")
+                # Fingerprinting stays off the inference pool
+                await loop.run_in_executor(None, fp.update, window)
+                if count == 0:
+                    prefix = fp.prefix_digest()
+                    if prefix and await loop.run_in_executor(
+                        None, cache.has_prefix, prefix, cache_model, req.language
+                    ):
+                        spool = stack.enter_context(closing(WindowSpool()))
+                if spool is not None:
+                    await loop.run_in_executor(None, spool.append, window)
+                else:
+                    await dispatch(count, window)
+                count += 1
+
+            # Identical or re-encoded copies of a known track skip the rest
+            # of inference; windows still in flight are dropped
+            fingerprint = fp.finalize()
+            cached = await loop.run_in_executor(
+                executor, cache.get, fingerprint, cache_model, req.language
             )
-            for seg in result["segments"]
-        ]
-
-        return TranscribeResponse(
-            track_id=req.track_id,
-            language=result["language"],
-            segments=segments,
-            full_text=result["text"]
+            if cached is not None:
+                return format_response(req, cached, size, cached=True)
+
+            if spool is not None:
+                for index in range(len(spool)):
+                    await dispatch(index, await loop.run_in_executor(None, spool.read, index))
+            await asyncio.gather(*tasks)
+            track.finish(count)
+            result = await track.result()
+        finally:
+            track.cancel()
+            for task in tasks:
+                task.cancel()
+
+    result = {key: result[key] for key in ("language", "segments", "text")}
+    await loop.run_in_executor(executor, cache.put, fingerprint, cache_model, req.language, result)
+    return format_response(req, result, size)
+
+def format_response(req: TranscribeRequest, result: dict, size: str, cached: bool = False) -> TranscribeResponse:
+    segments = [
+        TimedText(
+            start=seg["start"],
+            end=seg["end"],
+            text=seg["text"].strip()
         )
+        for seg in result["segments"]
+    ]
+
+    return TranscribeResponse(
+        track_id=req.track_id,
+        language=result["language"],
+        segments=segments,
+        full_text=result["text"],
+        model_size=size,
+        cached=cached
+    )
+
+def submit_job(req: TranscribeRequest) -> Job:
+    try:
+        return jobs.submit(req.track_id, lambda job: run_transcription(job, req))
+    except QueueFull:
+        raise HTTPException(
+            status_code=429,
+            detail="Transcription queue is full, retry later",
+            headers={"Retry-After": "30"},
+        )
+
+def get_job(job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "device": DEVICE, "models": models.stats(), "jobs": jobs.stats()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+@app.post("/transcribe", response_model=TranscribeResponse)
+async def transcribe(req: TranscribeRequest, authorization: str | None = Header(default=None)):
+    """Transcribe a track and wait for the result"""
+    check_auth(authorization)
+
+    job = await jobs.wait(submit_job(req))
+    if job.status == "error":
+        status_code = 400 if isinstance(job.exception, FetchError) else 500
+        raise HTTPException(status_code=status_code, detail=job.error)
+    return job.result
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def create_job(req: TranscribeRequest, authorization: str | None = Header(default=None)):
+    """Queue a transcription job and return immediately"""
+    check_auth(authorization)
+    return submit_job(req).to_dict()
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str, authorization: str | None = Header(default=None)):
+    """Poll the status of a transcription job"""
+    check_auth(authorization)
+    return get_job(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, authorization: str | None = Header(default=None)):
+    """Stream job status changes as server-sent events"""
+    check_auth(authorization)
+    job = get_job(job_id)
+
+    async def events():
+        async for status in jobs.watch(job):
+            yield f"data: {json.dumps(status)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+@app.get("/jobs/{job_id}/result", response_model=TranscribeResponse)
+async def job_result(job_id: str, authorization: str | None = Header(default=None)):
+    """Fetch the result of a finished transcription job"""
+    check_auth(authorization)
+    job = get_job(job_id)
+    if job.status == "error":
+        status_code = 400 if isinstance(job.exception, FetchError) else 500
+        raise HTTPException(status_code=status_code, detail=job.error)
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
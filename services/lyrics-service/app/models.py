@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import torch
+import whisper
+
+from .batcher import WhisperBatcher
+
+logger = logging.getLogger(__name__)
+
+# Approximate resident size of each checkpoint in fp32, in MB
+MODEL_SIZES = {
+    "tiny": 150,
+    "base": 290,
+    "small": 970,
+    "medium": 3060,
+}
+
+# Quality/latency policy -> model size
+QUALITY_POLICY = {
+    "fast": "base",
+    "balanced": "small",
+    "best": "medium",
+}
+
+DEFAULT_MODEL = os.getenv("WHISPER_MODEL", "medium")
+# Model used to find windows that actually contain vocals
+DETECT_MODEL = os.getenv("WHISPER_DETECT_MODEL", "tiny")
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "4096"))
+# int8 dynamic quantization roughly quarters Linear weights on CPU
+QUANTIZE_CPU = os.getenv("WHISPER_QUANTIZE_CPU", "1") == "1"
+INT8_SIZE_FACTOR = 0.35
+
+
+def select_model(model_size: Optional[str] = None, quality: Optional[str] = None) -> str:
+    """Pick a model size: explicit size wins, then the quality policy, then the default"""
+    if model_size:
+        return model_size
+    if quality:
+        return QUALITY_POLICY[quality]
+    return DEFAULT_MODEL
+
+
+def quantize_int8(model):
+    """Dynamically quantize Whisper's Linear layers to int8 for CPU inference"""
+    # Whisper subclasses nn.Linear to cast weights on the fly; the quantizer
+    # only swaps exact nn.Linear modules, so unwrap them first
+    for module in model.modules():
+        if isinstance(module, whisper.model.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class ModelEntry:
+    def __init__(self, size: str, batcher: WhisperBatcher, memory_mb: float):
+        self.size = size
+        self.batcher = batcher
+        self.memory_mb = memory_mb
+        self.in_use = 0
+
+
+class ModelRegistry:
+    """Lazily loads Whisper models and evicts the least recently used ones
+    once the loaded set exceeds the memory budget."""
+
+    def __init__(
+        self,
+        device: str,
+        executor=None,
+        memory_budget_mb: int = MODEL_MEMORY_BUDGET_MB,
+        quantize_cpu: bool = QUANTIZE_CPU,
+    ):
+        self.device = device
+        self.executor = executor
+        self.memory_budget_mb = memory_budget_mb
+        self.quantize = quantize_cpu and device == "cpu"
+        self._models: "OrderedDict[str, ModelEntry]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _estimate_mb(self, size: str) -> float:
+        mb = MODEL_SIZES[size]
+        return mb * INT8_SIZE_FACTOR if self.quantize else mb
+
+    def _load(self, size: str):
+        """Load (and optionally quantize) a checkpoint; blocking"""
+        logger.info(f"Loading Whisper {size} on {self.device} (int8={self.quantize})")
+        model = whisper.load_model(size, device=self.device)
+        if self.quantize:
+            model = quantize_int8(model)
+        return model.eval()
+
+    def _evict(self, needed_mb: float):
+        used = sum(entry.memory_mb for entry in self._models.values())
+        for size in list(self._models):
+            if used + needed_mb <= self.memory_budget_mb:
+                return
+            entry = self._models[size]
+            if entry.in_use:
+                continue
+            logger.info(f"Evicting Whisper {size} to stay within memory budget")
+            del self._models[size]
+            entry.batcher.close()
+            used -= entry.memory_mb
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+        if used + needed_mb > self.memory_budget_mb:
+            logger.warning("All loaded models are busy, exceeding memory budget")
+
+    async def _get(self, size: str) -> ModelEntry:
+        if size in self._models:
+            self._models.move_to_end(size)
+            return self._models[size]
+
+        lock = self._locks.setdefault(size, asyncio.Lock())
+        async with lock:
+            if size not in self._models:
+                needed = self._estimate_mb(size)
+                self._evict(needed)
+                loop = asyncio.get_running_loop()
+                model = await loop.run_in_executor(self.executor, self._load, size)
+                batcher = WhisperBatcher(model, executor=self.executor)
+                self._models[size] = ModelEntry(size, batcher, needed)
+            self._models.move_to_end(size)
+            return self._models[size]
+
+    @asynccontextmanager
+    async def use(self, size: str) -> AsyncIterator[WhisperBatcher]:
+        """Borrow the batcher for a model size; in-use models are never evicted"""
+        entry = await self._get(size)
+        entry.in_use += 1
+        try:
+            yield entry.batcher
+        finally:
+            entry.in_use -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "quantized": self.quantize,
+            "budget_mb": self.memory_budget_mb,
+            "loaded": {
+                size: {
+                    "memory_mb": entry.memory_mb,
+                    "in_use": entry.in_use,
+                    "batching": entry.batcher.stats,
+                }
+                for size, entry in self._models.items()
+            },
+        }
@@ -0,0 +1,57 @@
+"""WhisperBatcher worker failures don't strand queued windows"""
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.batcher import BatchJob, WhisperBatcher  # noqa: E402
+
+
+class CrashOnce(WhisperBatcher):
+    """Worker loop that dies on its first batch, then decodes instantly"""
+
+    crashed = False
+
+    async def _dispatch(self, language, batch):
+        if not self.crashed:
+            self.crashed = True
+            raise RuntimeError("worker bug")
+        for job, index, _ in batch:
+            job.add_result(index, [], language, 0.0)
+
+
+def test_crash_fails_queued_jobs_and_restarts():
+    async def main():
+        batcher = CrashOnce(model=None, batch_size=1, max_wait_ms=0, queue_size=1)
+        window = np.zeros(16000, dtype=np.float32)
+        doomed = [BatchJob("en") for _ in range(3)]
+        # The third put blocks on the full queue while the worker crashes
+        await asyncio.wait_for(
+            asyncio.gather(*(batcher.put(job, 0, window) for job in doomed)), timeout=1
+        )
+        for job in doomed:
+            job.finish(1)
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(job.result(), timeout=1) for job in doomed), return_exceptions=True
+        )
+        # The window being decoded and those still queued all fail; none hang
+        assert not [o for o in outcomes if isinstance(o, asyncio.TimeoutError)]
+        assert str(outcomes[0]) == "worker bug"
+        failed = [o for o in outcomes if isinstance(o, RuntimeError)]
+        assert all(str(o) == "worker bug" for o in failed)
+
+        # The restarted worker serves new windows on the same queue
+        job = BatchJob("en")
+        await batcher.put(job, 0, window)
+        job.finish(1)
+        assert (await asyncio.wait_for(job.result(), timeout=1))["no_speech_probs"] == [0.0]
+        batcher.close()
+
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Streaming transcription: inference overlaps the download, and repeats of
+a cached track are answered without it"""
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import main  # noqa: E402
+from app.cache import TranscriptionCache  # noqa: E402
+
+N_WINDOWS = 6
+WINDOW_SAMPLES = 16000 * 30
+
+
+def make_windows(seed: int, count: int = N_WINDOWS):
+    rng = np.random.default_rng(seed)
+    return [rng.uniform(-0.5, 0.5, WINDOW_SAMPLES).astype(np.float32) for _ in range(count)]
+
+
+class FakeBatcher:
+    """Answers each window as soon as it is queued, logging the dispatch"""
+
+    def __init__(self, log):
+        self.log = log
+
+    async def put(self, track, index, window):
+        self.log.append(("dispatch", index))
+        segment = {"start": index * 30.0, "end": index * 30.0 + 1.0, "text": f" line {index}"}
+        track.add_result(index, [segment], "en", 0.0)
+
+
+class FakeJob:
+    def update(self, status):
+        pass
+
+
+@pytest.fixture
+def transcribe(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "cache", TranscriptionCache(str(tmp_path / "cache.sqlite3")))
+
+    def run(windows):
+        log = []
+
+        async def stream_windows(url):
+            for index, window in enumerate(windows):
+                await asyncio.sleep(0.01)  # the network
+                log.append(("window", index))
+                yield window
+
+        @asynccontextmanager
+        async def use(size):
+            yield FakeBatcher(log)
+
+        monkeypatch.setattr(main, "stream_windows", stream_windows)
+        monkeypatch.setattr(main.models, "use", use)
+        req = main.TranscribeRequest(
+            file_url="http://audio.test/track.mp3", track_id="t1", model_size="base", detect_lyrics=False
+        )
+        return asyncio.run(main.run_transcription(FakeJob(), req)), log
+
+    return run
+
+
+def test_first_batch_before_last_window(transcribe):
+    result, log = transcribe(make_windows(0))
+    assert log.index(("dispatch", 0)) < log.index(("window", N_WINDOWS - 1))
+    assert not result.cached
+    assert [s.text for s in result.segments] == [f"line {i}" for i in range(N_WINDOWS)]
+
+
+def test_repeat_skips_inference(transcribe):
+    windows = make_windows(0)
+    first, _ = transcribe(windows)
+    repeat, log = transcribe(windows)
+    assert repeat.cached
+    assert repeat.full_text == first.full_text
+    assert not [entry for entry in log if entry[0] == "dispatch"]
+
+
+def test_shared_intro_is_still_transcribed(transcribe):
+    windows = make_windows(0)
+    transcribe(windows)
+    # Starts like the cached track, so it is spooled, but differs after that
+    edit = windows[:1] + make_windows(1, N_WINDOWS - 1)
+    result, log = transcribe(edit)
+    assert not result.cached
+    assert sorted(index for kind, index in log if kind == "dispatch") == list(range(N_WINDOWS))